@@ -0,0 +1,188 @@
+import os, sys, json, time, asyncio, logging, argparse
+from typing import Any, Dict, Iterator, Optional, Set
+from azure.ai.projects.aio import AIProjectClient
+from dotenv import load_dotenv
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.agent_registry import AgentRegistry
+from common.bootstrap import close_async_transport, create_async_client
+from common.rate_limiter import RunScheduler
+from common.run_timeline import RunAnalyzer, RunLog
+
+# Runs every prompt of a JSONL file against the agent, many at a time, using the async client.
+# Each input line is a JSON object with a "prompt" (or "body") and an optional "id" (or "request_id").
+# Each finished run is appended to the output JSONL right away, so the output can be followed while the batch runs.
+# With --run-log the steps of every run are listed afterwards, and its queue, model and tool time and its tokens are
+# added to the result and to the run log (logs/runs, see tracing/run_report.py).
+#
+# Example: python batch/batch_runner.py requests.jsonl results.jsonl --concurrency 64
+
+
+def read_prompts(input_path: str, done_ids: Set[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Read the prompts from a JSONL file, skipping the ones already in the output.
+
+    :param input_path (str): The JSONL file with the prompts.
+    :param done_ids (Set[str]): IDs that don't need to run again.
+    :return: An iterator over the prompts, as dicts with an "id" and a "prompt".
+    :rtype: Iterator[Dict[str, Any]]
+    """
+    with open(input_path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            prompt_id = str(item.get("id", item.get("request_id", line_number)))
+            if prompt_id in done_ids:
+                continue
+            yield {"id": prompt_id, "prompt": item.get("prompt", item.get("body", ""))}
+
+
+def read_done_ids(output_path: str) -> Set[str]:
+    """
+    Collect the IDs of the prompts that already have a completed result in the output file.
+
+    :param output_path (str): The output JSONL file.
+    :return: The IDs of the completed prompts.
+    :rtype: Set[str]
+    """
+    done_ids = set()
+    if os.path.exists(output_path):
+        with open(output_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if result.get("status") == "completed":
+                    done_ids.add(result["id"])
+    return done_ids
+
+
+async def run_prompt(
+    project_client: AIProjectClient,
+    scheduler: RunScheduler,
+    agent: Any,
+    item: Dict[str, Any],
+    poll_interval: float,
+    analyzer: Optional[RunAnalyzer] = None,
+) -> Dict[str, Any]:
+    """
+    Run a single prompt on its own thread. Rate limited runs are submitted again by the scheduler.
+
+    :param project_client (AIProjectClient): The async project client.
+    :param scheduler (RunScheduler): The scheduler the run goes through.
+    :param agent (Agent): The agent to run.
+    :param item (Dict[str, Any]): The prompt, with its "id".
+    :param poll_interval (float): Seconds between two run status polls.
+    :param analyzer (Optional[RunAnalyzer]): Records the timeline and tokens of the run, None to skip it.
+    :return: The result line for the output file.
+    :rtype: Dict[str, Any]
+    """
+    start = time.perf_counter()
+    result = {"id": item["id"], "prompt": item["prompt"]}
+    try:
+        thread = await project_client.agents.create_thread()
+        await project_client.agents.create_message(thread_id=thread.id, role="user", content=item["prompt"])
+        run = await scheduler.submit(
+            agent.model,
+            lambda: project_client.agents.create_and_process_run(
+                thread_id=thread.id, assistant_id=agent.id, sleep_interval=poll_interval
+            ),
+        )
+        result.update(thread_id=thread.id, run_id=run.id, status=run.status)
+        if run.status == "failed":
+            result["error"] = str(run.last_error)
+        else:
+            messages = await project_client.agents.list_messages(thread_id=thread.id, limit=1)
+            last_msg = messages.get_last_text_message_by_sender("assistant")
+            result["response"] = last_msg.text.value if last_msg else None
+        if analyzer is not None:
+            timeline = await analyzer.analyze_async(run, prompt=item["prompt"])
+            if timeline is not None:
+                result.update(
+                    queue_seconds=timeline.queue_seconds,
+                    model_seconds=timeline.model_seconds,
+                    tool_seconds=timeline.tool_seconds,
+                    prompt_tokens=timeline.prompt_tokens,
+                    completion_tokens=timeline.completion_tokens,
+                )
+    except Exception as e:
+        result.update(status="error", error=str(e))
+    result["latency_seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+async def run_batch(args: argparse.Namespace) -> None:
+    done_ids = read_done_ids(args.output) if args.resume else set()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=args.concurrency * 2)
+    counts = {"completed": 0, "failed": 0}
+    scheduler = RunScheduler(
+        default_requests_per_minute=args.rpm, default_tokens_per_minute=args.tpm, max_concurrency=args.concurrency
+    )
+    start = time.perf_counter()
+
+    try:
+        # A single project, or the pool of projects and deployments in AGENT_ENDPOINTS
+        project_client = create_async_client(routed=True)
+        async with project_client:
+            agent = await AgentRegistry(project_client).get_or_create_async(
+                model=args.model, name="batch-agent", instructions=args.instructions
+            )
+            logging.info(f"Using agent, ID: {agent.id}")
+            analyzer = RunAnalyzer(project_client, RunLog()) if args.run_log else None
+
+            with open(args.output, "a" if args.resume else "w", encoding="utf-8") as output:
+
+                async def worker():
+                    while True:
+                        item = await queue.get()
+                        if item is None:
+                            return
+                        result = await run_prompt(project_client, scheduler, agent, item, args.poll_interval, analyzer)
+                        output.write(json.dumps(result) + "\n")
+                        output.flush()
+                        counts["completed" if result["status"] == "completed" else "failed"] += 1
+
+                workers = [asyncio.create_task(worker()) for _ in range(args.concurrency)]
+                # The bounded queue keeps memory flat no matter how large the input file is
+                for item in read_prompts(args.input, done_ids):
+                    await queue.put(item)
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers)
+            if analyzer is not None:
+                analyzer.close()
+    finally:
+        await close_async_transport()
+
+    elapsed = time.perf_counter() - start
+    total = counts["completed"] + counts["failed"]
+    print(f"Ran {total} prompts in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.1f}/s), {counts['failed']} failed")
+    print(f"Scheduler: {scheduler.limiter(args.model).stats}")
+    if hasattr(project_client, "router"):
+        print(f"Endpoints: {project_client.router.stats()}")
+    if analyzer is not None:
+        analyzer.summary.print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the prompts of a JSONL file against the agent.")
+    parser.add_argument("input", help="JSONL file with one prompt per line")
+    parser.add_argument("output", help="JSONL file the results are written to")
+    parser.add_argument("--concurrency", type=int, default=32, help="number of runs in flight at the same time")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--instructions", default="You are a helpful agent")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds between two run status polls")
+    parser.add_argument("--rpm", type=float, help="requests per minute quota (default: RATE_LIMIT_RPM, or no limit)")
+    parser.add_argument("--tpm", type=float, help="tokens per minute quota (default: RATE_LIMIT_TPM, or no limit)")
+    parser.add_argument("--run-log", action="store_true", help="record the timeline and tokens of every run in logs/runs")
+    parser.add_argument("--resume", action="store_true", help="skip prompts that already completed in the output")
+    args = parser.parse_args()
+    asyncio.run(run_batch(args))
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,59 @@
+import os, sys, json, time, argparse, statistics, subprocess
+
+# Runs a sample script against a recorded cassette (see common/cassette_transport.py), without network,
+# and reports the wall time per run. With --profile, the last run is profiled with cProfile.
+#
+# Record once:  AGENTS_CASSETTE=cassettes/quickie.json AGENTS_CASSETTE_MODE=record python quickie.py
+# Benchmark:    python benchmarks/bench_replay.py quickie.py cassettes/quickie.json --runs 10
+#
+# Record and replay with the same .cache state: a run that reuses a cached agent or vector store makes fewer requests.
+# The replay uses the connection string saved in the cassette; cassettes recorded before it was saved need the
+# PROJECT_CONNECTION_STRING of the recording.
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(ROOT)
+from common.cassette_transport import cassette_connection_string
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark a sample script against a recorded cassette.")
+    parser.add_argument("script", help="script to run, relative to the repo root")
+    parser.add_argument("cassette", help="cassette recorded for the script")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--realtime", action="store_true", help="replay with the recorded latencies")
+    parser.add_argument("--profile", help="write a cProfile of the last run to this file")
+    args = parser.parse_args()
+
+    env = dict(
+        os.environ,
+        AGENTS_CASSETTE=os.path.abspath(args.cassette),
+        AGENTS_CASSETTE_MODE="replay-realtime" if args.realtime else "replay",
+    )
+    # The requests of the cassette carry the project of the recording in their path
+    connection_string = cassette_connection_string(args.cassette)
+    if connection_string:
+        env["PROJECT_CONNECTION_STRING"] = connection_string
+    timings = []
+    for run in range(args.runs):
+        command = [sys.executable]
+        if args.profile and run == args.runs - 1:
+            command += ["-m", "cProfile", "-o", os.path.abspath(args.profile)]
+        command.append(args.script)
+        start = time.perf_counter()
+        result = subprocess.run(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        timings.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            print(result.stderr, file=sys.stderr)
+            sys.exit(result.returncode)
+
+    print(json.dumps({
+        "script": args.script,
+        "runs": args.runs,
+        "mean_seconds": round(statistics.mean(timings), 3),
+        "min_seconds": round(min(timings), 3),
+        "max_seconds": round(max(timings), 3),
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import os, sys, json, time, random, argparse, subprocess
+from typing import Optional
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Compares generation time and peak RSS of the original get_sales_data loop with the NumPy generator.
+# Every mode runs in its own process, so the peak RSS of one mode doesn't hide the other.
+# The peak RSS comes from the resource module, which Windows doesn't have: there psutil is used if installed, otherwise
+# it is reported as null.
+#
+# Example: python benchmarks/bench_sales_data.py --rows 1000000
+
+
+def legacy_sales_data(n_rows: int) -> str:
+    # The original implementation from quickie2.py, with the number of records as a parameter
+    mock_data = []
+    for i in range(n_rows):
+        record = {
+            'id': i + 1,
+            'product': f'Product {i + 1}',
+            'quantity_sold': random.randint(1, 100),
+            'cost_price': round(random.uniform(5.0, 50.0), 2),
+            'selling_price': round(random.uniform(10.0, 100.0), 2),
+            'profit': lambda cp, sp, qty: round((sp - cp) * qty, 2)
+        }
+        record['profit'] = record['profit'](record['cost_price'], record['selling_price'], record['quantity_sold'])
+        mock_data.append(record)
+    return json.dumps(mock_data)
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        memory = psutil.Process().memory_info()
+        # peak_wset is the peak working set on Windows
+        return getattr(memory, "peak_wset", memory.rss) / (1024 * 1024)
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_mode(mode: str, n_rows: int) -> None:
+    from common.sales_data import iter_sales_arrow, iter_sales_ndjson
+
+    start = time.perf_counter()
+    size = 0
+    if mode == "legacy":
+        size = len(legacy_sales_data(n_rows))
+    elif mode == "ndjson":
+        with open(os.devnull, "w") as sink:
+            for block in iter_sales_ndjson(2024, n_rows, seed=42):
+                size += len(block)
+                sink.write(block)
+    elif mode == "arrow":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            print(json.dumps({"mode": mode, "skipped": "pyarrow is not installed"}))
+            return
+        for batch in iter_sales_arrow(2024, n_rows, seed=42):
+            size += batch.nbytes
+    elapsed = time.perf_counter() - start
+    peak = peak_rss_mb()
+    print(json.dumps({"mode": mode, "rows": n_rows, "seconds": round(elapsed, 3), "peak_rss_mb": round(peak, 1) if peak is not None else None, "bytes": size}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the sales data generators.")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--modes", nargs="+", default=["legacy", "ndjson", "arrow"])
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.rows)
+        return
+    for mode in args.modes:
+        subprocess.run([sys.executable, __file__, "--mode", mode, "--rows", str(args.rows)], check=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import os, sys, json, time, argparse, statistics, subprocess
+
+# Startup time of a script: importing the SDK, getting the first token and making the first request, each measured in
+# a fresh process.
+# - baseline: what the scripts used to do, DefaultAzureCredential and AIProjectClient.from_connection_string, with
+#   azure.monitor imported eagerly as in tracing/tracing.py.
+# - bootstrap: common/bootstrap.py, with the credential recorded in .cache/credential.json and the tokens cached in
+#   .cache/tokens.bin by the previous runs.
+# The token needs a login (az login), the first request, listing one agent, also PROJECT_CONNECTION_STRING;
+# --no-request stops at the token.
+#
+# Example: python benchmarks/bench_startup.py --runs 5
+#          python benchmarks/bench_startup.py --runs 5 --reset-cache   (the first bootstrap run walks the chain again)
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+MODES = ("baseline", "bootstrap")
+TOKEN_SCOPE = "https://management.azure.com/.default"
+METRICS = ("import_seconds", "token_seconds", "request_seconds", "process_seconds")
+
+
+def measure(mode: str, request: bool) -> dict:
+    # Runs in the child process: times the imports, the first token and the first request of a script
+    start = time.perf_counter()
+    if mode == "baseline":
+        from azure.ai.projects import AIProjectClient
+        from azure.identity import DefaultAzureCredential
+        import azure.monitor.opentelemetry  # noqa: F401
+    else:
+        sys.path.append(ROOT)
+        from common.bootstrap import create_client, get_credential
+    timings = {"import_seconds": time.perf_counter() - start}
+
+    start = time.perf_counter()
+    credential = DefaultAzureCredential() if mode == "baseline" else get_credential()
+    credential.get_token(TOKEN_SCOPE)
+    timings["token_seconds"] = time.perf_counter() - start
+
+    if request:
+        start = time.perf_counter()
+        if mode == "baseline":
+            project_client = AIProjectClient.from_connection_string(
+                credential=credential, conn_str=os.environ["PROJECT_CONNECTION_STRING"]
+            )
+        else:
+            project_client = create_client()
+        with project_client:
+            project_client.agents.list_agents(limit=1)
+        timings["request_seconds"] = time.perf_counter() - start
+    return timings
+
+
+def run_child(mode: str, request: bool) -> dict:
+    command = [sys.executable, os.path.abspath(__file__), "--child", mode] + ([] if request else ["--no-request"])
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        print(result.stderr, file=sys.stderr)
+        sys.exit(result.returncode)
+    return dict(json.loads(result.stdout.splitlines()[-1]), process_seconds=elapsed)
+
+
+def summarize(timings: list) -> dict:
+    summary = {}
+    for metric in METRICS:
+        values = [t[metric] for t in timings if metric in t]
+        if values:
+            summary[metric] = {
+                "first": round(values[0], 3),
+                "mean": round(statistics.mean(values), 3),
+                "min": round(min(values), 3),
+            }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the startup of a script, with and without the bootstrap.")
+    parser.add_argument("--runs", type=int, default=5, help="processes started per mode")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--no-request", action="store_true", help="stop after the first token")
+    parser.add_argument("--reset-cache", action="store_true", help="forget the credential and the tokens of the bootstrap first")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+
+    load_dotenv(os.path.join(ROOT, ".env"))
+    if args.child:
+        print(json.dumps(measure(args.child, not args.no_request)))
+        return
+
+    if args.reset_cache:
+        for name in ("credential.json", "tokens.bin"):
+            path = os.path.join(ROOT, ".cache", name)
+            if os.path.exists(path):
+                os.remove(path)
+    results = {}
+    for mode in args.modes:
+        results[mode] = summarize([run_child(mode, not args.no_request) for _ in range(args.runs)])
+    print(json.dumps({"runs": args.runs, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
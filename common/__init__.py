@@ -0,0 +1 @@
+# Shared helpers used by the sample scripts in this repo.
@@ -0,0 +1,303 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from azure.ai.projects.models import Agent
+from azure.core.exceptions import ResourceNotFoundError
+
+from common.manifest import CACHE_DIR, client_scope, load_manifest, save_manifest
+
+# Registry of agents that were already created in the project, keyed by a hash of their definition.
+# Instead of calling create_agent / delete_agent on every run, the scripts ask the registry for an agent.
+# A new agent is only created when the definition (model, name, instructions, tools, tool resources) changes.
+# Agents are kept per project (common/manifest.py client_scope), and checked with get_agent once per process before
+# being handed out. The collector deletes agents whose definition was idle for a week, and agents that were replaced
+# for the same definition (two processes creating it at the same time) once nobody can still be using them. Scripts
+# sharing an agent name with different definitions don't replace each other's agents.
+
+DEFAULT_REGISTRY_PATH = CACHE_DIR / "agents.json"
+
+# Don't rewrite the manifest on every lookup just to bump the last used timestamp
+_TOUCH_INTERVAL_SECONDS = 60
+
+# A replaced agent may still be used by the process that created it
+_SUPERSEDED_GRACE_SECONDS = 3600
+
+
+def to_jsonable(value: Any) -> Any:
+    """
+    Convert SDK models (tool definitions, tool resources, ...) into plain JSON values.
+
+    :param value (Any): The value to convert.
+    :return: A value that can be passed to json.dumps.
+    :rtype: Any
+    """
+    if hasattr(value, "as_dict"):
+        return value.as_dict()
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(v) for v in value]
+    if isinstance(value, dict):
+        return {k: to_jsonable(v) for k, v in value.items()}
+    return value
+
+
+def definition_hash(
+    model: str,
+    name: str,
+    instructions: str,
+    tools: Optional[Any] = None,
+    tool_resources: Optional[Any] = None,
+) -> str:
+    """
+    Compute the content hash that identifies an agent definition.
+
+    :param model (str): The model deployment name.
+    :param name (str): The agent name.
+    :param instructions (str): The agent instructions.
+    :param tools (Optional[Any]): The tool definitions.
+    :param tool_resources (Optional[Any]): The tool resources.
+    :return: A hex encoded SHA-256 of the canonical definition.
+    :rtype: str
+    """
+    definition = {
+        "model": model,
+        "name": name,
+        "instructions": instructions,
+        # Tool order doesn't matter to the agent, and FunctionTool built from a set has no stable order
+        "tools": sorted(to_jsonable(tools or []), key=lambda t: json.dumps(t, sort_keys=True, default=str)),
+        "tool_resources": to_jsonable(tool_resources) if tool_resources else None,
+    }
+    canonical = json.dumps(definition, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class AgentRegistry:
+    """
+    Persistent registry that reuses agents across runs and processes.
+
+    :param project_client (AIProjectClient): The client used to create and delete agents.
+    :param path (str): The JSON manifest in which the known agents are stored.
+    :param scope (Optional[str]): The project key of the agents, None for the project of the client.
+    """
+
+    def __init__(self, project_client, path: os.PathLike = DEFAULT_REGISTRY_PATH, scope: Optional[str] = None):
+        self._client = project_client
+        self._path = Path(path)
+        self._scope = scope or client_scope(project_client)
+        self._verified: set = set()
+        self._lock = threading.Lock()
+        self._gc_thread: Optional[threading.Thread] = None
+        self._gc_stop = threading.Event()
+
+    def get_or_create(
+        self,
+        model: str,
+        name: str,
+        instructions: str,
+        tools: Optional[Any] = None,
+        tool_resources: Optional[Any] = None,
+        toolset: Optional[Any] = None,
+        **kwargs: Any,
+    ) -> Agent:
+        """
+        Return an agent matching the definition, creating it only if no matching agent is known.
+
+        :param model (str): The model deployment name.
+        :param name (str): The agent name.
+        :param instructions (str): The agent instructions.
+        :param tools (Optional[Any]): The tool definitions.
+        :param tool_resources (Optional[Any]): The tool resources.
+        :param toolset (Optional[ToolSet]): A toolset, used instead of tools and tool_resources.
+        :return: The cached or newly created agent.
+        :rtype: Agent
+        """
+        key, create_kwargs = self._prepare(model, name, instructions, tools, tool_resources, toolset, kwargs)
+        agent = self._lookup(key)
+        if agent is not None and agent.id not in self._verified:
+            try:
+                self._client.agents.get_agent(agent.id)
+                self._verified.add(agent.id)
+            except ResourceNotFoundError:
+                agent = self._drop_missing(agent)
+        if agent is not None:
+            return agent
+
+        agent = self._client.agents.create_agent(
+            model=model, name=name, instructions=instructions, metadata={"definition_hash": key}, **create_kwargs
+        )
+        self._remember(key, name, agent)
+        return agent
+
+    async def get_or_create_async(
+        self,
+        model: str,
+        name: str,
+        instructions: str,
+        tools: Optional[Any] = None,
+        tool_resources: Optional[Any] = None,
+        toolset: Optional[Any] = None,
+        **kwargs: Any,
+    ) -> Agent:
+        """
+        Same as get_or_create, for a registry built on the async client from azure.ai.projects.aio.
+
+        :param model (str): The model deployment name.
+        :param name (str): The agent name.
+        :param instructions (str): The agent instructions.
+        :param tools (Optional[Any]): The tool definitions.
+        :param tool_resources (Optional[Any]): The tool resources.
+        :param toolset (Optional[AsyncToolSet]): A toolset, used instead of tools and tool_resources.
+        :return: The cached or newly created agent.
+        :rtype: Agent
+        """
+        key, create_kwargs = self._prepare(model, name, instructions, tools, tool_resources, toolset, kwargs)
+        agent = self._lookup(key)
+        if agent is not None and agent.id not in self._verified:
+            try:
+                await self._client.agents.get_agent(agent.id)
+                self._verified.add(agent.id)
+            except ResourceNotFoundError:
+                agent = self._drop_missing(agent)
+        if agent is not None:
+            return agent
+
+        agent = await self._client.agents.create_agent(
+            model=model, name=name, instructions=instructions, metadata={"definition_hash": key}, **create_kwargs
+        )
+        self._remember(key, name, agent)
+        return agent
+
+    def forget(self, agent_id: str) -> None:
+        """
+        Drop an agent from the registry, e.g. after it was deleted outside of the registry.
+
+        :param agent_id (str): The ID of the agent to drop.
+        """
+        with self._lock:
+            entries = self._load()
+            remaining = {k: v for k, v in entries.items() if v["agent"]["id"] != agent_id}
+            if len(remaining) != len(entries):
+                self._save(remaining)
+        self._verified.discard(agent_id)
+
+    def collect_garbage(self, max_idle_seconds: float = 7 * 24 * 3600) -> int:
+        """
+        Delete agents whose definition was idle for too long, and agents replaced by another agent of the same
+        definition more than an hour ago.
+
+        :param max_idle_seconds (float): Agents not used for this long are deleted.
+        :return: The number of deleted agents.
+        :rtype: int
+        """
+        now = time.time()
+        stale = []
+        with self._lock:
+            # Dropped from the manifest before being deleted, so no lookup hands them out in the meantime
+            entries = self._load()
+            for key, entry in list(entries.items()):
+                if now - entry["last_used"] > max_idle_seconds:
+                    stale.append(entry["agent"]["id"])
+                    stale.extend(old["id"] for old in entry.get("superseded", []))
+                    del entries[key]
+                    continue
+                superseded = entry.get("superseded", [])
+                stale.extend(old["id"] for old in superseded if now - old["since"] > _SUPERSEDED_GRACE_SECONDS)
+                entry["superseded"] = [old for old in superseded if now - old["since"] <= _SUPERSEDED_GRACE_SECONDS]
+            if stale:
+                self._save(entries)
+
+        deleted = 0
+        for agent_id in stale:
+            self._verified.discard(agent_id)
+            try:
+                self._client.agents.delete_agent(agent_id)
+                deleted += 1
+                logging.info(f"Deleted stale agent {agent_id}")
+            except Exception as e:
+                logging.warning(f"Could not delete stale agent {agent_id}: {e}")
+        return deleted
+
+    def start_background_gc(self, interval_seconds: float = 3600, max_idle_seconds: float = 7 * 24 * 3600) -> None:
+        """
+        Run collect_garbage periodically on a daemon thread, off the request path.
+
+        :param interval_seconds (float): Time between two collections.
+        :param max_idle_seconds (float): Passed on to collect_garbage.
+        """
+        if self._gc_thread is not None:
+            return
+        self._gc_stop.clear()
+
+        def loop():
+            while not self._gc_stop.is_set():
+                try:
+                    self.collect_garbage(max_idle_seconds)
+                except Exception as e:
+                    logging.warning(f"Agent garbage collection failed: {e}")
+                self._gc_stop.wait(interval_seconds)
+
+        self._gc_thread = threading.Thread(target=loop, name="agent-registry-gc", daemon=True)
+        self._gc_thread.start()
+
+    def stop_background_gc(self) -> None:
+        """Stop the background garbage collection thread."""
+        self._gc_stop.set()
+        self._gc_thread = None
+
+    @staticmethod
+    def _prepare(model, name, instructions, tools, tool_resources, toolset, kwargs):
+        create_kwargs = dict(kwargs)
+        if toolset is not None:
+            tools, tool_resources = toolset.definitions, toolset.resources
+            create_kwargs["toolset"] = toolset
+        else:
+            create_kwargs["tools"] = tools
+            create_kwargs["tool_resources"] = tool_resources
+        return definition_hash(model, name, instructions, tools, tool_resources), create_kwargs
+
+    def _drop_missing(self, agent: Agent) -> None:
+        logging.info(f"Agent {agent.id} was deleted outside of the registry, creating it again")
+        self.forget(agent.id)
+
+    def _lookup(self, key: str) -> Optional[Agent]:
+        with self._lock:
+            entries = self._load()
+            entry = entries.get(key)
+            if not entry:
+                return None
+            now = time.time()
+            if now - entry["last_used"] > _TOUCH_INTERVAL_SECONDS:
+                entry["last_used"] = now
+                self._save(entries)
+        logging.info(f"Reusing agent {entry['agent']['id']} for definition {key[:12]}")
+        return Agent(entry["agent"])
+
+    def _remember(self, key: str, name: str, agent: Agent) -> None:
+        logging.info(f"Created agent {agent.id} for definition {key[:12]}")
+        self._verified.add(agent.id)
+        with self._lock:
+            entries = self._load()
+            now = time.time()
+            superseded = []
+            previous = entries.get(key)
+            if previous is not None:
+                # Another process created an agent for the same definition concurrently: keep it until it is unused
+                superseded = previous.get("superseded", []) + [{"id": previous["agent"]["id"], "since": now}]
+            entries[key] = {
+                "agent": agent.as_dict(), "name": name, "created": now, "last_used": now, "superseded": superseded
+            }
+            self._save(entries)
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        return load_manifest(self._path).get(self._scope, {})
+
+    def _save(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        # The manifest holds the agents of every project, each under its scope
+        manifest = load_manifest(self._path)
+        manifest[self._scope] = entries
+        save_manifest(self._path, manifest)
@@ -0,0 +1,140 @@
+import os
+import shutil
+import subprocess
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from common.manifest import CACHE_DIR
+
+# Concurrent download of the files produced by a run (code interpreter images and file path annotations).
+# All referenced file IDs are downloaded in parallel, with a bounded number of workers. Each file is streamed to disk
+# chunk by chunk into a local content cache keyed by file ID, so a file referenced twice, or already downloaded by an
+# earlier run, is fetched only once. The cached file is then linked (or copied) to the target directory. Opening the
+# files is left to an optional hook, e.g. open_file.
+
+
+def open_file(path: Path) -> None:
+    """
+    Open a file with the default application of the platform, without waiting for it.
+
+    :param path (Path): The file to open.
+    """
+    if sys.platform == "win32":
+        os.startfile(path)
+    elif sys.platform == "darwin":
+        subprocess.Popen(["open", str(path)])
+    else:
+        subprocess.Popen(["xdg-open", str(path)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def collect_file_ids(messages: Any) -> Dict[str, str]:
+    """
+    The IDs of the files referenced by messages, with the file name to save them under.
+
+    :param messages (OpenAIPageableListOfThreadMessage | ThreadMessage): The messages of the thread, or one message.
+    :return: The file names by file ID, in order of appearance.
+    :rtype: Dict[str, str]
+    """
+    files: Dict[str, str] = {}
+    for image_content in messages.image_contents:
+        file_id = image_content.image_file.file_id
+        files.setdefault(file_id, f"{file_id}_image_file.png")
+    for file_path_annotation in messages.file_path_annotations:
+        file_id = file_path_annotation.file_path.file_id
+        files.setdefault(file_id, Path(file_path_annotation.text).name or file_id)
+    return files
+
+
+class ArtifactFetcher:
+    """
+    Downloads run artifacts concurrently, through a local content cache.
+
+    :param project_client (AIProjectClient): The client used to download the files.
+    :param target_dir (str): The directory the files are saved to.
+    :param cache_dir (os.PathLike): The content cache, one file per file ID.
+    :param max_workers (int): The maximum number of parallel downloads.
+    :param on_saved (Optional[Callable[[Path], None]]): Called with the path of each saved file, e.g. open_file.
+    """
+
+    def __init__(
+        self,
+        project_client,
+        target_dir: str = "files",
+        cache_dir: os.PathLike = CACHE_DIR / "artifacts",
+        max_workers: int = 8,
+        on_saved: Optional[Callable[[Path], None]] = None,
+    ):
+        self._client = project_client
+        self._target_dir = Path(target_dir)
+        self._cache_dir = Path(cache_dir)
+        self._on_saved = on_saved
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="artifact")
+        self._downloads: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._target_dir.mkdir(parents=True, exist_ok=True)
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def fetch(self, messages: Any) -> Dict[str, Path]:
+        """
+        Download all the files referenced by messages and save them to the target directory.
+
+        :param messages (OpenAIPageableListOfThreadMessage | ThreadMessage): The messages of the thread, or one message.
+        :return: The saved paths by file ID.
+        :rtype: Dict[str, Path]
+        """
+        return self.fetch_files(collect_file_ids(messages))
+
+    def fetch_files(self, files: Dict[str, str]) -> Dict[str, Path]:
+        """
+        Download files and save them to the target directory.
+
+        :param files (Dict[str, str]): The file names by file ID.
+        :return: The saved paths by file ID.
+        :rtype: Dict[str, Path]
+        """
+        downloads = {file_id: self._download(file_id) for file_id in files}
+        # Linking the downloaded files is cheap, it is done here as they complete
+        return {file_id: self._save(downloads[file_id].result(), file_name) for file_id, file_name in files.items()}
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def _download(self, file_id: str) -> Future:
+        # Concurrent requests for the same file share one download, a failed one is tried again
+        with self._lock:
+            future = self._downloads.get(file_id)
+            if future is None or (future.done() and future.exception() is not None):
+                future = self._executor.submit(self._download_to_cache, file_id)
+                self._downloads[file_id] = future
+            return future
+
+    def _download_to_cache(self, file_id: str) -> Path:
+        cache_path = self._cache_dir / Path(file_id).name
+        if cache_path.exists():
+            return cache_path
+        tmp_path = cache_path.with_suffix(f".{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in self._client.agents.get_file_content(file_id):
+                    f.write(chunk)
+            os.replace(tmp_path, cache_path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+        return cache_path
+
+    def _save(self, cache_path: Path, file_name: str) -> Path:
+        target_path = self._target_dir / Path(file_name).name
+        if target_path.exists():
+            target_path.unlink()
+        try:
+            os.link(cache_path, target_path)
+        except OSError:
+            # Hard links are not available across devices or on every file system
+            shutil.copyfile(cache_path, target_path)
+        if self._on_saved is not None:
+            self._on_saved(target_path)
+        return target_path
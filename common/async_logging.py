@@ -0,0 +1,145 @@
+import atexit
+import json
+import logging
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import List, Optional
+
+from opentelemetry import trace
+
+# Logging that stays off the calling thread.
+# The calling thread only attaches the current trace and span IDs and puts the record on a bounded queue; formatting
+# (including the str() of the arguments) and writing happen on the listener thread. Records are emitted as JSON lines,
+# with the message capped in size. When the queue is full, records are dropped instead of blocking the caller.
+# Handlers already installed on the logger (e.g. the LoggingHandler of configure_azure_monitor on the root logger) are
+# moved behind the queue too, and run with the trace context of the record. A logger other than the root one stops
+# propagating, so no handler of its parents runs on the calling thread either.
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as single line JSON, with trace correlation and a size cap on the message.
+
+    :param max_message_chars (int): Messages longer than this are truncated.
+    """
+
+    def __init__(self, max_message_chars: int = 4096):
+        super().__init__()
+        self._max_message_chars = max_message_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        if len(message) > self._max_message_chars:
+            message = f"{message[: self._max_message_chars]}... [{len(message) - self._max_message_chars} chars truncated]"
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": message,
+            "trace_id": getattr(record, "trace_id", None),
+            "span_id": getattr(record, "span_id", None),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)[-self._max_message_chars :]
+        return json.dumps(entry, default=str)
+
+
+class CorrelatingQueueHandler(QueueHandler):
+    """
+    QueueHandler that records the current trace context and leaves formatting to the listener thread.
+
+    :param log_queue (queue.Queue): The bounded queue shared with the listener.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The default prepare() formats the message on the calling thread, which is what we want to avoid
+        span_context = trace.get_current_span().get_span_context()
+        if span_context.is_valid:
+            record.trace_id = format(span_context.trace_id, "032x")
+            record.span_id = format(span_context.span_id, "016x")
+            record.otel_span_context = span_context
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class CorrelatingQueueListener(QueueListener):
+    """
+    QueueListener that runs the handlers in the trace context the record was logged in, and can be stopped twice.
+
+    :param log_queue (queue.Queue): The queue shared with the CorrelatingQueueHandler.
+    :param handlers (logging.Handler): The handlers doing the actual output.
+    """
+
+    def __init__(self, log_queue: queue.Queue, *handlers: logging.Handler):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self._running = False
+        self._state_lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._state_lock:
+            if not self._running:
+                super().start()
+                self._running = True
+
+    def stop(self) -> None:
+        with self._state_lock:
+            if self._running:
+                self._running = False
+                super().stop()
+
+    def handle(self, record: logging.LogRecord) -> None:
+        span_context = getattr(record, "otel_span_context", None)
+        if span_context is None:
+            super().handle(record)
+            return
+        # Handlers reading the current span (e.g. the OpenTelemetry LoggingHandler) see the caller's span
+        with trace.use_span(trace.NonRecordingSpan(span_context)):
+            super().handle(record)
+
+
+def setup_queue_logging(
+    logger: Optional[logging.Logger] = None,
+    handlers: Optional[List[logging.Handler]] = None,
+    max_message_chars: int = 4096,
+    queue_size: int = 10000,
+) -> QueueListener:
+    """
+    Route a logger through a bounded queue to handlers running on a background thread.
+
+    :param logger (Optional[logging.Logger]): The logger to set up, None for the root logger.
+    :param handlers (Optional[List[logging.Handler]]): The handlers doing the actual output, None for stderr. The
+        handlers already on the logger are kept, behind the queue and with their own formatting.
+    :param max_message_chars (int): Messages longer than this are truncated.
+    :param queue_size (int): The maximum number of records waiting to be written.
+    :return: The started listener, stopped automatically at exit.
+    :rtype: QueueListener
+    """
+    logger = logger or logging.getLogger()
+    handlers = handlers or [logging.StreamHandler(sys.stderr)]
+    formatter = JsonFormatter(max_message_chars)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    existing = list(logger.handlers)
+    for handler in existing:
+        logger.removeHandler(handler)
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    logger.addHandler(CorrelatingQueueHandler(log_queue))
+    if logger is not logging.getLogger():
+        logger.propagate = False
+    listener = CorrelatingQueueListener(log_queue, *existing, *handlers)
+    listener.start()
+    # The caller may already have stopped it
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,402 @@
+import asyncio
+import importlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from azure.core.credentials import AccessToken
+from azure.core.exceptions import ClientAuthenticationError
+
+from common.cassette_transport import project_client_kwargs
+from common.manifest import CACHE_DIR, load_manifest, save_manifest
+from common.router import create_async_project_client, create_project_client
+
+# Shared client bootstrap, so a script starts fast and its clients share connections.
+# - The credential chain of DefaultAzureCredential is walked once: the credential that worked (Azure CLI, managed
+#   identity, environment, ...) is recorded in .cache/credential.json and built directly by the next process. Set
+#   AZURE_CREDENTIAL to a credential class name (e.g. AzureCliCredential) to skip the chain altogether.
+# - Access tokens are kept in an encrypted file (.cache/tokens.bin, with DPAPI, Keychain or libsecret through
+#   msal-extensions), so a restart within the token lifetime doesn't ask the credential again: with the Azure CLI
+#   that is a subprocess per token. Without an encryption backend tokens stay in memory, unless
+#   TOKEN_CACHE_ALLOW_UNENCRYPTED=1 allows a plain file readable only by the user. Delete the file after switching
+#   accounts.
+# - All clients of a process share one keep-alive connection pool (one per event loop for the async clients).
+# - azure.identity and azure.monitor are only imported when needed.
+# create_client also honours AGENTS_CASSETTE (common/cassette_transport.py), and AGENT_ENDPOINTS (common/router.py) with
+# routed=True.
+#
+# Compare the startup with benchmarks/bench_startup.py.
+
+CREDENTIAL_MANIFEST = CACHE_DIR / "credential.json"
+TOKEN_CACHE_PATH = CACHE_DIR / "tokens.bin"
+REFRESH_MARGIN_SECONDS = 300
+
+# Credentials of the DefaultAzureCredential chain that can be built without arguments
+CREDENTIAL_TYPES = (
+    "EnvironmentCredential",
+    "WorkloadIdentityCredential",
+    "ManagedIdentityCredential",
+    "SharedTokenCacheCredential",
+    "AzureCliCredential",
+    "AzurePowerShellCredential",
+    "AzureDeveloperCliCredential",
+)
+
+_lock = threading.Lock()
+_credential: Optional["CachedTokenCredential"] = None
+_async_credential: Optional["AsyncCachedTokenCredential"] = None
+_transport: Optional[Any] = None
+_async_transports: Dict[Any, Tuple[Any, Any]] = {}
+
+
+class TokenFileCache:
+    """
+    Access tokens by credential and scopes, persisted across processes.
+
+    :param path (os.PathLike): The cache file.
+    :param allow_unencrypted (Optional[bool]): Use a plain file when encryption is unavailable, None to read
+        TOKEN_CACHE_ALLOW_UNENCRYPTED.
+    """
+
+    def __init__(self, path: os.PathLike = TOKEN_CACHE_PATH, allow_unencrypted: Optional[bool] = None):
+        if allow_unencrypted is None:
+            allow_unencrypted = os.environ.get("TOKEN_CACHE_ALLOW_UNENCRYPTED") == "1"
+        self._path = str(path)
+        self._persistence = self._open(allow_unencrypted)
+        self._tokens: Optional[Dict[str, AccessToken]] = None
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[AccessToken]:
+        with self._lock:
+            if self._tokens is None:
+                self._tokens = self._load()
+            token = self._tokens.get(key)
+        if token is None or token.expires_on - time.time() < REFRESH_MARGIN_SECONDS:
+            return None
+        return token
+
+    def put(self, key: str, token: AccessToken) -> None:
+        with self._lock:
+            if self._tokens is None:
+                self._tokens = self._load()
+            now = time.time()
+            self._tokens = {k: t for k, t in self._tokens.items() if t.expires_on > now}
+            self._tokens[key] = token
+            self._save()
+
+    def _open(self, allow_unencrypted: bool) -> Optional[Any]:
+        os.makedirs(os.path.dirname(os.path.abspath(self._path)), exist_ok=True)
+        try:
+            from msal_extensions import build_encrypted_persistence
+
+            return build_encrypted_persistence(self._path)
+        except Exception as e:
+            if not allow_unencrypted:
+                logging.info(f"No encrypted token cache ({e}), tokens are kept in memory only")
+                return None
+        from msal_extensions import FilePersistence
+
+        persistence = FilePersistence(self._path)
+        if not os.path.exists(self._path):
+            # Created empty with owner-only permissions before any token is written to it
+            os.close(os.open(self._path, os.O_CREAT | os.O_WRONLY, 0o600))
+        return persistence
+
+    def _load(self) -> Dict[str, AccessToken]:
+        if self._persistence is None:
+            return {}
+        from msal_extensions import CrossPlatLock
+
+        try:
+            with CrossPlatLock(self._path + ".lockfile"):
+                content = self._persistence.load()
+            return {key: AccessToken(token, expires_on) for key, (token, expires_on) in json.loads(content or "{}").items()}
+        except Exception:
+            return {}
+
+    def _save(self) -> None:
+        if self._persistence is None:
+            return
+        from msal_extensions import CrossPlatLock
+
+        content = json.dumps({key: [t.token, t.expires_on] for key, t in self._tokens.items()})
+        try:
+            with CrossPlatLock(self._path + ".lockfile"):
+                self._persistence.save(content)
+        except Exception as e:
+            logging.warning(f"Could not save the token cache: {e}")
+
+
+def _credential_name() -> Tuple[Optional[str], bool]:
+    # The credential class to build directly, and whether it comes from the manifest (and may be stale)
+    name = os.environ.get("AZURE_CREDENTIAL")
+    if name:
+        return name, False
+    name = load_manifest(CREDENTIAL_MANIFEST).get("credential")
+    return (name, True) if name in CREDENTIAL_TYPES else (None, False)
+
+
+def _build_credential(name: Optional[str], use_async: bool) -> Any:
+    module = importlib.import_module("azure.identity.aio" if use_async else "azure.identity")
+    return getattr(module, name or "DefaultAzureCredential")()
+
+
+def _remember_chain_choice(credential: Any) -> Optional[str]:
+    # The credential of the chain that worked, recorded for the next process
+    successful = getattr(credential, "_successful_credential", None)
+    if successful is None or type(successful).__name__ not in CREDENTIAL_TYPES:
+        return None
+    save_manifest(CREDENTIAL_MANIFEST, {"credential": type(successful).__name__})
+    return type(successful).__name__
+
+
+def _cache_key(credential_name: Optional[str], scopes: Tuple[str, ...], tenant_id: Optional[str]) -> str:
+    return f"{credential_name or 'default'}|{tenant_id or ''}|{' '.join(sorted(scopes))}"
+
+
+class CachedTokenCredential:
+    """
+    A credential resolved once per machine, whose tokens are cached on disk.
+
+    :param cache (Optional[TokenFileCache]): The token cache, None for the default file.
+    """
+
+    def __init__(self, cache: Optional[TokenFileCache] = None):
+        self._cache = cache or TokenFileCache()
+        self._name, self._from_manifest = _credential_name()
+        self._inner: Optional[Any] = None
+        self._lock = threading.Lock()
+
+    def get_token(self, *scopes: str, claims: Optional[str] = None, tenant_id: Optional[str] = None, **kwargs: Any) -> AccessToken:
+        if claims:
+            # A claims challenge needs a new token, never a cached one
+            return self._credential().get_token(*scopes, claims=claims, tenant_id=tenant_id, **kwargs)
+        key = _cache_key(self._name, scopes, tenant_id)
+        token = self._cache.get(key)
+        if token is not None:
+            return token
+        try:
+            token = self._credential().get_token(*scopes, tenant_id=tenant_id, **kwargs)
+        except ClientAuthenticationError:
+            if not self._from_manifest:
+                raise
+            # The recorded credential stopped working (e.g. logged out of the CLI): walk the chain again
+            logging.info(f"{self._name} failed, falling back to DefaultAzureCredential")
+            with self._lock:
+                self._name, self._from_manifest, self._inner = None, False, None
+            save_manifest(CREDENTIAL_MANIFEST, {})
+            return self.get_token(*scopes, tenant_id=tenant_id, **kwargs)
+        if self._name is None:
+            # Stored under the name the next process will use
+            key = _cache_key(_remember_chain_choice(self._inner), scopes, tenant_id)
+        self._cache.put(key, token)
+        return token
+
+    def close(self) -> None:
+        if self._inner is not None:
+            self._inner.close()
+
+    def __enter__(self) -> "CachedTokenCredential":
+        return self
+
+    def __exit__(self, *exc_details: Any) -> None:
+        self.close()
+
+    def _credential(self) -> Any:
+        with self._lock:
+            if self._inner is None:
+                self._inner = _build_credential(self._name, use_async=False)
+            return self._inner
+
+
+class AsyncCachedTokenCredential:
+    """
+    Same as CachedTokenCredential, for the async clients from azure.ai.projects.aio.
+
+    :param cache (Optional[TokenFileCache]): The token cache, None for the default file.
+    """
+
+    def __init__(self, cache: Optional[TokenFileCache] = None):
+        self._cache = cache or TokenFileCache()
+        self._name, self._from_manifest = _credential_name()
+        self._inner: Optional[Any] = None
+
+    async def get_token(
+        self, *scopes: str, claims: Optional[str] = None, tenant_id: Optional[str] = None, **kwargs: Any
+    ) -> AccessToken:
+        if claims:
+            return await self._credential().get_token(*scopes, claims=claims, tenant_id=tenant_id, **kwargs)
+        key = _cache_key(self._name, scopes, tenant_id)
+        token = self._cache.get(key)
+        if token is not None:
+            return token
+        try:
+            token = await self._credential().get_token(*scopes, tenant_id=tenant_id, **kwargs)
+        except ClientAuthenticationError:
+            if not self._from_manifest:
+                raise
+            logging.info(f"{self._name} failed, falling back to DefaultAzureCredential")
+            await self.close()
+            self._name, self._from_manifest, self._inner = None, False, None
+            save_manifest(CREDENTIAL_MANIFEST, {})
+            return await self.get_token(*scopes, tenant_id=tenant_id, **kwargs)
+        if self._name is None:
+            # Stored under the name the next process will use
+            key = _cache_key(_remember_chain_choice(self._inner), scopes, tenant_id)
+        self._cache.put(key, token)
+        return token
+
+    async def close(self) -> None:
+        if self._inner is not None:
+            await self._inner.close()
+
+    async def __aenter__(self) -> "AsyncCachedTokenCredential":
+        return self
+
+    async def __aexit__(self, *exc_details: Any) -> None:
+        await self.close()
+
+    def _credential(self) -> Any:
+        if self._inner is None:
+            self._inner = _build_credential(self._name, use_async=True)
+        return self._inner
+
+
+def get_credential() -> CachedTokenCredential:
+    """The credential of the process, created on first use."""
+    global _credential
+    with _lock:
+        if _credential is None:
+            _credential = CachedTokenCredential()
+        return _credential
+
+
+def get_async_credential() -> AsyncCachedTokenCredential:
+    """The async credential of the process, created on first use."""
+    global _async_credential
+    with _lock:
+        if _async_credential is None:
+            _async_credential = AsyncCachedTokenCredential()
+        return _async_credential
+
+
+def shared_transport(pool_size: int = 32) -> Any:
+    """
+    The HTTP transport shared by all sync clients of the process: one requests session with a keep-alive pool.
+
+    :param pool_size (int): The connections kept per host, at least the number of threads making calls. Only the first
+        call creates the transport.
+    :return: The transport, not closed when a client is closed.
+    :rtype: RequestsTransport
+    """
+    global _transport
+    with _lock:
+        if _transport is None:
+            import requests
+            from azure.core.pipeline.transport import RequestsTransport
+
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _transport = RequestsTransport(session=session, session_owner=False)
+        return _transport
+
+
+def shared_async_transport(limit: int = 100) -> Any:
+    """
+    The HTTP transport shared by the async clients of the running event loop. Close it with close_async_transport().
+
+    :param limit (int): The maximum number of connections.
+    :return: The transport, not closed when a client is closed.
+    :rtype: AioHttpTransport
+    """
+    import aiohttp
+    from azure.core.pipeline.transport import AioHttpTransport
+
+    loop = asyncio.get_running_loop()
+    if loop not in _async_transports:
+        # trust_env: HTTPS_PROXY, NO_PROXY and .netrc apply as with the session the SDK creates itself
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=limit, keepalive_timeout=60), trust_env=True
+        )
+        _async_transports[loop] = (session, AioHttpTransport(session=session, session_owner=False))
+    return _async_transports[loop][1]
+
+
+async def close_async_transport() -> None:
+    """Close the shared async transport of the running event loop, and the async credential."""
+    global _async_credential
+    entry = _async_transports.pop(asyncio.get_running_loop(), None)
+    if entry is not None:
+        await entry[0].close()
+    if _async_credential is not None:
+        await _async_credential.close()
+        _async_credential = None
+
+
+def _cassette_kwargs(credential_factory) -> Optional[Dict[str, Any]]:
+    if not os.environ.get("AGENTS_CASSETTE"):
+        return None
+    # Replaying needs no credential at all
+    replay = os.environ.get("AGENTS_CASSETTE_MODE", "replay").startswith("replay")
+    return project_client_kwargs(None if replay else credential_factory())
+
+
+def create_client(conn_str: Optional[str] = None, routed: bool = False, **client_kwargs: Any) -> Any:
+    """
+    The project client of the scripts, with the cached credential and the shared transport.
+
+    :param conn_str (Optional[str]): The connection string, None for PROJECT_CONNECTION_STRING.
+    :param routed (bool): Spread threads and runs over AGENT_ENDPOINTS when it is set (common/router.py).
+    :param client_kwargs (Any): More arguments of AIProjectClient.from_connection_string.
+    :return: The client.
+    :rtype: AIProjectClient | RoutedProjectClient
+    """
+    kwargs = {**(_cassette_kwargs(get_credential) or {"credential": get_credential(), "transport": shared_transport()}), **client_kwargs}
+    if routed:
+        return create_project_client(conn_str=conn_str, **kwargs)
+    from azure.ai.projects import AIProjectClient
+
+    return AIProjectClient.from_connection_string(conn_str=conn_str or os.environ["PROJECT_CONNECTION_STRING"], **kwargs)
+
+
+def create_async_client(conn_str: Optional[str] = None, routed: bool = False, **client_kwargs: Any) -> Any:
+    """
+    Same as create_client, for the async clients. Call it from the event loop, and close_async_transport() at the end.
+
+    :param conn_str (Optional[str]): The connection string, None for PROJECT_CONNECTION_STRING.
+    :param routed (bool): Spread threads and runs over AGENT_ENDPOINTS when it is set (common/router.py).
+    :param client_kwargs (Any): More arguments of AIProjectClient.from_connection_string.
+    :return: The client.
+    :rtype: AIProjectClient | AsyncRoutedProjectClient
+    """
+    kwargs = {"credential": get_async_credential(), "transport": shared_async_transport(), **client_kwargs}
+    if routed:
+        return create_async_project_client(conn_str=conn_str, **kwargs)
+    from azure.ai.projects.aio import AIProjectClient
+
+    return AIProjectClient.from_connection_string(conn_str=conn_str or os.environ["PROJECT_CONNECTION_STRING"], **kwargs)
+
+
+def configure_monitoring(project_client: Any, disable_metrics: bool = False) -> Optional[str]:
+    """
+    Send metrics and logs to the project's Application Insights. azure-monitor is only imported when it is enabled.
+
+    :param project_client (AIProjectClient): The project client.
+    :param disable_metrics (bool): Leave the metrics to a meter provider of the caller (setup_local_metrics).
+    :return: The Application Insights connection string, None if not enabled for the project.
+    :rtype: Optional[str]
+    """
+    connection_string = project_client.telemetry.get_connection_string()
+    if connection_string:
+        from azure.monitor.opentelemetry import configure_azure_monitor
+
+        # Traces go through the sampled batch pipeline of common/telemetry.py
+        configure_azure_monitor(
+            connection_string=connection_string, disable_tracing=True, disable_metrics=disable_metrics
+        )
+    return connection_string
@@ -0,0 +1,303 @@
+import inspect
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from azure.core.exceptions import HttpResponseError
+from azure.core.rest import HttpRequest
+
+from common.instrumentation import LatencySummary
+from common.run_timeline import list_all_run_steps, tool_call_names
+
+# Small/large model cascade for agent runs.
+# The agent is defined with the large model. For each user message a cheap heuristic classifier decides whether the
+# run can go to the small model: short, single questions needing at most one tool go small, long or multi-part
+# requests, analysis and multi-tool requests go large. A small run overrides the model of the run (create_run(model=))
+# and is told to answer with ESCALATE_MARKER when it isn't confident. The message is escalated to a large run on the
+# same thread when the small run fails, when it answers without calling a tool although the message needs one, or
+# when it returns the marker. Decisions, escalations (by reason) and latencies are counted for the stats.
+# The tools the small run already called (e.g. a send_email) are not called again: their outputs are given to the large
+# run, told to use them. The answer of the small run is deleted from the thread, so the escalated answer replaces it
+# instead of following it.
+
+ESCALATE_MARKER = "[ESCALATE]"
+
+SMALL_MODEL_INSTRUCTIONS = (
+    f"Answer briefly. If the request needs several steps or tools, or you are not sure of the answer, reply with "
+    f"exactly {ESCALATE_MARKER} and nothing else."
+)
+
+LARGE_AFTER_ESCALATION_INSTRUCTIONS = (
+    "A previous attempt to answer the last user message was insufficient. Ignore it and answer the message fully."
+)
+
+ESCALATED_TOOL_OUTPUTS_INSTRUCTIONS = (
+    "These tools were already called for the last user message. Use their outputs and don't call them again:"
+)
+
+# Words pointing at requests that need reasoning, generation or code rather than a lookup. They are matched as whole
+# words ("file" doesn't match "profile"), only the stems match any word they start (analyse, analysis, summarize...).
+COMPLEX_KEYWORDS = {
+    "chart", "charts", "plot", "plots", "graph", "graphs", "compare", "comparison", "explain", "why", "write", "code",
+    "report", "image", "images", "file", "files", "plan", "design",
+}
+COMPLEX_STEMS = ("analy", "summar")
+COMPLEX_PHRASES = ("step by step",)
+# Codes that are data, not programs
+_DATA_CODE_RE = re.compile(r"\b(?:zip|postal|post|area|country|dialing) code\b")
+
+# Verbs dropped from function and parameter names when deriving the keywords of a tool
+_GENERIC_NAME_PARTS = {"fetch", "get", "send", "calculate", "convert", "current", "set", "list", "create", "find"}
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+MAX_SMALL_WORDS = 40
+
+
+class CascadeDecision:
+    """
+    The classifier's choice for one user message.
+
+    :param tier (str): "small" or "large".
+    :param reason (str): Why, for the stats.
+    :param expects_tool (bool): Whether the message looks like it needs a tool call.
+    """
+
+    def __init__(self, tier: str, reason: str, expects_tool: bool = False):
+        self.tier = tier
+        self.reason = reason
+        self.expects_tool = expects_tool
+
+
+def tool_keywords(functions: Iterable[Callable[..., Any]]) -> Dict[str, set]:
+    """
+    Keywords of each function tool, from its name and parameters: convert_temperature(celsius) -> {"temperature",
+    "celsius"}.
+
+    :param functions (Iterable[Callable[..., Any]]): The user functions of the agent.
+    :return: The keywords by function name.
+    :rtype: Dict[str, set]
+    """
+    keywords = {}
+    for function in functions:
+        names = [function.__name__] + list(inspect.signature(function).parameters)
+        parts = {part for name in names for part in name.lower().split("_") if len(part) > 2} - _GENERIC_NAME_PARTS
+        # "datetime" is asked for as "date" or "time"
+        if "datetime" in parts:
+            parts |= {"date", "time"}
+        keywords[function.__name__] = parts
+    return keywords
+
+
+def classify_prompt(prompt: str, keywords: Optional[Dict[str, set]] = None) -> CascadeDecision:
+    """
+    Heuristic classifier: cheap enough to run on every message.
+
+    :param prompt (str): The user message.
+    :param keywords (Optional[Dict[str, set]]): The keywords of each tool, see tool_keywords.
+    :return: The decision.
+    :rtype: CascadeDecision
+    """
+    text = prompt.lower()
+    words = set(_WORD_RE.findall(text))
+    matched_tools = [name for name, parts in (keywords or {}).items() if parts & words]
+    expects_tool = bool(matched_tools)
+
+    if len(text.split()) > MAX_SMALL_WORDS:
+        return CascadeDecision("large", "long", expects_tool)
+    if text.count("?") > 1:
+        return CascadeDecision("large", "several_questions", expects_tool)
+    if len(matched_tools) > 1:
+        return CascadeDecision("large", "several_tools", expects_tool)
+    complex_words = set(_WORD_RE.findall(_DATA_CODE_RE.sub(" ", text)))
+    if (
+        complex_words & COMPLEX_KEYWORDS
+        or any(word.startswith(COMPLEX_STEMS) for word in complex_words)
+        or any(phrase in text for phrase in COMPLEX_PHRASES)
+    ):
+        return CascadeDecision("large", "complex", expects_tool)
+    return CascadeDecision("small", "tool" if expects_tool else "simple", expects_tool)
+
+
+def delete_message(project_client, thread_id: str, message_id: str) -> None:
+    """
+    Delete a message of a thread. azure-ai-projects 1.0.0b4 has no operation for it, so the request is sent through
+    the pipeline of the agents operations (authentication, retries, logging) the way the generated operations do.
+
+    :param project_client (AIProjectClient): The project client, or a routed one (common/router.py).
+    :param thread_id (str): The thread.
+    :param message_id (str): The message.
+    :raises HttpResponseError: When the service refuses the deletion.
+    """
+    # A routed client answers anything it doesn't route from its first project, which may not own the thread
+    if hasattr(project_client, "thread_client"):
+        project_client = project_client.thread_client(thread_id)
+    agents = project_client.agents
+    if hasattr(agents, "delete_message"):
+        agents.delete_message(thread_id=thread_id, message_id=message_id)
+        return
+    config = agents._config
+    request = HttpRequest(
+        "DELETE", f"/threads/{thread_id}/messages/{message_id}", params={"api-version": config.api_version}
+    )
+    request.url = agents._client.format_url(
+        request.url,
+        endpoint=config.endpoint,
+        subscriptionId=config.subscription_id,
+        resourceGroupName=config.resource_group_name,
+        projectName=config.project_name,
+    )
+    agents._client.send_request(request).raise_for_status()
+
+
+def tool_outputs(steps: Iterable[Any]) -> List[str]:
+    """
+    The function calls made in run steps with their outputs, one line each: name(arguments) -> output.
+
+    :param steps (Iterable[RunStep]): The run steps.
+    :return: The lines, empty when no function was called.
+    :rtype: List[str]
+    """
+    lines = []
+    for step in steps:
+        for call in getattr(step.step_details, "tool_calls", None) or []:
+            function = getattr(call, "function", None)
+            if function is not None and getattr(function, "output", None) is not None:
+                lines.append(f"- {function.name}({function.arguments}) -> {function.output}")
+    return lines
+
+
+class ModelCascade:
+    """
+    Runs each user message on the small model first when the classifier allows it, escalating to the large model.
+
+    :param project_client (AIProjectClient): The project client.
+    :param small_model (str): The small model deployment, used through a per-run model override.
+    :param keywords (Optional[Dict[str, set]]): The keywords of each tool, for the classifier and the tool check.
+    :param classifier (Callable[[str, Optional[Dict[str, set]]], CascadeDecision]): The classifier.
+    :param scheduler (Optional[RunScheduler]): The scheduler runs go through, None to run them directly.
+    :param escalate_without_tool (bool): Escalate when a message that needs a tool got a small answer without one.
+    """
+
+    def __init__(
+        self,
+        project_client,
+        small_model: str,
+        keywords: Optional[Dict[str, set]] = None,
+        classifier: Callable[[str, Optional[Dict[str, set]]], CascadeDecision] = classify_prompt,
+        scheduler: Optional[Any] = None,
+        escalate_without_tool: bool = True,
+    ):
+        self._client = project_client
+        self._small_model = small_model
+        self._keywords = keywords
+        self._classifier = classifier
+        self._scheduler = scheduler
+        self._escalate_without_tool = escalate_without_tool
+        self.decisions: Counter = Counter()
+        self.escalations: Counter = Counter()
+        self.latency = LatencySummary()
+        self._lock = threading.Lock()
+
+    def run(self, thread_id: str, agent: Any, prompt: str, **run_kwargs: Any) -> Tuple[Any, str]:
+        """
+        Run the agent on the thread, whose last message is prompt.
+
+        :param thread_id (str): The thread.
+        :param agent (Agent): The agent, defined with the large model.
+        :param prompt (str): The user message, for the classifier.
+        :param run_kwargs (Any): More arguments of create_and_process_run, e.g. a toolset.
+        :return: The final run, and the tier that produced it ("small", "large" or "escalated").
+        :rtype: Tuple[ThreadRun, str]
+        """
+        start = time.perf_counter()
+        decision = self._classifier(prompt, self._keywords)
+        with self._lock:
+            self.decisions[f"{decision.tier}:{decision.reason}"] += 1
+
+        if decision.tier == "small":
+            run = self._run(
+                self._small_model,
+                thread_id,
+                agent,
+                model=self._small_model,
+                additional_instructions=SMALL_MODEL_INSTRUCTIONS,
+                **run_kwargs,
+            )
+            reason = self._escalation_reason(thread_id, run, decision)
+            if reason is None:
+                self.latency.add("small", time.perf_counter() - start)
+                return run, "small"
+            logging.info(f"Escalating run {run.id} to {agent.model}: {reason}")
+            with self._lock:
+                self.escalations[reason] += 1
+            self._delete_run_messages(thread_id, run.id)
+            instructions = LARGE_AFTER_ESCALATION_INSTRUCTIONS
+            # A run escalated for not calling a tool has no outputs to pass on
+            outputs = []
+            if reason != "no_tool_call":
+                outputs = tool_outputs(list_all_run_steps(self._client, thread_id, run.id))
+            if outputs:
+                instructions += "\n" + ESCALATED_TOOL_OUTPUTS_INSTRUCTIONS + "\n" + "\n".join(outputs)
+            run = self._run(agent.model, thread_id, agent, additional_instructions=instructions, **run_kwargs)
+            self.latency.add("escalated", time.perf_counter() - start)
+            return run, "escalated"
+
+        run = self._run(agent.model, thread_id, agent, **run_kwargs)
+        self.latency.add("large", time.perf_counter() - start)
+        return run, "large"
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Routing decisions, escalations by reason, the escalation rate of small runs and the latency per tier.
+
+        :return: The stats.
+        :rtype: Dict[str, Any]
+        """
+        with self._lock:
+            small = sum(count for key, count in self.decisions.items() if key.startswith("small:"))
+            escalated = sum(self.escalations.values())
+            return {
+                "decisions": dict(self.decisions),
+                "escalations": dict(self.escalations),
+                "escalation_rate": round(escalated / small, 3) if small else 0.0,
+                "latency": self.latency.percentiles(),
+            }
+
+    def print_stats(self) -> None:
+        stats = self.stats()
+        print(f"Cascade decisions: {stats['decisions']}")
+        print(f"Escalations: {stats['escalations']} (rate {stats['escalation_rate']:.1%} of small runs)")
+        self.latency.print()
+
+    def _run(self, deployment: str, thread_id: str, agent: Any, **kwargs: Any) -> Any:
+        def run_fn():
+            return self._client.agents.create_and_process_run(thread_id=thread_id, assistant_id=agent.id, **kwargs)
+
+        if self._scheduler is None:
+            return run_fn()
+        # Each deployment has its own quota in the scheduler
+        return self._scheduler.submit_sync(deployment, run_fn)
+
+    def _escalation_reason(self, thread_id: str, run: Any, decision: CascadeDecision) -> Optional[str]:
+        if run.status != "completed":
+            return f"run_{run.status}"
+        messages = self._client.agents.list_messages(thread_id=thread_id, run_id=run.id)
+        last_msg = messages.get_last_text_message_by_sender("assistant")
+        if last_msg is None or ESCALATE_MARKER in last_msg.text.value:
+            return "low_confidence"
+        if self._escalate_without_tool and decision.expects_tool:
+            steps = list_all_run_steps(self._client, thread_id, run.id)
+            if not any(tool_call_names(step) for step in steps):
+                return "no_tool_call"
+        return None
+
+    def _delete_run_messages(self, thread_id: str, run_id: str) -> None:
+        # The messages a run added to the thread, e.g. the small answer an escalated run replaces
+        for message in self._client.agents.list_messages(thread_id=thread_id, run_id=run_id).data:
+            try:
+                delete_message(self._client, thread_id, message.id)
+            except HttpResponseError as e:
+                logging.warning(f"Could not delete message {message.id} of the escalated run: {e.message}")
@@ -0,0 +1,225 @@
+import base64
+import io
+import json
+import os
+import threading
+import time
+import types
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+from azure.core.credentials import AccessToken
+from azure.core.pipeline.transport import RequestsTransport
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3 import HTTPResponse
+
+# Record/replay HTTP transport for AIProjectClient, to run the scripts offline and deterministically.
+#
+# In record mode every request goes to the service and the exchange (including each poll of the *_and_poll and
+# create_and_process_run loops) is appended to a cassette file. In replay mode the responses are served from the
+# cassette in recorded order, either instantly or after the recorded latency. Request bodies and auth headers are
+# never stored. Instant replay also skips the sleeps of the SDK between two polls, so a replayed run measures the
+# client, not the poll interval.
+#
+# The project's subscription, resource group and name are part of every request path, so the cassette keeps the
+# connection string it was recorded with; replay it with the same one (see cassette_connection_string).
+# Only the sync clients are covered: the async clients of azure.ai.projects.aio use aiohttp and are never recorded.
+#
+# Enable it with environment variables, e.g. in .env:
+#   AGENTS_CASSETTE=cassettes/quickie.json
+#   AGENTS_CASSETTE_MODE=record | replay | replay-realtime
+
+_DROPPED_RESPONSE_HEADERS = {"set-cookie", "authorization", "content-encoding", "transfer-encoding"}
+
+
+def _match_key(method: str, url: str) -> Tuple[str, str]:
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query)))
+    return method.upper(), f"{parts.path}?{query}"
+
+
+def _build_response(request: requests.PreparedRequest, interaction: Dict[str, Any]) -> requests.Response:
+    body = base64.b64decode(interaction["body"])
+    headers = {k: v for k, v in interaction["headers"].items() if k.lower() != "content-length"}
+    headers["Content-Length"] = str(len(body))
+    response = requests.Response()
+    response.status_code = interaction["status"]
+    response.reason = interaction["reason"]
+    response.headers = CaseInsensitiveDict(headers)
+    response.raw = HTTPResponse(
+        body=io.BytesIO(body), headers=headers, status=interaction["status"], preload_content=False
+    )
+    response.url = request.url
+    response.request = request
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    return response
+
+
+class CassetteAdapter(HTTPAdapter):
+    """
+    requests adapter that records exchanges to, or replays them from, a cassette file.
+
+    :param path (str): The cassette file.
+    :param mode (str): "record", "replay" (instant) or "replay-realtime" (with the recorded latencies).
+    :param connection_string (Optional[str]): The connection string saved with a recording.
+    """
+
+    def __init__(self, path: str, mode: str = "replay", connection_string: Optional[str] = None):
+        super().__init__()
+        if mode not in ("record", "replay", "replay-realtime"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.connection_string = connection_string
+        self._lock = threading.Lock()
+        self._interactions: List[Dict[str, Any]] = []
+        self._queues: Dict[Tuple[str, str], Deque[Dict[str, Any]]] = defaultdict(deque)
+        self._last: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        if mode != "record":
+            with open(path, encoding="utf-8") as f:
+                cassette = json.load(f)
+                self.connection_string = cassette.get("connection_string")
+                for interaction in cassette["interactions"]:
+                    self._queues[_match_key(interaction["method"], interaction["url"])].append(interaction)
+
+    def send(self, request: requests.PreparedRequest, stream: bool = False, **kwargs: Any) -> requests.Response:
+        key = _match_key(request.method, request.url)
+        if self.mode == "record":
+            start = time.perf_counter()
+            real = super().send(request, stream=stream, **kwargs)
+            body = real.content
+            interaction = {
+                "method": request.method,
+                "url": request.url,
+                "status": real.status_code,
+                "reason": real.reason,
+                "headers": {k: v for k, v in real.headers.items() if k.lower() not in _DROPPED_RESPONSE_HEADERS},
+                "body": base64.b64encode(body).decode("ascii"),
+                "latency": round(time.perf_counter() - start, 4),
+            }
+            with self._lock:
+                self._interactions.append(interaction)
+            return _build_response(request, interaction)
+
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue:
+                interaction = queue.popleft()
+                self._last[key] = interaction
+            elif key in self._last:
+                # More polls than recorded: keep answering with the final recorded state
+                interaction = self._last[key]
+            else:
+                raise KeyError(f"No recorded response for {key[0]} {key[1]} in {self.path}")
+        if self.mode == "replay-realtime":
+            time.sleep(interaction["latency"])
+        return _build_response(request, interaction)
+
+    def save(self) -> None:
+        """Write the recorded exchanges to the cassette file."""
+        if self.mode != "record":
+            return
+        with self._lock:
+            interactions = list(self._interactions)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"connection_string": self.connection_string, "interactions": interactions}, f, indent=1)
+
+    def close(self) -> None:
+        self.save()
+        super().close()
+
+
+class StaticTokenCredential:
+    """Credential returning a fixed token, so replay doesn't need Azure credentials or network."""
+
+    def get_token(self, *scopes: str, **kwargs: Any) -> AccessToken:
+        return AccessToken("replay-token", int(time.time()) + 3600)
+
+
+class AsyncStaticTokenCredential:
+    """Async variant of StaticTokenCredential, for the clients of azure.ai.projects.aio (e.g. against a local stub)."""
+
+    async def get_token(self, *scopes: str, **kwargs: Any) -> AccessToken:
+        return AccessToken("replay-token", int(time.time()) + 3600)
+
+    async def close(self) -> None:
+        pass
+
+    async def __aenter__(self) -> "AsyncStaticTokenCredential":
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        pass
+
+
+def cassette_connection_string(path: str) -> Optional[str]:
+    """
+    The connection string a cassette was recorded with.
+
+    :param path (str): The cassette file.
+    :return: The connection string, None for cassettes recorded before it was saved.
+    :rtype: Optional[str]
+    """
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("connection_string")
+
+
+def skip_poll_sleeps() -> None:
+    """Make the polling loops of the sync agents operations (create_and_process_run, *_and_poll) not sleep."""
+    from azure.ai.projects.operations import _patch
+
+    # Only the time module seen by the SDK's operations changes, time.sleep stays as it is everywhere else
+    _patch.time = types.SimpleNamespace(**{**vars(time), "sleep": lambda seconds: None})
+
+
+def cassette_transport(
+    path: str, mode: str, connection_string: Optional[str] = None
+) -> Tuple[RequestsTransport, CassetteAdapter]:
+    """
+    Create a transport that records to, or replays from, the cassette.
+
+    :param path (str): The cassette file.
+    :param mode (str): "record", "replay" or "replay-realtime".
+    :param connection_string (Optional[str]): The connection string to save with a recording.
+    :return: The transport to pass to AIProjectClient, and the adapter (call save() on it to flush a recording).
+    :rtype: Tuple[RequestsTransport, CassetteAdapter]
+    """
+    adapter = CassetteAdapter(path, mode, connection_string)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return RequestsTransport(session=session, session_owner=False), adapter
+
+
+def project_client_kwargs(credential: Optional[Any] = None) -> Dict[str, Any]:
+    """
+    Keyword arguments for AIProjectClient.from_connection_string, honouring AGENTS_CASSETTE / AGENTS_CASSETTE_MODE.
+
+    :param credential (Optional[Any]): The credential to use when not replaying, None for DefaultAzureCredential.
+    :return: The credential, plus the transport when a cassette is configured.
+    :rtype: Dict[str, Any]
+    """
+    path = os.environ.get("AGENTS_CASSETTE")
+    mode = os.environ.get("AGENTS_CASSETTE_MODE", "replay")
+    if path and mode.startswith("replay"):
+        transport, _ = cassette_transport(path, mode)
+        if mode == "replay":
+            skip_poll_sleeps()
+        return {"credential": StaticTokenCredential(), "transport": transport}
+
+    if credential is None:
+        from azure.identity import DefaultAzureCredential
+
+        credential = DefaultAzureCredential()
+    if not path:
+        return {"credential": credential}
+
+    import atexit
+
+    transport, adapter = cassette_transport(path, mode, os.environ.get("PROJECT_CONNECTION_STRING"))
+    atexit.register(adapter.save)
+    return {"credential": credential, "transport": transport}
@@ -0,0 +1,161 @@
+import logging
+from typing import List, Optional
+
+from azure.ai.projects.models import ThreadMessage, ThreadMessageOptions, ThreadRun
+
+from common.agent_registry import AgentRegistry
+from common.run_timeline import context_tokens as steps_context_tokens, list_all_run_steps
+from common.thread_cache import ThreadMessageCache
+
+# Context compaction for long chats.
+# Every run sends the whole thread to the model, so cost and latency grow with the conversation. When the prompt of
+# the last run (or the estimated size of the cached messages) goes over a token budget, the older messages are
+# summarised by a small summariser agent, and a new thread is started with the summary followed by the most recent
+# messages. CompactingThread.id always points at the current thread, so callers just keep using it.
+# The context is measured with the last step of the run (prompt plus answer), not the run's usage, which adds up the
+# prompts of all its steps. When the recent messages alone are over the budget, compacting again on every turn would
+# only add a summary run per turn: the next compaction then waits until the context has grown by another budget.
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:"
+
+SUMMARIZER_INSTRUCTIONS = (
+    "You summarise conversations between a user and an assistant. Keep the facts, numbers, decisions, open questions "
+    "and user preferences that later answers may need. Be concise and write plain text."
+)
+
+
+def message_text(message: ThreadMessage) -> str:
+    """
+    The text of a message, with its parts joined.
+
+    :param message (ThreadMessage): The message.
+    :return: The text.
+    :rtype: str
+    """
+    return "\n".join(text_message.text.value for text_message in message.text_messages)
+
+
+def estimate_tokens(messages: List[ThreadMessage]) -> int:
+    """
+    Rough token count of messages (about 4 characters per token), used when no run usage is available.
+
+    :param messages (List[ThreadMessage]): The messages.
+    :return: The estimated number of tokens.
+    :rtype: int
+    """
+    return sum(len(message_text(message)) // 4 + 4 for message in messages)
+
+
+class CompactingThread:
+    """
+    A thread that is transparently replaced by a summarised one when it grows over a token budget.
+
+    :param project_client (AIProjectClient): The project client.
+    :param message_cache (ThreadMessageCache): The local copy of the thread messages.
+    :param token_budget (int): Compaction starts when the context goes over this number of tokens.
+    :param keep_recent_messages (int): The number of most recent messages copied as is to the new thread.
+    :param summary_model (str): The model of the summariser agent.
+    :param registry (Optional[AgentRegistry]): Where the summariser agent is kept, None for the default registry.
+    :param thread_id (Optional[str]): The thread to start with, e.g. from a warm pool, None to create one.
+    """
+
+    def __init__(
+        self,
+        project_client,
+        message_cache: ThreadMessageCache,
+        token_budget: int = 8000,
+        keep_recent_messages: int = 6,
+        summary_model: str = "gpt-4o-mini",
+        registry: Optional[AgentRegistry] = None,
+        thread_id: Optional[str] = None,
+    ):
+        self._client = project_client
+        self._cache = message_cache
+        self._token_budget = token_budget
+        self._keep_recent_messages = keep_recent_messages
+        self._summary_model = summary_model
+        self._registry = registry or AgentRegistry(project_client)
+        self.id = thread_id or project_client.agents.create_thread().id
+        self.compactions = 0
+        self._threshold = token_budget
+        self._just_compacted = False
+
+    def compact_if_needed(self, run: Optional[ThreadRun] = None, context_tokens: Optional[int] = None) -> bool:
+        """
+        Compact the thread if its context is over the budget. Call it after a run completed.
+
+        :param run (Optional[ThreadRun]): The last run, the usage of its last step is the best measure of the context.
+        :param context_tokens (Optional[int]): The context size if already known (RunTimeline.context_tokens).
+        :return: True if the thread was replaced.
+        :rtype: bool
+        """
+        self._cache.sync(self.id)
+        messages = self._cache.messages(self.id)
+        if context_tokens is None and run is not None:
+            try:
+                context_tokens = steps_context_tokens(list_all_run_steps(self._client, run.thread_id, run.id))
+            except Exception as e:
+                logging.warning(f"Could not list the steps of run {run.id}: {e}")
+        if context_tokens is None:
+            context_tokens = estimate_tokens(messages)
+
+        just_compacted, self._just_compacted = self._just_compacted, False
+        if context_tokens <= self._token_budget:
+            self._threshold = self._token_budget
+            return False
+        if just_compacted:
+            # The summary and the recent messages are already over the budget
+            self._threshold = context_tokens + self._token_budget
+            logging.info(f"Thread {self.id} is at {context_tokens} tokens after compaction, next at {self._threshold}")
+        if context_tokens <= self._threshold or len(messages) <= self._keep_recent_messages:
+            return False
+
+        split = len(messages) - self._keep_recent_messages
+        older, recent = messages[:split], messages[split:]
+        try:
+            summary = self._summarize(older)
+        except Exception as e:
+            # Keep going on the long thread rather than breaking the conversation
+            logging.warning(f"Could not compact thread {self.id}: {e}")
+            return False
+
+        seed = [ThreadMessageOptions(role="user", content=f"{SUMMARY_PREFIX}\n{summary}")]
+        seed += [
+            ThreadMessageOptions(role=message.role, content=message_text(message))
+            for message in recent
+            if message_text(message)
+        ]
+        old_thread_id = self.id
+        self.id = self._client.agents.create_thread(messages=seed).id
+        self._cache.sync(self.id)
+        self.compactions += 1
+        self._just_compacted = True
+        logging.info(
+            f"Compacted thread {old_thread_id} ({context_tokens} tokens, {len(messages)} messages) "
+            f"into {self.id} ({len(seed)} messages)"
+        )
+
+        # The old thread is not needed anymore
+        try:
+            self._client.agents.delete_thread(old_thread_id)
+        except Exception as e:
+            logging.warning(f"Could not delete thread {old_thread_id}: {e}")
+        self._cache.forget(old_thread_id)
+        return True
+
+    def _summarize(self, messages: List[ThreadMessage]) -> str:
+        transcript = "\n\n".join(f"{message.role}: {message_text(message)}" for message in messages)
+        agent = self._registry.get_or_create(
+            model=self._summary_model, name="thread-summarizer", instructions=SUMMARIZER_INSTRUCTIONS
+        )
+        thread = self._client.agents.create_thread(
+            messages=[ThreadMessageOptions(role="user", content=f"Summarise this conversation:\n\n{transcript}")]
+        )
+        try:
+            run = self._client.agents.create_and_process_run(thread_id=thread.id, assistant_id=agent.id)
+            if run.status == "failed":
+                raise RuntimeError(f"Summary run failed: {run.last_error}")
+            summary = self._client.agents.list_messages(thread_id=thread.id).get_last_text_message_by_sender("assistant")
+            return summary.text.value
+        finally:
+            self._client.agents.delete_thread(thread.id)
@@ -0,0 +1,191 @@
+import contextvars
+import functools
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from opentelemetry import metrics, trace
+from opentelemetry.trace import StatusCode
+
+# Per-stage instrumentation of the Agents client.
+# Each lifecycle call (upload, vector store creation, agent and thread creation, runs, list_messages, ...) gets its
+# own child span and its duration is recorded in an OpenTelemetry histogram. Status polls made inside the *_and_poll
+# and create_and_process_run helpers are not traced one by one, but counted per call in a second histogram.
+#
+# The metrics go to whatever meter provider is configured. setup_local_metrics exports them to a local exporter, and
+# to Application Insights as well when given its connection string. LatencySummary keeps recent samples in memory for
+# p50/p95/p99 at exit.
+
+INSTRUMENTED_OPERATIONS = [
+    "upload_file",
+    "upload_file_and_poll",
+    "create_vector_store",
+    "create_vector_store_and_poll",
+    "create_vector_store_file_batch_and_poll",
+    "create_agent",
+    "get_agent",
+    "delete_agent",
+    "create_thread",
+    "create_message",
+    "create_run",
+    "create_and_process_run",
+    "create_stream",
+    "submit_tool_outputs_to_run",
+    "list_messages",
+    "list_run_steps",
+    "save_file",
+    "delete_vector_store",
+    "delete_file",
+]
+POLL_OPERATIONS = ["get_run", "get_file", "get_vector_store", "get_vector_store_file_batch"]
+
+# Latency buckets in seconds, from fast control-plane calls up to long runs
+LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 60, 120]
+
+_poll_counter: contextvars.ContextVar[Optional[List[int]]] = contextvars.ContextVar("agents_poll_counter", default=None)
+
+
+class LatencySummary:
+    """
+    Keeps the most recent durations per operation in memory to report percentiles locally.
+
+    :param max_samples (int): The number of samples kept per operation.
+    """
+
+    def __init__(self, max_samples: int = 10000):
+        self._samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=max_samples))
+        self._lock = threading.Lock()
+
+    def add(self, operation: str, seconds: float) -> None:
+        with self._lock:
+            self._samples[operation].append(seconds)
+
+    def percentiles(self) -> Dict[str, Dict[str, float]]:
+        """
+        Compute count, p50, p95 and p99 (in seconds) per operation.
+
+        :return: The percentiles by operation.
+        :rtype: Dict[str, Dict[str, float]]
+        """
+        result = {}
+        with self._lock:
+            items = {op: sorted(samples) for op, samples in self._samples.items()}
+        for operation, samples in items.items():
+            def pick(q: float) -> float:
+                return round(samples[min(len(samples) - 1, int(q * len(samples)))], 4)
+
+            result[operation] = {"count": len(samples), "p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99)}
+        return result
+
+    def print(self) -> None:
+        for operation, stats in sorted(self.percentiles().items()):
+            print(f"{operation:42} n={stats['count']:<5} p50={stats['p50']:.3f}s p95={stats['p95']:.3f}s p99={stats['p99']:.3f}s")
+
+
+def setup_local_metrics(
+    export_interval_millis: int = 10000,
+    exporter: Optional[Any] = None,
+    azure_monitor_connection_string: Optional[str] = None,
+) -> Any:
+    """
+    Configure a meter provider exporting to a local exporter (the console by default), and to Azure Monitor too.
+
+    :param export_interval_millis (int): How often the metrics are exported.
+    :param exporter (Optional[MetricExporter]): The exporter, None for ConsoleMetricExporter.
+    :param azure_monitor_connection_string (Optional[str]): The Application Insights connection string, None to
+        export locally only. Call configure_azure_monitor with disable_metrics=True then, or it replaces this provider.
+    :return: The meter provider, also set as the global one.
+    :rtype: MeterProvider
+    """
+    from opentelemetry.sdk.metrics import MeterProvider
+    from opentelemetry.sdk.metrics.export import ConsoleMetricExporter, PeriodicExportingMetricReader
+    from opentelemetry.sdk.metrics.view import ExplicitBucketHistogramAggregation, View
+
+    readers = [PeriodicExportingMetricReader(exporter or ConsoleMetricExporter(), export_interval_millis=export_interval_millis)]
+    if azure_monitor_connection_string:
+        from azure.monitor.opentelemetry.exporter import AzureMonitorMetricExporter
+
+        exporter = AzureMonitorMetricExporter(connection_string=azure_monitor_connection_string)
+        readers.append(PeriodicExportingMetricReader(exporter, export_interval_millis=export_interval_millis))
+    view = View(instrument_name="agents.operation.duration", aggregation=ExplicitBucketHistogramAggregation(LATENCY_BUCKETS))
+    provider = MeterProvider(metric_readers=readers, views=[view])
+    metrics.set_meter_provider(provider)
+    return provider
+
+
+def instrument_agents(project_client: Any, summary: Optional[LatencySummary] = None) -> LatencySummary:
+    """
+    Wrap the lifecycle calls of project_client.agents with spans and latency metrics.
+
+    :param project_client (AIProjectClient): The client to instrument.
+    :param summary (Optional[LatencySummary]): Where durations are kept for local percentiles, None for a new one.
+    :return: The latency summary.
+    :rtype: LatencySummary
+    """
+    summary = summary or LatencySummary()
+    agents = project_client.agents
+    if getattr(agents, "_stage_instrumented", False):
+        return summary
+
+    tracer = trace.get_tracer(__name__)
+    meter = metrics.get_meter(__name__)
+    duration = meter.create_histogram("agents.operation.duration", unit="s", description="Duration of Agents client calls")
+    polls = meter.create_histogram("agents.poll.iterations", unit="{poll}", description="Status polls per *_and_poll call")
+
+    def wrap_operation(name: str, method: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(method)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            counter = [0]
+            token = _poll_counter.set(counter)
+            status = "ok"
+            start = time.perf_counter()
+            with tracer.start_as_current_span(f"agents.{name}") as span:
+                try:
+                    result = method(*args, **kwargs)
+                    run_status = getattr(result, "status", None)
+                    if isinstance(run_status, str):
+                        span.set_attribute("agents.status", run_status)
+                        if run_status in ("failed", "cancelled", "expired"):
+                            # The run is returned, not raised: mark the span so error-based sampling keeps it
+                            status = run_status
+                            last_error = getattr(result, "last_error", None)
+                            span.set_status(StatusCode.ERROR, last_error.message if last_error else run_status)
+                    return result
+                except Exception:
+                    status = "error"
+                    raise
+                finally:
+                    _poll_counter.reset(token)
+                    elapsed = time.perf_counter() - start
+                    attributes = {"operation": name, "status": status}
+                    duration.record(elapsed, attributes)
+                    summary.add(name, elapsed)
+                    if counter[0]:
+                        span.set_attribute("agents.poll_iterations", counter[0])
+                        polls.record(counter[0], {"operation": name})
+
+        return wrapper
+
+    def wrap_poll(name: str, method: Callable[..., Any]) -> Callable[..., Any]:
+        traced = wrap_operation(name, method)
+
+        @functools.wraps(method)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            counter = _poll_counter.get()
+            if counter is None:
+                return traced(*args, **kwargs)
+            # Called from inside an instrumented helper: count the poll instead of tracing it
+            counter[0] += 1
+            return method(*args, **kwargs)
+
+        return wrapper
+
+    for name in INSTRUMENTED_OPERATIONS:
+        if hasattr(agents, name):
+            setattr(agents, name, wrap_operation(name, getattr(agents, name)))
+    for name in POLL_OPERATIONS:
+        if hasattr(agents, name):
+            setattr(agents, name, wrap_poll(name, getattr(agents, name)))
+    agents._stage_instrumented = True
+    return summary
@@ -0,0 +1,272 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from common.manifest import CACHE_DIR
+
+# Local hybrid retrieval index for small markdown corpora, as an alternative to the remote vector store.
+# Documents are chunked by heading, scored with BM25 and with embedding similarity, and the two rankings are fused.
+# The index is saved as .npy files that are memory-mapped on load, so worker processes share one copy in the page cache.
+#
+# The default embedding hashes words and character trigrams into a fixed size vector, which needs no model or network.
+# Pass embed_fn to get_index to use a real embedding model instead, e.g. inference_embeddings(project_client, model).
+# An index is rebuilt when the files, their contents or the embedding change; get_index keeps each file set and
+# embedding in its own directory.
+
+DEFAULT_INDEX_DIR = CACHE_DIR / "local_index"
+EMBEDDING_DIM = 256
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+
+_TOKEN_RE = re.compile(r"\w+")
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*)$")
+
+EmbedFn = Callable[[Sequence[str]], np.ndarray]
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase the text and split it into word tokens."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def hashed_embeddings(texts: Sequence[str], dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """
+    Embed texts by hashing their words and character trigrams into a fixed size, L2 normalized vector.
+
+    :param texts (Sequence[str]): The texts to embed.
+    :param dim (int): The vector size.
+    :return: A float32 array of shape (len(texts), dim).
+    :rtype: np.ndarray
+    """
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for token in tokenize(text):
+            features = [token] + [token[i : i + 3] for i in range(max(1, len(token) - 2))]
+            for feature in features:
+                h = zlib.crc32(feature.encode("utf-8"))
+                vectors[row, h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def inference_embeddings(project_client, model: str, batch_size: int = 64) -> EmbedFn:
+    """
+    Embedding function calling an embedding model deployed in the project (needs the azure-ai-inference package).
+
+    :param project_client (AIProjectClient): The project client.
+    :param model (str): The embedding model deployment, e.g. text-embedding-3-small.
+    :param batch_size (int): The texts embedded per request.
+    :return: The embedding function, with a cache_id naming the model.
+    :rtype: EmbedFn
+    """
+    client = project_client.inference.get_embeddings_client()
+
+    def embed(texts: Sequence[str]) -> np.ndarray:
+        vectors = []
+        for start in range(0, len(texts), batch_size):
+            response = client.embed(input=list(texts[start : start + batch_size]), model=model)
+            vectors.extend(item.embedding for item in response.data)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    embed.cache_id = f"inference:{model}"
+    return embed
+
+
+def embedding_id(embed_fn: Optional[EmbedFn]) -> str:
+    """The identity of an embedding function in the index keys: its cache_id attribute, or its qualified name."""
+    if embed_fn is None:
+        return f"hashed:{EMBEDDING_DIM}"
+    cache_id = getattr(embed_fn, "cache_id", None)
+    return cache_id or f"{getattr(embed_fn, '__module__', '')}.{getattr(embed_fn, '__qualname__', repr(embed_fn))}"
+
+
+def _file_set_key(file_paths: Sequence[os.PathLike], embed_fn: Optional[EmbedFn]) -> str:
+    paths = [str(Path(p).resolve()) for p in file_paths]
+    return hashlib.sha256(json.dumps([paths, embedding_id(embed_fn)]).encode("utf-8")).hexdigest()
+
+
+def chunk_markdown(text: str, source: str = "") -> List[Dict[str, str]]:
+    """
+    Split markdown into one chunk per heading, each chunk carrying the path of headings above it.
+
+    :param text (str): The markdown text.
+    :param source (str): The file the text came from.
+    :return: The chunks, as dicts with "source", "heading" and "text".
+    :rtype: List[Dict[str, str]]
+    """
+    chunks = []
+    path: List[str] = []
+    lines: List[str] = []
+
+    def flush():
+        body = "\n".join(lines).strip()
+        if body:
+            chunks.append({"source": source, "heading": " > ".join(path), "text": body})
+
+    for line in text.splitlines():
+        match = _HEADING_RE.match(line)
+        if match:
+            flush()
+            lines = []
+            level = len(match.group(1))
+            path = path[: level - 1] + [match.group(2).strip()]
+        else:
+            lines.append(line)
+    flush()
+    return chunks
+
+
+def _save_array(index_dir: Path, name: str, array: np.ndarray) -> None:
+    # Replace instead of overwriting, processes that still map the old file keep reading a consistent copy
+    tmp_path = index_dir / f"{name}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, index_dir / f"{name}.npy")
+
+
+def build_index(file_paths: Sequence[os.PathLike], index_dir: os.PathLike = DEFAULT_INDEX_DIR, embed_fn: Optional[EmbedFn] = None) -> Path:
+    """
+    Build the index for the markdown files, unless an index of the same contents already exists.
+
+    :param file_paths (Sequence[os.PathLike]): The markdown files.
+    :param index_dir (os.PathLike): The directory the index files are written to.
+    :param embed_fn (Optional[EmbedFn]): The embedding function, None for hashed embeddings.
+    :return: The index directory.
+    :rtype: Path
+    """
+    index_dir = Path(index_dir)
+    texts = [Path(p).read_text(encoding="utf-8") for p in file_paths]
+    # The file list and the embedding are part of the key, not only the contents
+    source_hash = hashlib.sha256(
+        (_file_set_key(file_paths, embed_fn) + "\0" + "\0".join(texts)).encode("utf-8")
+    ).hexdigest()
+    meta_path = index_dir / "meta.json"
+    if meta_path.exists() and json.loads(meta_path.read_text(encoding="utf-8")).get("source_hash") == source_hash:
+        return index_dir
+
+    chunks = [chunk for path, text in zip(file_paths, texts) for chunk in chunk_markdown(text, str(path))]
+    documents = [f"{c['heading']}\n{c['text']}" for c in chunks]
+    tokenized = [tokenize(d) for d in documents]
+
+    # Postings in CSR layout: for term t, doc ids and term frequencies are in [indptr[t], indptr[t + 1])
+    vocab: Dict[str, int] = {}
+    postings: Dict[int, Dict[int, int]] = {}
+    for doc_id, tokens in enumerate(tokenized):
+        for token in tokens:
+            term_id = vocab.setdefault(token, len(vocab))
+            counts = postings.setdefault(term_id, {})
+            counts[doc_id] = counts.get(doc_id, 0) + 1
+    indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+    doc_ids, term_freqs = [], []
+    for term_id in range(len(vocab)):
+        counts = postings[term_id]
+        doc_ids.extend(counts.keys())
+        term_freqs.extend(counts.values())
+        indptr[term_id + 1] = len(doc_ids)
+    doc_freq = np.diff(indptr)
+    n_docs = len(documents)
+
+    index_dir.mkdir(parents=True, exist_ok=True)
+    _save_array(index_dir, "indptr", indptr)
+    _save_array(index_dir, "doc_ids", np.asarray(doc_ids, dtype=np.int32))
+    _save_array(index_dir, "term_freqs", np.asarray(term_freqs, dtype=np.float32))
+    _save_array(index_dir, "doc_lens", np.asarray([len(t) for t in tokenized], dtype=np.float32))
+    _save_array(index_dir, "idf", np.log(1 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32))
+    _save_array(index_dir, "embeddings", np.asarray((embed_fn or hashed_embeddings)(documents), dtype=np.float32))
+    (index_dir / "vocab.json").write_text(json.dumps(vocab), encoding="utf-8")
+    (index_dir / "chunks.json").write_text(json.dumps(chunks), encoding="utf-8")
+    # meta.json is written last, so a partially written index is rebuilt on the next start
+    meta_path.write_text(json.dumps({"source_hash": source_hash, "n_docs": n_docs}), encoding="utf-8")
+    return index_dir
+
+
+class LocalIndex:
+    """
+    Read-only hybrid BM25 and embedding index, memory-mapped from the files written by build_index.
+
+    :param index_dir (os.PathLike): The index directory.
+    :param embed_fn (Optional[EmbedFn]): The embedding function used at build time, None for hashed embeddings.
+    """
+
+    def __init__(self, index_dir: os.PathLike = DEFAULT_INDEX_DIR, embed_fn: Optional[EmbedFn] = None):
+        index_dir = Path(index_dir)
+        self._embed_fn = embed_fn or hashed_embeddings
+        self._indptr = np.load(index_dir / "indptr.npy", mmap_mode="r")
+        self._doc_ids = np.load(index_dir / "doc_ids.npy", mmap_mode="r")
+        self._term_freqs = np.load(index_dir / "term_freqs.npy", mmap_mode="r")
+        self._doc_lens = np.load(index_dir / "doc_lens.npy", mmap_mode="r")
+        self._idf = np.load(index_dir / "idf.npy", mmap_mode="r")
+        self._embeddings = np.load(index_dir / "embeddings.npy", mmap_mode="r")
+        self._vocab: Dict[str, int] = json.loads((index_dir / "vocab.json").read_text(encoding="utf-8"))
+        self._chunks: List[Dict[str, str]] = json.loads((index_dir / "chunks.json").read_text(encoding="utf-8"))
+        self._avg_doc_len = float(np.mean(self._doc_lens)) if len(self._doc_lens) else 0.0
+
+    def bm25_scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self._chunks), dtype=np.float32)
+        for token in set(tokenize(query)):
+            term_id = self._vocab.get(token)
+            if term_id is None:
+                continue
+            start, end = self._indptr[term_id], self._indptr[term_id + 1]
+            docs = self._doc_ids[start:end]
+            tf = self._term_freqs[start:end]
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_lens[docs] / self._avg_doc_len)
+            np.add.at(scores, docs, self._idf[term_id] * tf * (BM25_K1 + 1) / (tf + norm))
+        return scores
+
+    def embedding_scores(self, query: str) -> np.ndarray:
+        return np.asarray(self._embeddings @ self._embed_fn([query])[0])
+
+    def search(self, query: str, top_k: int = 3) -> List[Dict[str, object]]:
+        """
+        Return the best chunks for the query, fusing the BM25 and embedding rankings (reciprocal rank fusion).
+
+        :param query (str): The search query.
+        :param top_k (int): The number of chunks to return.
+        :return: The chunks with their fused score.
+        :rtype: List[Dict[str, object]]
+        """
+        if not self._chunks:
+            return []
+        fused = np.zeros(len(self._chunks), dtype=np.float64)
+        for scores in (self.bm25_scores(query), self.embedding_scores(query)):
+            ranks = np.empty(len(scores), dtype=np.int64)
+            ranks[np.argsort(-scores, kind="stable")] = np.arange(len(scores))
+            fused += 1.0 / (RRF_K + ranks + 1)
+        best = np.argsort(-fused, kind="stable")[:top_k]
+        return [dict(self._chunks[i], score=round(float(fused[i]), 5)) for i in best]
+
+
+_indexes: Dict[Any, LocalIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(
+    file_paths: Sequence[os.PathLike], index_dir: Optional[os.PathLike] = None, embed_fn: Optional[EmbedFn] = None
+) -> LocalIndex:
+    """
+    Return the index for the files, building it on first use in this process and loading it only once.
+
+    :param file_paths (Sequence[os.PathLike]): The markdown files.
+    :param index_dir (Optional[os.PathLike]): The index directory, None for a directory of the file set and embedding
+        under .cache/local_index.
+    :param embed_fn (Optional[EmbedFn]): The embedding function, None for hashed embeddings.
+    :return: The loaded index.
+    :rtype: LocalIndex
+    """
+    file_set_key = _file_set_key(file_paths, embed_fn)
+    if index_dir is None:
+        index_dir = DEFAULT_INDEX_DIR / file_set_key[:16]
+    key = (str(index_dir), file_set_key)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = LocalIndex(build_index(file_paths, index_dir, embed_fn), embed_fn)
+        return _indexes[key]
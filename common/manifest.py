@@ -0,0 +1,67 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+# Small helpers for the local JSON manifests kept in the .cache directory.
+
+CACHE_DIR = Path(__file__).resolve().parent.parent / ".cache"
+
+
+def load_manifest(path: os.PathLike) -> Dict[str, Any]:
+    """
+    Load a JSON manifest, returning an empty one if it doesn't exist or is corrupt.
+
+    :param path (os.PathLike): The manifest file.
+    :return: The manifest content.
+    :rtype: Dict[str, Any]
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(path: os.PathLike, content: Dict[str, Any]) -> None:
+    """
+    Atomically write a JSON manifest, so concurrent readers never see a partial file.
+
+    :param path (os.PathLike): The manifest file.
+    :param content (Dict[str, Any]): The manifest content.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(content, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def project_scope(conn_str: Optional[str] = None) -> str:
+    """The key under which the objects of a project are cached, derived from its connection string."""
+    conn_str = conn_str if conn_str is not None else os.environ.get("PROJECT_CONNECTION_STRING", "")
+    return hashlib.sha256(conn_str.encode("utf-8")).hexdigest()[:16]
+
+
+def client_scope(project_client: Any) -> str:
+    """
+    The cache key of the project a client talks to. A routed client (common/router.py) has its own key, since its
+    objects may live in any of its projects.
+
+    :param project_client (AIProjectClient): The sync or async project client, or a routed one.
+    :return: The key.
+    :rtype: str
+    """
+    router = getattr(project_client, "router", None)
+    if router is not None:
+        scopes = sorted(endpoint.scope for endpoint in router.endpoints)
+        return "routed-" + hashlib.sha256(";".join(scopes).encode("utf-8")).hexdigest()[:16]
+    config = getattr(getattr(project_client, "agents", None), "_config", None)
+    if config is None:
+        return project_scope()
+    # The connection string is "<HostName>;<AzureSubscriptionId>;<ResourceGroup>;<ProjectName>"
+    host = urlsplit(config.endpoint).netloc
+    return project_scope(f"{host};{config.subscription_id};{config.resource_group_name};{config.project_name}")
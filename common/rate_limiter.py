@@ -0,0 +1,295 @@
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from azure.core.exceptions import HttpResponseError
+
+# Scheduler for agent runs that keeps each model deployment close to its quota without failure storms.
+# Every deployment has two token buckets (requests per minute and tokens per minute) and an AIMD concurrency limit:
+# each successful run raises the limit by about one per round of runs (additive increase), a throttled one (HTTP 429,
+# or a run failed with "rate_limit_exceeded") halves it (multiplicative decrease) and pauses the deployment for the
+# Retry-After delay. Throttled runs are not dropped: they wait and are submitted again.
+#
+# The estimated tokens of a run are taken from the bucket when it starts, and corrected with the actual usage of the
+# run when it ends. Runs that fail for another reason give their slot back without changing the limit.
+#
+# Quotas not given explicitly come from the RATE_LIMIT_RPM and RATE_LIMIT_TPM environment variables; without them the
+# budget is not limited and only the concurrency limit applies.
+
+_RETRY_AFTER_RE = re.compile(r"(?:try again|retry after) in (\d+(?:\.\d+)?) second", re.IGNORECASE)
+
+
+def env_quota(name: str) -> Optional[float]:
+    """
+    A per minute quota from the environment.
+
+    :param name (str): The environment variable, e.g. RATE_LIMIT_RPM.
+    :return: The quota, None if not set (no limit).
+    :rtype: Optional[float]
+    """
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+
+def rate_limit_delay(result: Any) -> Tuple[bool, Optional[float]]:
+    """
+    Whether a run or an exception is a rate limit, and the delay the service asked for.
+
+    :param result (ThreadRun | Exception): The run returned by create_and_process_run, or the exception it raised.
+    :return: True if rate limited, and the Retry-After delay in seconds if known.
+    :rtype: Tuple[bool, Optional[float]]
+    """
+    if isinstance(result, HttpResponseError):
+        if result.status_code != 429:
+            return False, None
+        headers = result.response.headers if result.response is not None else {}
+        if headers.get("retry-after-ms"):
+            return True, float(headers["retry-after-ms"]) / 1000
+        retry_after = headers.get("retry-after")
+        return True, float(retry_after) if retry_after and retry_after.replace(".", "", 1).isdigit() else None
+
+    last_error = getattr(result, "last_error", None)
+    if getattr(result, "status", None) != "failed" or last_error is None:
+        return False, None
+    if last_error.code != "rate_limit_exceeded" and "rate limit" not in (last_error.message or "").lower():
+        return False, None
+    match = _RETRY_AFTER_RE.search(last_error.message or "")
+    return True, float(match.group(1)) if match else None
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously, allowed to go into debt when a reservation turns out too small.
+
+    :param per_minute (float): The refill rate, which is also the capacity.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.available = per_minute
+        self._rate = per_minute / 60.0
+        self._updated = time.monotonic()
+
+    def delay(self, amount: float) -> float:
+        """Seconds until amount is available (amounts over the capacity only need a full bucket)."""
+        self._refill()
+        missing = min(amount, self.capacity) - self.available
+        return max(0.0, missing / self._rate)
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.available -= amount
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self._updated) * self._rate)
+        self._updated = now
+
+
+class DeploymentLimiter:
+    """
+    Request and token budgets plus an AIMD concurrency limit for one model deployment.
+
+    :param requests_per_minute (Optional[float]): The request quota, None for no limit.
+    :param tokens_per_minute (Optional[float]): The token quota, None for no limit.
+    :param max_concurrency (int): The upper bound of the concurrency limit.
+    :param min_concurrency (int): The lower bound of the concurrency limit.
+    :param decrease_factor (float): The limit is multiplied by this on a rate limit.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float],
+        tokens_per_minute: Optional[float],
+        max_concurrency: int = 64,
+        min_concurrency: int = 1,
+        decrease_factor: float = 0.5,
+    ):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency = float(min(max_concurrency, max(min_concurrency, 4)))
+        self.in_flight = 0
+        self._decrease_factor = decrease_factor
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"started": 0, "completed": 0, "throttled": 0, "failed": 0}
+
+    def try_start(self, estimated_tokens: float) -> float:
+        """
+        Start a run if the budgets and the concurrency limit allow it.
+
+        :param estimated_tokens (float): The tokens the run is expected to use.
+        :return: 0 if the run may start now, otherwise the seconds to wait before trying again.
+        :rtype: float
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self.in_flight >= int(self.concurrency):
+                return 0.05
+            delay = max(
+                self.requests.delay(1) if self.requests else 0.0,
+                self.tokens.delay(estimated_tokens) if self.tokens else 0.0,
+            )
+            if delay > 0:
+                return delay
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(estimated_tokens)
+            self.in_flight += 1
+            self.stats["started"] += 1
+            return 0.0
+
+    def finish(self, throttled: bool, retry_after: Optional[float] = None, token_correction: float = 0.0) -> None:
+        """
+        Record the outcome of a started run and adapt the concurrency limit.
+
+        :param throttled (bool): Whether the run was rate limited.
+        :param retry_after (Optional[float]): How long to pause the deployment after a rate limit.
+        :param token_correction (float): Actual minus estimated tokens of the run.
+        """
+        with self._lock:
+            self.in_flight -= 1
+            if self.tokens:
+                self.tokens.take(token_correction)
+            now = time.monotonic()
+            if not throttled:
+                self.stats["completed"] += 1
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1.0 / self.concurrency)
+                return
+            self.stats["throttled"] += 1
+            self._paused_until = max(self._paused_until, now + (retry_after or 1.0))
+            # The runs in flight when the quota ran out all fail together; that is one signal, not many
+            if now - self._last_decrease > (retry_after or 1.0):
+                self.concurrency = max(self.min_concurrency, self.concurrency * self._decrease_factor)
+                self._last_decrease = now
+                logging.warning(f"Rate limited, concurrency limit lowered to {int(self.concurrency)}")
+
+    def release(self) -> None:
+        """Give back the slot of a started run that failed for another reason than a rate limit."""
+        with self._lock:
+            self.in_flight -= 1
+            self.stats["failed"] += 1
+
+
+class RunScheduler:
+    """
+    Submits agent runs through per-deployment limiters, retrying the rate limited ones.
+
+    :param limits (Optional[Dict[str, Tuple[float, float]]]): (requests per minute, tokens per minute) by deployment.
+    :param default_requests_per_minute (Optional[float]): The request quota of deployments not in limits, from
+        RATE_LIMIT_RPM if not given, no limit if neither is set.
+    :param default_tokens_per_minute (Optional[float]): The token quota of deployments not in limits, from
+        RATE_LIMIT_TPM if not given, no limit if neither is set.
+    :param max_concurrency (int): The upper bound of each deployment's concurrency limit.
+    :param max_attempts (int): Attempts per run before the last failure is returned.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+        default_requests_per_minute: Optional[float] = None,
+        default_tokens_per_minute: Optional[float] = None,
+        max_concurrency: int = 64,
+        max_attempts: int = 8,
+    ):
+        self._limits = limits or {}
+        self._defaults = (
+            default_requests_per_minute if default_requests_per_minute is not None else env_quota("RATE_LIMIT_RPM"),
+            default_tokens_per_minute if default_tokens_per_minute is not None else env_quota("RATE_LIMIT_TPM"),
+        )
+        self._max_concurrency = max_concurrency
+        self._max_attempts = max_attempts
+        self._limiters: Dict[str, DeploymentLimiter] = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, model: str) -> DeploymentLimiter:
+        with self._lock:
+            if model not in self._limiters:
+                requests_per_minute, tokens_per_minute = self._limits.get(model, self._defaults)
+                self._limiters[model] = DeploymentLimiter(requests_per_minute, tokens_per_minute, self._max_concurrency)
+            return self._limiters[model]
+
+    def submit_sync(self, model: str, run_fn: Callable[[], Any], estimated_tokens: float = 1000) -> Any:
+        """
+        Run run_fn (e.g. a create_and_process_run call) when the deployment has budget, retrying on rate limits.
+
+        :param model (str): The deployment the run uses.
+        :param run_fn (Callable[[], ThreadRun]): Starts the run and returns it once finished.
+        :param estimated_tokens (float): The tokens the run is expected to use.
+        :return: The run, the last failed one if all attempts were rate limited.
+        :rtype: ThreadRun
+        """
+        limiter = self.limiter(model)
+        for attempt in range(self._max_attempts):
+            delay = limiter.try_start(estimated_tokens)
+            while delay > 0:
+                time.sleep(delay)
+                delay = limiter.try_start(estimated_tokens)
+            try:
+                run = run_fn()
+            except HttpResponseError as e:
+                retry_delay = self._record(limiter, e, estimated_tokens, attempt)
+                if retry_delay is None:
+                    raise
+                continue
+            except BaseException:
+                # Any other failure, cancellation included, gives the slot back without counting as a success
+                limiter.release()
+                raise
+            retry_delay = self._record(limiter, run, estimated_tokens, attempt)
+            if retry_delay is None or attempt == self._max_attempts - 1:
+                return run
+        raise RuntimeError(f"Rate limited {self._max_attempts} times on {model}")
+
+    async def submit(self, model: str, run_fn: Callable[[], Awaitable[Any]], estimated_tokens: float = 1000) -> Any:
+        """
+        Async version of submit_sync, for the clients of azure.ai.projects.aio.
+
+        :param model (str): The deployment the run uses.
+        :param run_fn (Callable[[], Awaitable[ThreadRun]]): Starts the run and returns it once finished.
+        :param estimated_tokens (float): The tokens the run is expected to use.
+        :return: The run, the last failed one if all attempts were rate limited.
+        :rtype: ThreadRun
+        """
+        limiter = self.limiter(model)
+        for attempt in range(self._max_attempts):
+            delay = limiter.try_start(estimated_tokens)
+            while delay > 0:
+                await asyncio.sleep(delay)
+                delay = limiter.try_start(estimated_tokens)
+            try:
+                run = await run_fn()
+            except HttpResponseError as e:
+                retry_delay = self._record(limiter, e, estimated_tokens, attempt)
+                if retry_delay is None:
+                    raise
+                continue
+            except BaseException:
+                # Any other failure, cancellation included, gives the slot back without counting as a success
+                limiter.release()
+                raise
+            retry_delay = self._record(limiter, run, estimated_tokens, attempt)
+            if retry_delay is None or attempt == self._max_attempts - 1:
+                return run
+        raise RuntimeError(f"Rate limited {self._max_attempts} times on {model}")
+
+    @staticmethod
+    def _record(limiter: DeploymentLimiter, result: Any, estimated_tokens: float, attempt: int) -> Optional[float]:
+        # Returns None when the result is final, otherwise the delay for which the deployment is paused
+        throttled, retry_after = rate_limit_delay(result)
+        usage = getattr(result, "usage", None)
+        correction = usage.total_tokens - estimated_tokens if usage else 0.0
+        # Exponential backoff when the service didn't say how long to wait
+        delay = (retry_after if retry_after is not None else min(60.0, 2.0**attempt)) if throttled else None
+        limiter.finish(throttled, delay, correction)
+        return delay
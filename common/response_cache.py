@@ -0,0 +1,242 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from azure.ai.projects.models import Agent, ThreadMessage
+
+from common.agent_registry import definition_hash, to_jsonable
+from common.local_index import EmbedFn, embedding_id, inference_embeddings
+from common.manifest import CACHE_DIR
+
+# Opt-in cache of agent answers, for prompts that repeat (FAQ questions, fixed grounding questions, ...).
+# An answer is keyed by the agent definition hash and the normalised prompt, and stored with its annotations, so
+# citations are served from the cache too. How long it stays fresh depends on the tools of the agent: web grounding
+# changes quickly, an indexed file rarely. With similarity_threshold set, a prompt that misses the exact key can still
+# be answered by a cached prompt of the same agent whose embedding is close enough. That needs a semantic embedding
+# model: the hashed embeddings of common/local_index.py are lexical, "user ID 1" and "user ID 2" score 0.91 with them.
+
+# Freshness per tool type in seconds; an agent's answers expire after the shortest TTL of its tools
+DEFAULT_TOOL_TTLS = {
+    "bing_grounding": 15 * 60,
+    "function": 5 * 60,
+    "code_interpreter": 24 * 3600,
+    "file_search": 7 * 24 * 3600,
+}
+DEFAULT_TTL = 24 * 3600
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Lowercase the prompt, collapse whitespace and drop trailing punctuation, so trivial variations share a key."""
+    return _SPACE_RE.sub(" ", prompt.lower()).strip().rstrip("?!. ")
+
+
+def agent_hash(agent: Agent) -> str:
+    """
+    The definition hash of an agent, as recorded by the registry, or computed from the agent.
+
+    :param agent (Agent): The agent.
+    :return: The definition hash.
+    :rtype: str
+    """
+    recorded = (agent.metadata or {}).get("definition_hash")
+    if recorded:
+        return recorded
+    return definition_hash(agent.model, agent.name, agent.instructions, agent.tools, agent.tool_resources)
+
+
+class ResponseCache:
+    """
+    Caches the last assistant message of a run by agent definition and prompt.
+
+    :param project_client (AIProjectClient): The client used to run the agent on a cache miss.
+    :param path (os.PathLike): The SQLite database file.
+    :param tool_ttls (Optional[Dict[str, float]]): Freshness per tool type, merged over DEFAULT_TOOL_TTLS.
+    :param default_ttl (float): Freshness of answers of agents without tools.
+    :param similarity_threshold (Optional[float]): Cosine similarity above which a near-duplicate prompt is a hit,
+        None to only serve exact matches.
+    :param embed_fn (Optional[EmbedFn]): The embedding function of the similarity tier (e.g. inference_embeddings),
+        required with similarity_threshold.
+    :param scheduler (Optional[RunScheduler]): The scheduler runs of cache misses go through, None to run them directly.
+    :raises ValueError: When similarity_threshold is set without embed_fn.
+    """
+
+    def __init__(
+        self,
+        project_client,
+        path: os.PathLike = CACHE_DIR / "responses.db",
+        tool_ttls: Optional[Dict[str, float]] = None,
+        default_ttl: float = DEFAULT_TTL,
+        similarity_threshold: Optional[float] = None,
+        embed_fn: Optional[EmbedFn] = None,
+        scheduler: Optional[Any] = None,
+    ):
+        if similarity_threshold is not None and embed_fn is None:
+            raise ValueError("similarity_threshold needs the embed_fn of a semantic embedding model")
+        self._client = project_client
+        self._tool_ttls = {**DEFAULT_TOOL_TTLS, **(tool_ttls or {})}
+        self._default_ttl = default_ttl
+        self._similarity_threshold = similarity_threshold
+        self._embed_fn = embed_fn
+        self._embedder = embedding_id(embed_fn) if embed_fn is not None else None
+        self._scheduler = scheduler
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "similar_hits": 0, "misses": 0}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(str(path), timeout=5, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(responses)")]
+        if columns and "embedder" not in columns:
+            # Written by a version whose embeddings were hashed, they can't be compared with the new ones
+            self._db.execute("DROP TABLE responses")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, agent_hash TEXT, prompt TEXT, message TEXT, embedding BLOB, embedder TEXT, "
+            "expires REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_agent ON responses (agent_hash, expires)")
+
+    def ttl_for(self, agent: Agent) -> float:
+        """
+        How long the answers of an agent stay fresh: the shortest TTL of its tools.
+
+        :param agent (Agent): The agent.
+        :return: The TTL in seconds.
+        :rtype: float
+        """
+        ttls = [self._tool_ttls.get(tool["type"], self._default_ttl) for tool in to_jsonable(agent.tools or [])]
+        return min(ttls, default=self._default_ttl)
+
+    def get(self, agent: Agent, prompt: str) -> Optional[ThreadMessage]:
+        """
+        The cached answer to the prompt, if it is fresh.
+
+        :param agent (Agent): The agent.
+        :param prompt (str): The user prompt.
+        :return: The cached assistant message, or None.
+        :rtype: Optional[ThreadMessage]
+        """
+        agent_key = agent_hash(agent)
+        normalized = normalize_prompt(prompt)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT message FROM responses WHERE key = ? AND expires > ?", (self._key(agent_key, normalized), now)
+            ).fetchone()
+        if row is not None:
+            self.stats["hits"] += 1
+            return ThreadMessage(json.loads(row[0]))
+        if self._similarity_threshold is None:
+            return None
+
+        with self._lock:
+            # Only embeddings of the same model can be compared
+            rows = self._db.execute(
+                "SELECT message, embedding FROM responses WHERE agent_hash = ? AND embedder = ? AND expires > ?",
+                (agent_key, self._embedder, now),
+            ).fetchall()
+        if not rows:
+            return None
+        embeddings = np.stack([np.frombuffer(embedding, dtype=np.float32) for _, embedding in rows])
+        scores = embeddings @ self._embed_fn([normalized])[0]
+        best = int(np.argmax(scores))
+        if scores[best] < self._similarity_threshold:
+            return None
+        self.stats["similar_hits"] += 1
+        return ThreadMessage(json.loads(rows[best][0]))
+
+    def put(self, agent: Agent, prompt: str, message: ThreadMessage) -> None:
+        """
+        Store the answer to the prompt.
+
+        :param agent (Agent): The agent.
+        :param prompt (str): The user prompt.
+        :param message (ThreadMessage): The assistant message, with its annotations.
+        """
+        agent_key = agent_hash(agent)
+        normalized = normalize_prompt(prompt)
+        embedding = None
+        if self._embed_fn is not None:
+            embedding = np.asarray(self._embed_fn([normalized])[0], dtype=np.float32).tobytes()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, agent_hash, prompt, message, embedding, embedder, expires) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self._key(agent_key, normalized),
+                    agent_key,
+                    normalized,
+                    json.dumps(message.as_dict(), separators=(",", ":")),
+                    embedding,
+                    self._embedder,
+                    time.time() + self.ttl_for(agent),
+                ),
+            )
+            self._db.execute("DELETE FROM responses WHERE expires <= ?", (time.time(),))
+
+    def run(self, agent: Agent, prompt: str, **run_kwargs) -> Tuple[Optional[ThreadMessage], bool]:
+        """
+        Answer the prompt from the cache, or with a new thread and run of the agent.
+
+        :param agent (Agent): The agent.
+        :param prompt (str): The user prompt.
+        :param run_kwargs: Passed to create_and_process_run, e.g. toolset.
+        :return: The assistant message (None if the run did not complete), and whether it came from the cache.
+        :rtype: Tuple[Optional[ThreadMessage], bool]
+        """
+        cached = self.get(agent, prompt)
+        if cached is not None:
+            return cached, True
+
+        self.stats["misses"] += 1
+        thread = self._client.agents.create_thread()
+        self._client.agents.create_message(thread_id=thread.id, role="user", content=prompt)
+
+        def run_fn():
+            return self._client.agents.create_and_process_run(thread_id=thread.id, assistant_id=agent.id, **run_kwargs)
+
+        run = run_fn() if self._scheduler is None else self._scheduler.submit_sync(agent.model, run_fn)
+        if run.status != "completed":
+            logging.error(f"Run {run.status}: {run.last_error}")
+            return None, False
+        message = self._client.agents.list_messages(thread_id=thread.id).get_last_message_by_sender("assistant")
+        if message is not None:
+            self.put(agent, prompt, message)
+        return message, False
+
+    @staticmethod
+    def _key(agent_key: str, normalized_prompt: str) -> str:
+        return hashlib.sha256(f"{agent_key}\n{normalized_prompt}".encode("utf-8")).hexdigest()
+
+
+def response_cache_from_env(project_client, scheduler: Optional[Any] = None) -> ResponseCache:
+    """
+    The response cache of the scripts. RESPONSE_CACHE_SIMILARITY turns on the similarity tier, with the embedding
+    deployment RESPONSE_CACHE_EMBEDDING_MODEL (e.g. text-embedding-3-small).
+
+    :param project_client (AIProjectClient): The project client.
+    :param scheduler (Optional[RunScheduler]): The scheduler runs of cache misses go through.
+    :return: The cache.
+    :rtype: ResponseCache
+    :raises ValueError: When RESPONSE_CACHE_SIMILARITY is set without RESPONSE_CACHE_EMBEDDING_MODEL.
+    """
+    similarity = os.environ.get("RESPONSE_CACHE_SIMILARITY")
+    if not similarity:
+        return ResponseCache(project_client, scheduler=scheduler)
+    model = os.environ.get("RESPONSE_CACHE_EMBEDDING_MODEL")
+    if not model:
+        raise ValueError("RESPONSE_CACHE_SIMILARITY needs RESPONSE_CACHE_EMBEDDING_MODEL, an embedding deployment")
+    return ResponseCache(
+        project_client,
+        similarity_threshold=float(similarity),
+        embed_fn=inference_embeddings(project_client, model),
+        scheduler=scheduler,
+    )
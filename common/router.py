@@ -0,0 +1,784 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from azure.core.exceptions import AzureError, HttpResponseError, ResourceNotFoundError
+
+from common.manifest import CACHE_DIR, load_manifest, project_scope, save_manifest
+from common.rate_limiter import rate_limit_delay
+
+# Latency-aware routing of the Agents API across several projects and model deployments.
+# The endpoints come from AGENT_ENDPOINTS, a JSON list (inline, or the path of a JSON file) such as
+#   [{"name": "eastus", "connection_string": "...", "weight": 2},
+#    {"name": "swedencentral", "connection_string": "...", "deployments": {"gpt-4o-mini": "gpt-4o-mini-se"}}]
+# "deployments" maps a requested model to its deployment name in the endpoint's project; models it doesn't list are
+# used as requested, so agents of different models (e.g. the small and large agents of common/cascade.py) keep their
+# model on every endpoint. An entry without connection string uses PROJECT_CONNECTION_STRING, so several deployments
+# of one project can share its quota too. Every endpoint keeps a moving average (EWMA) of its call latency, its run latency and its error rate
+# (429, 5xx, network errors, runs failed on rate limits or server errors). A new thread goes to the better of two
+# endpoints picked at random by weight ("power of two choices": the healthiest endpoint gets most of the traffic, the
+# others still get some, plus a few purely random choices, so they keep being measured). A thread then stays on the project that owns it, and each of its runs goes to the
+# healthiest deployment of that project.
+#
+# RoutedProjectClient has the same agents operations as AIProjectClient, so scripts don't change besides creating the
+# client with create_project_client. An agent is created on the chosen project; when a thread of another project
+# runs it, an equivalent agent is created there once and reused. Thread owners are kept in .cache/router.db and agent
+# copies in .cache/routed_agents.json, so they survive restarts. Files and vector stores belong to one project: the
+# calls that aren't about a thread, an agent or a file go to the first endpoint, and agents with tool resources (e.g.
+# file search vector stores) can't be copied to another project. Files are looked up in each project.
+
+DEFAULT_ROUTER_DB = CACHE_DIR / "router.db"
+DEFAULT_AGENT_COPIES_PATH = CACHE_DIR / "routed_agents.json"
+
+# Operations whose first argument is a thread ID
+THREAD_OPERATIONS = {
+    "get_thread",
+    "update_thread",
+    "delete_thread",
+    "create_message",
+    "get_message",
+    "update_message",
+    "list_messages",
+    "get_run",
+    "update_run",
+    "cancel_run",
+    "list_runs",
+    "submit_tool_outputs_to_run",
+    "submit_tool_outputs_to_stream",
+    "list_run_steps",
+    "get_run_step",
+}
+RUN_OPERATIONS = {"create_run", "create_and_process_run", "create_stream"}
+AGENT_OPERATIONS = {"get_agent", "update_agent", "delete_agent"}
+# Operations on a file, which may have been generated in any project (e.g. by code interpreter)
+FILE_OPERATIONS = {"get_file", "get_file_content", "save_file", "delete_file"}
+
+
+class Endpoint:
+    """
+    A model deployment in a project, with the moving averages used to route to it.
+
+    :param name (str): The name shown in logs and stats.
+    :param connection_string (str): The connection string of the project.
+    :param deployments (Optional[Dict[str, str]]): The deployment name of requested models, None to keep them all.
+    :param weight (float): The share of traffic relative to the other endpoints when they are equally healthy.
+    :param alpha (float): The weight of a new sample in the moving averages.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        connection_string: str,
+        deployments: Optional[Dict[str, str]] = None,
+        weight: float = 1.0,
+        alpha: float = 0.2,
+    ):
+        self.name = name
+        self.connection_string = connection_string
+        self.scope = project_scope(connection_string)
+        self.deployments = deployments or {}
+        self.weight = weight
+        self.latency: Optional[float] = None
+        self.run_latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+        self._alpha = alpha
+        self._lock = threading.Lock()
+
+    def deployment(self, model: str) -> str:
+        """The deployment serving a requested model on this endpoint."""
+        return self.deployments.get(model, model)
+
+    def start(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+
+    def finish(self, seconds: float, failed: bool, run: bool = False) -> None:
+        """
+        Record the outcome of a call started with start().
+
+        :param seconds (float): The duration of the call.
+        :param failed (bool): Whether the call failed on the service side.
+        :param run (bool): Whether the call was a whole run, whose latency is averaged separately.
+        """
+        with self._lock:
+            self.in_flight -= 1
+            self.calls += 1
+            self.errors += int(failed)
+            self.error_rate += self._alpha * (float(failed) - self.error_rate)
+            # Failures are often fast, they must not make the endpoint look quicker
+            if not failed:
+                previous = self.run_latency if run else self.latency
+                value = seconds if previous is None else previous + self._alpha * (seconds - previous)
+                if run:
+                    self.run_latency = value
+                else:
+                    self.latency = value
+
+    def score(self, use_run_latency: bool) -> float:
+        """Lower is better. Endpoints without samples score best, so they get measured."""
+        latency = (self.run_latency if use_run_latency else self.latency) or 0.0
+        return (latency + 0.05) * (1 + self.in_flight) * (1 + 10 * self.error_rate) / self.weight
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "deployments": self.deployments,
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "run_latency": round(self.run_latency, 3) if self.run_latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "errors": self.errors,
+        }
+
+
+def load_endpoints(spec: Optional[str] = None) -> List[Endpoint]:
+    """
+    Parse the endpoint pool.
+
+    :param spec (Optional[str]): A JSON list or the path of a JSON file, None for AGENT_ENDPOINTS.
+    :return: The endpoints, empty if none are configured.
+    :rtype: List[Endpoint]
+    """
+    spec = spec if spec is not None else os.environ.get("AGENT_ENDPOINTS", "")
+    if not spec.strip():
+        return []
+    if not spec.lstrip().startswith("["):
+        with open(spec, encoding="utf-8") as f:
+            spec = f.read()
+    endpoints = []
+    for index, entry in enumerate(json.loads(spec)):
+        connection_string = entry.get("connection_string") or os.environ["PROJECT_CONNECTION_STRING"]
+        endpoints.append(Endpoint(
+            name=entry.get("name", f"endpoint-{index}"),
+            connection_string=connection_string,
+            deployments=entry.get("deployments"),
+            weight=float(entry.get("weight", 1.0)),
+        ))
+    return endpoints
+
+
+def is_service_failure(result: Any) -> bool:
+    """
+    Whether a call result or exception says something about the health of the endpoint.
+
+    :param result (Any | Exception): What the call returned or raised.
+    :return: True for rate limits, server errors and network errors, False for success and client errors.
+    :rtype: bool
+    """
+    if isinstance(result, HttpResponseError):
+        return result.status_code is None or result.status_code == 429 or result.status_code >= 500
+    if isinstance(result, AzureError):
+        return True
+    if rate_limit_delay(result)[0]:
+        return True
+    last_error = getattr(result, "last_error", None)
+    return getattr(result, "status", None) == "failed" and last_error is not None and last_error.code == "server_error"
+
+
+class ThreadOwnerStore:
+    """
+    Which project each thread belongs to, shared by all processes using the same file.
+
+    :param path (os.PathLike): The SQLite database file.
+    """
+
+    def __init__(self, path: os.PathLike = DEFAULT_ROUTER_DB):
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(str(path), timeout=5, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS thread_owners (thread_id TEXT PRIMARY KEY, scope TEXT, created REAL)")
+
+    def put(self, thread_id: str, scope: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO thread_owners (thread_id, scope, created) VALUES (?, ?, ?)",
+                (thread_id, scope, time.time()),
+            )
+
+    def get(self, thread_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT scope FROM thread_owners WHERE thread_id = ?", (thread_id,)).fetchone()
+        return row[0] if row else None
+
+    def delete(self, thread_id: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM thread_owners WHERE thread_id = ?", (thread_id,))
+
+
+class EndpointRouter:
+    """
+    Chooses endpoints and remembers which project owns each thread and agent.
+
+    :param endpoints (List[Endpoint]): The pool, the first endpoint's project gets the calls that can't be routed.
+    :param store (Optional[ThreadOwnerStore]): Where thread owners are kept, None for the default file.
+    :param agent_copies_path (os.PathLike): The manifest of the agents copied to other projects.
+    :param explore_ratio (float): Share of choices made at random by weight, so an endpoint that recovered is noticed.
+    """
+
+    def __init__(
+        self,
+        endpoints: List[Endpoint],
+        store: Optional[ThreadOwnerStore] = None,
+        agent_copies_path: os.PathLike = DEFAULT_AGENT_COPIES_PATH,
+        explore_ratio: float = 0.05,
+    ):
+        if not endpoints:
+            raise ValueError("The router needs at least one endpoint")
+        self.endpoints = endpoints
+        self.primary = endpoints[0]
+        self._store = store or ThreadOwnerStore()
+        self._agent_copies_path = agent_copies_path
+        self._explore_ratio = explore_ratio
+        self._thread_scopes: Dict[str, str] = {}
+        self._agent_scopes: Dict[str, str] = {}
+        self._agent_models: Dict[str, str] = {}
+        self.file_scopes: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def scopes(self) -> List[str]:
+        return list(dict.fromkeys(e.scope for e in self.endpoints))
+
+    def choose(self, scope: Optional[str] = None) -> Endpoint:
+        """
+        Pick an endpoint: the better of two drawn at random by weight.
+
+        :param scope (Optional[str]): Only consider the endpoints of this project, None for all.
+        :return: The endpoint.
+        :rtype: Endpoint
+        """
+        candidates = [e for e in self.endpoints if scope is None or e.scope == scope]
+        if not candidates:
+            raise ValueError(f"No endpoint for project {scope}")
+        if len(candidates) == 1:
+            return candidates[0]
+        first = random.choices(candidates, weights=[e.weight for e in candidates])[0]
+        if random.random() < self._explore_ratio:
+            return first
+        others = [e for e in candidates if e is not first]
+        second = random.choices(others, weights=[e.weight for e in others])[0]
+        # Runs take much longer than other calls, compare them only when both endpoints have run samples
+        use_run_latency = first.run_latency is not None and second.run_latency is not None
+        return min((first, second), key=lambda e: e.score(use_run_latency))
+
+    def assign_thread(self, thread_id: str, scope: str) -> None:
+        self._thread_scopes[thread_id] = scope
+        self._store.put(thread_id, scope)
+
+    def thread_scope(self, thread_id: str) -> str:
+        """The project owning a thread, the first endpoint's project for threads the router never saw."""
+        scope = self._thread_scopes.get(thread_id)
+        if scope is None:
+            scope = self._store.get(thread_id) or self.primary.scope
+            self._thread_scopes[thread_id] = scope
+        return scope
+
+    def forget_thread(self, thread_id: str) -> None:
+        self._thread_scopes.pop(thread_id, None)
+        self._store.delete(thread_id)
+
+    def assign_agent(self, agent_id: str, scope: str, model: Optional[str] = None) -> None:
+        self._agent_scopes[agent_id] = scope
+        if model is not None:
+            self._agent_models[agent_id] = model
+
+    def agent_model(self, agent_id: str, deployment: Optional[str] = None) -> Optional[str]:
+        """
+        The model an agent was requested with.
+
+        :param agent_id (str): The agent.
+        :param deployment (Optional[str]): The model of the agent as the service reports it, if known.
+        :return: The requested model, None if unknown.
+        :rtype: Optional[str]
+        """
+        model = self._agent_models.get(agent_id)
+        if model is not None or deployment is None:
+            return model
+        # Agents created by an earlier process: the deployment name is mapped back to the model it serves
+        for endpoint in self.endpoints:
+            for requested, name in endpoint.deployments.items():
+                if name == deployment:
+                    return requested
+        return deployment
+
+    def agent_scope(self, agent_id: str) -> Optional[str]:
+        return self._agent_scopes.get(agent_id)
+
+    def agent_copy(self, agent_id: str, scope: str) -> Optional[str]:
+        with self._lock:
+            return load_manifest(self._agent_copies_path).get(f"{agent_id}@{scope}")
+
+    def remember_agent_copy(self, agent_id: str, scope: str, copy_id: str) -> None:
+        with self._lock:
+            copies = load_manifest(self._agent_copies_path)
+            copies[f"{agent_id}@{scope}"] = copy_id
+            save_manifest(self._agent_copies_path, copies)
+        self._agent_scopes[copy_id] = scope
+
+    def forget_agent_copies(self, agent_id: str) -> List[str]:
+        """Drop the copies of an agent from the manifest and return their keys (agent_id@scope)."""
+        with self._lock:
+            copies = load_manifest(self._agent_copies_path)
+            keys = [key for key in copies if key.startswith(f"{agent_id}@")]
+            removed = {key: copies.pop(key) for key in keys}
+            save_manifest(self._agent_copies_path, copies)
+        return [f"{copy_id}@{key.split('@', 1)[1]}" for key, copy_id in removed.items()]
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [e.stats() for e in self.endpoints]
+
+
+def agent_copy_kwargs(agent: Any, deployment: Optional[str]) -> Dict[str, Any]:
+    """
+    The create_agent arguments of an equivalent agent in another project.
+
+    :param agent (Agent): The agent to copy.
+    :param deployment (Optional[str]): The model deployment of the copy, None for the agent's model.
+    :return: The arguments of create_agent.
+    :rtype: Dict[str, Any]
+    :raises ValueError: When the agent uses resources (vector stores, files) that only exist in its own project.
+    """
+    resources = agent.tool_resources.as_dict() if agent.tool_resources else {}
+    # e.g. {"code_interpreter": {"file_ids": []}} is set on agents without any file, and can be copied
+    if any(ids for resource in resources.values() for ids in (resource or {}).values()):
+        raise ValueError(f"Agent {agent.id} uses tool resources of its project and can't be copied to another project")
+    return {
+        "model": deployment or agent.model,
+        "name": agent.name,
+        "instructions": agent.instructions,
+        "tools": agent.tools,
+        "temperature": agent.temperature,
+        "top_p": agent.top_p,
+        "response_format": agent.response_format,
+        "metadata": {**(agent.metadata or {}), "routed_from": agent.id},
+    }
+
+
+def _thread_id(args: tuple, kwargs: Dict[str, Any]) -> str:
+    return kwargs["thread_id"] if "thread_id" in kwargs else args[0]
+
+
+def _agent_id(args: tuple, kwargs: Dict[str, Any]) -> str:
+    return kwargs["assistant_id"] if "assistant_id" in kwargs else args[0]
+
+
+def _map_model(endpoint: Endpoint, model: Optional[str], kwargs: Dict[str, Any]) -> None:
+    # The requested model (the one of the call, else the agent's) is kept, only renamed to its deployment on endpoint
+    model = kwargs.get("model") or model
+    if model is not None and model in endpoint.deployments:
+        kwargs["model"] = endpoint.deployments[model]
+
+
+class RoutedAgents:
+    """
+    Drop-in replacement of AIProjectClient.agents that routes every call to the right project and deployment.
+
+    :param router (EndpointRouter): The router.
+    :param clients (Dict[str, AIProjectClient]): One client per project, by scope.
+    """
+
+    def __init__(self, router: EndpointRouter, clients: Dict[str, Any]):
+        self._router = router
+        self._clients = clients
+        self._toolset: Dict[str, Any] = {}
+        self._copy_lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        if name in THREAD_OPERATIONS:
+            return functools.partial(self._thread_call, name)
+        if name in RUN_OPERATIONS:
+            return functools.partial(self._run_call, name)
+        if name in AGENT_OPERATIONS:
+            return functools.partial(self._agent_call, name)
+        if name in FILE_OPERATIONS:
+            return functools.partial(self._file_call, name)
+        # Uploads, vector stores and listings go to the first endpoint's project
+        return getattr(self._clients[self._router.primary.scope].agents, name)
+
+    def _timed(self, endpoint: Endpoint, call: Callable[[], Any], run: bool = False) -> Any:
+        endpoint.start()
+        start = time.perf_counter()
+        try:
+            result = call()
+        except Exception as e:
+            endpoint.finish(time.perf_counter() - start, is_service_failure(e), run)
+            raise
+        endpoint.finish(time.perf_counter() - start, is_service_failure(result), run)
+        return result
+
+    def create_thread(self, *args: Any, **kwargs: Any) -> Any:
+        endpoint = self._router.choose()
+        thread = self._timed(endpoint, lambda: self._clients[endpoint.scope].agents.create_thread(*args, **kwargs))
+        self._router.assign_thread(thread.id, endpoint.scope)
+        logging.info(f"Thread {thread.id} created on {endpoint.name}")
+        return thread
+
+    def create_agent(self, *args: Any, **kwargs: Any) -> Any:
+        endpoint = self._router.choose()
+        model = kwargs.get("model")
+        _map_model(endpoint, model, kwargs)
+        agents = self._clients[endpoint.scope].agents
+        agent = self._timed(endpoint, lambda: agents.create_agent(*args, **kwargs))
+        self._router.assign_agent(agent.id, endpoint.scope, model)
+        if agent.id in agents._toolset:
+            self._toolset[agent.id] = agents._toolset[agent.id]
+        return agent
+
+    def create_thread_and_run(self, *args: Any, **kwargs: Any) -> Any:
+        endpoint = self._router.choose()
+        agent_id = kwargs["assistant_id"]
+        kwargs["assistant_id"] = self._resolve_agent(endpoint.scope, agent_id)
+        _map_model(endpoint, self._router.agent_model(agent_id), kwargs)
+        run = self._timed(endpoint, lambda: self._clients[endpoint.scope].agents.create_thread_and_run(*args, **kwargs))
+        self._router.assign_thread(run.thread_id, endpoint.scope)
+        return run
+
+    def _thread_call(self, name: str, *args: Any, **kwargs: Any) -> Any:
+        thread_id = _thread_id(args, kwargs)
+        scope = self._router.thread_scope(thread_id)
+        endpoint = self._router.choose(scope)
+        result = self._timed(endpoint, lambda: getattr(self._clients[scope].agents, name)(*args, **kwargs))
+        if name == "delete_thread":
+            self._router.forget_thread(thread_id)
+        return result
+
+    def _run_call(self, name: str, *args: Any, **kwargs: Any) -> Any:
+        scope = self._router.thread_scope(_thread_id(args, kwargs))
+        endpoint = self._router.choose(scope)
+        agent_id = kwargs["assistant_id"]
+        kwargs["assistant_id"] = self._resolve_agent(scope, agent_id)
+        _map_model(endpoint, self._router.agent_model(agent_id), kwargs)
+        agents = self._clients[scope].agents
+        if agent_id in self._toolset:
+            agents._toolset[kwargs["assistant_id"]] = self._toolset[agent_id]
+        # create_and_process_run returns once the run is over, so its duration is the run latency
+        return self._timed(
+            endpoint, lambda: getattr(agents, name)(*args, **kwargs), run=name == "create_and_process_run"
+        )
+
+    def _agent_call(self, name: str, *args: Any, **kwargs: Any) -> Any:
+        agent_id = _agent_id(args, kwargs)
+        scope = self._router.agent_scope(agent_id) or self._find_agent(agent_id)
+        endpoint = self._router.choose(scope)
+        result = self._timed(endpoint, lambda: getattr(self._clients[scope].agents, name)(*args, **kwargs))
+        if name == "delete_agent":
+            for key in self._router.forget_agent_copies(agent_id):
+                copy_id, copy_scope = key.split("@", 1)
+                try:
+                    self._clients[copy_scope].agents.delete_agent(copy_id)
+                except ResourceNotFoundError:
+                    pass
+        return result
+
+    def _file_call(self, name: str, *args: Any, **kwargs: Any) -> Any:
+        file_id = kwargs["file_id"] if "file_id" in kwargs else args[0]
+        known = self._router.file_scopes.get(file_id)
+        for scope in [known] if known else self._router.scopes:
+            try:
+                result = getattr(self._clients[scope].agents, name)(*args, **kwargs)
+            except ResourceNotFoundError:
+                if known:
+                    raise
+                continue
+            self._router.file_scopes[file_id] = scope
+            return result
+        raise ResourceNotFoundError(f"File {file_id} was not found in any project of the router")
+
+    def _find_agent(self, agent_id: str, first_scope: Optional[str] = None) -> str:
+        # Agents created in an earlier process (e.g. cached by the registry) are looked up in each project
+        scopes = self._router.scopes
+        if first_scope is not None:
+            scopes = [first_scope] + [s for s in scopes if s != first_scope]
+        for scope in scopes:
+            try:
+                self._clients[scope].agents.get_agent(agent_id)
+            except ResourceNotFoundError:
+                continue
+            self._router.assign_agent(agent_id, scope)
+            return scope
+        raise ValueError(f"Agent {agent_id} was not found in any project of the router")
+
+    def _resolve_agent(self, scope: str, agent_id: str) -> str:
+        # The ID of the agent, or of its copy, in the project of scope
+        copy_id = self._router.agent_copy(agent_id, scope)
+        if copy_id is not None:
+            return copy_id
+        owner = self._router.agent_scope(agent_id) or self._find_agent(agent_id, first_scope=scope)
+        if owner == scope:
+            return agent_id
+        with self._copy_lock:
+            copy_id = self._router.agent_copy(agent_id, scope)
+            if copy_id is None:
+                source = self._clients[owner].agents.get_agent(agent_id)
+                model = self._router.agent_model(agent_id, source.model)
+                kwargs = agent_copy_kwargs(source, self._router.choose(scope).deployment(model))
+                copy_id = self._clients[scope].agents.create_agent(**kwargs).id
+                self._router.remember_agent_copy(agent_id, scope, copy_id)
+                logging.info(f"Copied agent {agent_id} to {copy_id} for project {scope}")
+        return copy_id
+
+
+class AsyncRoutedAgents(RoutedAgents):
+    """
+    Same as RoutedAgents, for the async clients from azure.ai.projects.aio.
+
+    :param router (EndpointRouter): The router.
+    :param clients (Dict[str, AIProjectClient]): One async client per project, by scope.
+    """
+
+    def __init__(self, router: EndpointRouter, clients: Dict[str, Any]):
+        super().__init__(router, clients)
+        self._copy_lock = asyncio.Lock()
+
+    async def _timed(self, endpoint: Endpoint, call: Callable[[], Any], run: bool = False) -> Any:
+        endpoint.start()
+        start = time.perf_counter()
+        try:
+            result = await call()
+        except Exception as e:
+            endpoint.finish(time.perf_counter() - start, is_service_failure(e), run)
+            raise
+        endpoint.finish(time.perf_counter() - start, is_service_failure(result), run)
+        return result
+
+    async def create_thread(self, *args: Any, **kwargs: Any) -> Any:
+        endpoint = self._router.choose()
+        thread = await self._timed(endpoint, lambda: self._clients[endpoint.scope].agents.create_thread(*args, **kwargs))
+        self._router.assign_thread(thread.id, endpoint.scope)
+        return thread
+
+    async def create_agent(self, *args: Any, **kwargs: Any) -> Any:
+        endpoint = self._router.choose()
+        model = kwargs.get("model")
+        _map_model(endpoint, model, kwargs)
+        agents = self._clients[endpoint.scope].agents
+        agent = await self._timed(endpoint, lambda: agents.create_agent(*args, **kwargs))
+        self._router.assign_agent(agent.id, endpoint.scope, model)
+        if agent.id in agents._toolset:
+            self._toolset[agent.id] = agents._toolset[agent.id]
+        return agent
+
+    async def create_thread_and_run(self, *args: Any, **kwargs: Any) -> Any:
+        endpoint = self._router.choose()
+        agent_id = kwargs["assistant_id"]
+        kwargs["assistant_id"] = await self._resolve_agent(endpoint.scope, agent_id)
+        _map_model(endpoint, self._router.agent_model(agent_id), kwargs)
+        run = await self._timed(
+            endpoint, lambda: self._clients[endpoint.scope].agents.create_thread_and_run(*args, **kwargs)
+        )
+        self._router.assign_thread(run.thread_id, endpoint.scope)
+        return run
+
+    async def _thread_call(self, name: str, *args: Any, **kwargs: Any) -> Any:
+        thread_id = _thread_id(args, kwargs)
+        scope = self._router.thread_scope(thread_id)
+        endpoint = self._router.choose(scope)
+        result = await self._timed(endpoint, lambda: getattr(self._clients[scope].agents, name)(*args, **kwargs))
+        if name == "delete_thread":
+            self._router.forget_thread(thread_id)
+        return result
+
+    async def _run_call(self, name: str, *args: Any, **kwargs: Any) -> Any:
+        scope = self._router.thread_scope(_thread_id(args, kwargs))
+        endpoint = self._router.choose(scope)
+        agent_id = kwargs["assistant_id"]
+        kwargs["assistant_id"] = await self._resolve_agent(scope, agent_id)
+        _map_model(endpoint, self._router.agent_model(agent_id), kwargs)
+        agents = self._clients[scope].agents
+        if agent_id in self._toolset:
+            agents._toolset[kwargs["assistant_id"]] = self._toolset[agent_id]
+        return await self._timed(
+            endpoint, lambda: getattr(agents, name)(*args, **kwargs), run=name == "create_and_process_run"
+        )
+
+    async def _agent_call(self, name: str, *args: Any, **kwargs: Any) -> Any:
+        agent_id = _agent_id(args, kwargs)
+        scope = self._router.agent_scope(agent_id) or await self._find_agent(agent_id)
+        endpoint = self._router.choose(scope)
+        result = await self._timed(endpoint, lambda: getattr(self._clients[scope].agents, name)(*args, **kwargs))
+        if name == "delete_agent":
+            for key in self._router.forget_agent_copies(agent_id):
+                copy_id, copy_scope = key.split("@", 1)
+                try:
+                    await self._clients[copy_scope].agents.delete_agent(copy_id)
+                except ResourceNotFoundError:
+                    pass
+        return result
+
+    async def _file_call(self, name: str, *args: Any, **kwargs: Any) -> Any:
+        file_id = kwargs["file_id"] if "file_id" in kwargs else args[0]
+        known = self._router.file_scopes.get(file_id)
+        for scope in [known] if known else self._router.scopes:
+            try:
+                result = await getattr(self._clients[scope].agents, name)(*args, **kwargs)
+            except ResourceNotFoundError:
+                if known:
+                    raise
+                continue
+            self._router.file_scopes[file_id] = scope
+            return result
+        raise ResourceNotFoundError(f"File {file_id} was not found in any project of the router")
+
+    async def _find_agent(self, agent_id: str, first_scope: Optional[str] = None) -> str:
+        scopes = self._router.scopes
+        if first_scope is not None:
+            scopes = [first_scope] + [s for s in scopes if s != first_scope]
+        for scope in scopes:
+            try:
+                await self._clients[scope].agents.get_agent(agent_id)
+            except ResourceNotFoundError:
+                continue
+            self._router.assign_agent(agent_id, scope)
+            return scope
+        raise ValueError(f"Agent {agent_id} was not found in any project of the router")
+
+    async def _resolve_agent(self, scope: str, agent_id: str) -> str:
+        copy_id = self._router.agent_copy(agent_id, scope)
+        if copy_id is not None:
+            return copy_id
+        owner = self._router.agent_scope(agent_id) or await self._find_agent(agent_id, first_scope=scope)
+        if owner == scope:
+            return agent_id
+        async with self._copy_lock:
+            copy_id = self._router.agent_copy(agent_id, scope)
+            if copy_id is None:
+                source = await self._clients[owner].agents.get_agent(agent_id)
+                model = self._router.agent_model(agent_id, source.model)
+                kwargs = agent_copy_kwargs(source, self._router.choose(scope).deployment(model))
+                copy_id = (await self._clients[scope].agents.create_agent(**kwargs)).id
+                self._router.remember_agent_copy(agent_id, scope, copy_id)
+                logging.info(f"Copied agent {agent_id} to {copy_id} for project {scope}")
+        return copy_id
+
+
+class RoutedProjectClient:
+    """
+    A project client spreading threads and runs over the endpoints of a router. Anything but agents (telemetry,
+    connections, ...) is served by the first endpoint's project.
+
+    :param router (EndpointRouter): The router.
+    :param credential (TokenCredential): The credential of all projects.
+    :param client_kwargs (Any): More arguments of AIProjectClient.from_connection_string, e.g. a transport.
+    """
+
+    def __init__(self, router: EndpointRouter, credential: Any, **client_kwargs: Any):
+        from azure.ai.projects import AIProjectClient
+
+        self.router = router
+        self._clients = {
+            e.scope: AIProjectClient.from_connection_string(conn_str=e.connection_string, credential=credential, **client_kwargs)
+            for e in router.endpoints
+        }
+        self.agents = RoutedAgents(router, self._clients)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._clients[self.router.primary.scope], name)
+
+    def thread_client(self, thread_id: str) -> Any:
+        """The client of the project owning a thread, for calls the routed agents don't cover."""
+        return self._clients[self.router.thread_scope(thread_id)]
+
+    def close(self) -> None:
+        for client in self._clients.values():
+            client.close()
+
+    def __enter__(self) -> "RoutedProjectClient":
+        for client in self._clients.values():
+            client.__enter__()
+        return self
+
+    def __exit__(self, *exc_details: Any) -> None:
+        for client in self._clients.values():
+            client.__exit__(*exc_details)
+
+
+class AsyncRoutedProjectClient:
+    """
+    Same as RoutedProjectClient, with the async clients from azure.ai.projects.aio.
+
+    :param router (EndpointRouter): The router.
+    :param credential (AsyncTokenCredential): The credential of all projects.
+    :param client_kwargs (Any): More arguments of AIProjectClient.from_connection_string.
+    """
+
+    def __init__(self, router: EndpointRouter, credential: Any, **client_kwargs: Any):
+        from azure.ai.projects.aio import AIProjectClient
+
+        self.router = router
+        self._clients = {
+            e.scope: AIProjectClient.from_connection_string(conn_str=e.connection_string, credential=credential, **client_kwargs)
+            for e in router.endpoints
+        }
+        self.agents = AsyncRoutedAgents(router, self._clients)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._clients[self.router.primary.scope], name)
+
+    def thread_client(self, thread_id: str) -> Any:
+        """The client of the project owning a thread, for calls the routed agents don't cover."""
+        return self._clients[self.router.thread_scope(thread_id)]
+
+    async def close(self) -> None:
+        for client in self._clients.values():
+            await client.close()
+
+    async def __aenter__(self) -> "AsyncRoutedProjectClient":
+        for client in self._clients.values():
+            await client.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_details: Any) -> None:
+        for client in self._clients.values():
+            await client.__aexit__(*exc_details)
+
+
+def create_project_client(credential: Any, conn_str: Optional[str] = None, **client_kwargs: Any) -> Any:
+    """
+    The project client of the scripts: routed when AGENT_ENDPOINTS is set, a plain AIProjectClient otherwise.
+
+    :param credential (TokenCredential): The credential.
+    :param conn_str (Optional[str]): The connection string of the single project, None for PROJECT_CONNECTION_STRING.
+    :param client_kwargs (Any): More arguments of AIProjectClient.from_connection_string.
+    :return: The client.
+    :rtype: AIProjectClient | RoutedProjectClient
+    """
+    endpoints = load_endpoints()
+    if endpoints:
+        return RoutedProjectClient(EndpointRouter(endpoints), credential, **client_kwargs)
+    from azure.ai.projects import AIProjectClient
+
+    return AIProjectClient.from_connection_string(
+        conn_str=conn_str or os.environ["PROJECT_CONNECTION_STRING"], credential=credential, **client_kwargs
+    )
+
+
+def create_async_project_client(credential: Any, conn_str: Optional[str] = None, **client_kwargs: Any) -> Any:
+    """
+    Same as create_project_client, with the async clients from azure.ai.projects.aio.
+
+    :param credential (AsyncTokenCredential): The credential.
+    :param conn_str (Optional[str]): The connection string of the single project, None for PROJECT_CONNECTION_STRING.
+    :param client_kwargs (Any): More arguments of AIProjectClient.from_connection_string.
+    :return: The client.
+    :rtype: AIProjectClient | AsyncRoutedProjectClient
+    """
+    endpoints = load_endpoints()
+    if endpoints:
+        return AsyncRoutedProjectClient(EndpointRouter(endpoints), credential, **client_kwargs)
+    from azure.ai.projects.aio import AIProjectClient
+
+    return AIProjectClient.from_connection_string(
+        conn_str=conn_str or os.environ["PROJECT_CONNECTION_STRING"], credential=credential, **client_kwargs
+    )
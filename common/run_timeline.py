@@ -0,0 +1,399 @@
+import csv
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from opentelemetry import metrics
+
+from common.instrumentation import LatencySummary
+from common.response_cache import normalize_prompt
+
+# Post-run analysis: where the time and the tokens of a run went.
+# After a run finishes its steps are listed, and a timeline is built from the run and step timestamps:
+# - queue: from the creation of the run until it started,
+# - tool: the tool_calls steps; for function tools this includes running the function and submitting its output,
+# - model: the rest of the in-progress time (reading the context, deciding on tool calls, writing the answer).
+# Tokens come from run.usage, and per step from step.usage.
+#
+# The service timestamps have a resolution of one second, so the breakdown is meaningful in aggregate, not for a
+# single short run. Each timeline is recorded in OpenTelemetry histograms (same meter provider as
+# common/instrumentation.py) and appended to a local run log: Parquet files when pyarrow is installed, a CSV file
+# otherwise. tracing/run_report.py aggregates the log.
+
+RUN_LOG_DIR = os.path.join("logs", "runs")
+
+# Columns of the run log and their types, the same for every file so they can be read as one table
+RUN_LOG_COLUMNS = {
+    "timestamp": "float",
+    "run_id": "string",
+    "thread_id": "string",
+    "agent_id": "string",
+    "model": "string",
+    "status": "string",
+    "error_code": "string",
+    "prompt_hash": "string",
+    "prompt": "string",
+    "queue_seconds": "float",
+    "model_seconds": "float",
+    "tool_seconds": "float",
+    "total_seconds": "float",
+    "steps": "int",
+    "tool_calls": "int",
+    "tools": "string",
+    "prompt_tokens": "int",
+    "completion_tokens": "int",
+    "total_tokens": "int",
+}
+
+PROMPT_PREVIEW_CHARS = 200
+
+
+def _seconds(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    return value.timestamp() if isinstance(value, datetime) else float(value)
+
+
+def _ended_at(item: Any) -> Optional[float]:
+    for name in ("completed_at", "failed_at", "cancelled_at", "expired_at"):
+        value = _seconds(getattr(item, name, None))
+        if value is not None:
+            return value
+    return None
+
+
+def tool_call_names(step: Any) -> List[str]:
+    """
+    The tools called in a run step: the function name for function tools, the tool type otherwise.
+
+    :param step (RunStep): The run step.
+    :return: The tool names, empty for message creation steps.
+    :rtype: List[str]
+    """
+    names = []
+    for call in getattr(step.step_details, "tool_calls", None) or []:
+        function = getattr(call, "function", None)
+        names.append(function.name if function is not None and getattr(function, "name", None) else call.type)
+    return names
+
+
+def context_tokens(steps: List[Any]) -> Optional[int]:
+    """
+    The size of the thread after a run: the prompt and completion tokens of its last step with usage. The run's usage
+    sums every step, and each step sends the whole context again, so it overstates the context.
+
+    :param steps (List[RunStep]): The steps of the run, in any order.
+    :return: The tokens, None if no step has usage.
+    :rtype: Optional[int]
+    """
+    with_usage = [s for s in steps if getattr(s, "usage", None)]
+    if not with_usage:
+        return None
+    last = max(with_usage, key=lambda s: _seconds(s.created_at) or 0)
+    return last.usage.prompt_tokens + last.usage.completion_tokens
+
+
+def list_all_run_steps(project_client, thread_id: str, run_id: str) -> List[Any]:
+    """
+    All steps of a run, oldest first.
+
+    :param project_client (AIProjectClient): The project client.
+    :param thread_id (str): The thread of the run.
+    :param run_id (str): The run.
+    :return: The run steps.
+    :rtype: List[RunStep]
+    """
+    steps, after = [], None
+    while True:
+        page = project_client.agents.list_run_steps(thread_id=thread_id, run_id=run_id, limit=100, order="asc", after=after)
+        steps.extend(page.data)
+        if not page.has_more or not page.data:
+            return steps
+        after = page.last_id
+
+
+async def list_all_run_steps_async(project_client, thread_id: str, run_id: str) -> List[Any]:
+    """Same as list_all_run_steps, for the async client from azure.ai.projects.aio."""
+    steps, after = [], None
+    while True:
+        page = await project_client.agents.list_run_steps(
+            thread_id=thread_id, run_id=run_id, limit=100, order="asc", after=after
+        )
+        steps.extend(page.data)
+        if not page.has_more or not page.data:
+            return steps
+        after = page.last_id
+
+
+class RunTimeline:
+    """
+    The timeline and token usage of a finished run.
+
+    :param run (ThreadRun): The run.
+    :param steps (List[RunStep]): The steps of the run, in any order.
+    :param prompt (Optional[str]): The user message that started the run, to group runs by prompt.
+    """
+
+    def __init__(self, run: Any, steps: List[Any], prompt: Optional[str] = None):
+        self.run_id = run.id
+        self.thread_id = run.thread_id
+        self.agent_id = run.assistant_id
+        self.model = run.model
+        self.status = str(getattr(run.status, "value", run.status))
+        self.error_code = run.last_error.code if getattr(run, "last_error", None) else None
+        self.prompt = prompt
+
+        created = _seconds(run.created_at)
+        started = _seconds(run.started_at)
+        steps = sorted(steps, key=lambda s: _seconds(s.created_at) or 0)
+        step_ends = [_ended_at(s) for s in steps]
+        ended = _ended_at(run) or max([e for e in step_ends if e is not None], default=started or created)
+        started = started if started is not None else ended
+
+        # Events as (seconds since the run was created, phase, name, duration)
+        self.events = [(0.0, "queued", "queued", started - created)]
+        self.tool_seconds = 0.0
+        self.tool_durations: List[tuple] = []
+        for step, step_end in zip(steps, step_ends):
+            step_start = _seconds(step.created_at)
+            duration = (step_end if step_end is not None else ended) - step_start
+            names = tool_call_names(step)
+            if names:
+                self.tool_seconds += duration
+                # Tool calls of one step run in parallel and only the step is timed, so each gets the step duration
+                self.tool_durations.extend((name, duration) for name in names)
+                self.events.append((step_start - created, "tool", ", ".join(names), duration))
+            else:
+                self.events.append((step_start - created, "model", str(getattr(step.type, "value", step.type)), duration))
+        self.events.append((ended - created, self.status, self.status, 0.0))
+
+        self.queue_seconds = started - created
+        self.total_seconds = ended - created
+        self.model_seconds = max(0.0, ended - started - self.tool_seconds)
+        self.steps = len(steps)
+        self.tools = sorted({name for name, _ in self.tool_durations})
+
+        usage = getattr(run, "usage", None)
+        if usage is None:
+            # Runs that didn't finish may have no usage, the steps that did still count
+            step_usages = [s.usage for s in steps if getattr(s, "usage", None)]
+            self.prompt_tokens = sum(u.prompt_tokens for u in step_usages)
+            self.completion_tokens = sum(u.completion_tokens for u in step_usages)
+        else:
+            self.prompt_tokens = usage.prompt_tokens
+            self.completion_tokens = usage.completion_tokens
+        self.total_tokens = self.prompt_tokens + self.completion_tokens
+        self.context_tokens = context_tokens(steps)
+
+    def row(self) -> Dict[str, Any]:
+        """
+        The timeline as one row of the run log.
+
+        :return: The values by column, see RUN_LOG_COLUMNS.
+        :rtype: Dict[str, Any]
+        """
+        prompt_hash = hashlib.sha256(normalize_prompt(self.prompt).encode("utf-8")).hexdigest()[:16] if self.prompt else None
+        return {
+            "timestamp": time.time(),
+            "run_id": self.run_id,
+            "thread_id": self.thread_id,
+            "agent_id": self.agent_id,
+            "model": self.model,
+            "status": self.status,
+            "error_code": self.error_code,
+            "prompt_hash": prompt_hash,
+            "prompt": self.prompt[:PROMPT_PREVIEW_CHARS] if self.prompt else None,
+            "queue_seconds": self.queue_seconds,
+            "model_seconds": self.model_seconds,
+            "tool_seconds": self.tool_seconds,
+            "total_seconds": self.total_seconds,
+            "steps": self.steps,
+            "tool_calls": len(self.tool_durations),
+            "tools": ",".join(self.tools),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+        }
+
+    def summary(self) -> str:
+        return (
+            f"Run {self.run_id} {self.status} in {self.total_seconds:.0f}s (queue {self.queue_seconds:.0f}s, "
+            f"model {self.model_seconds:.0f}s, tools {self.tool_seconds:.0f}s), "
+            f"{self.prompt_tokens} prompt + {self.completion_tokens} completion tokens"
+        )
+
+    def print(self) -> None:
+        print(self.summary())
+        for offset, phase, name, duration in self.events:
+            print(f"  +{offset:5.0f}s {phase:10} {name:32} {duration:5.0f}s")
+
+
+class RunLog:
+    """
+    Local columnar log of run timelines, one row per run.
+    Rows are buffered and written as a new Parquet file per flush when pyarrow is installed, so the directory can be
+    read as one dataset (pyarrow.dataset, pandas, DuckDB); without pyarrow they are appended to runs.csv.
+    Interactive scripts should keep the default and close() the log at the end: a small flush_rows writes a file of a
+    few rows each time, which makes the dataset slow to read.
+
+    :param directory (str): The directory of the log.
+    :param flush_rows (int): Rows buffered before they are written, each flush is a Parquet file.
+    :param use_parquet (Optional[bool]): None to use Parquet if pyarrow is installed.
+    """
+
+    def __init__(self, directory: str = RUN_LOG_DIR, flush_rows: int = 1000, use_parquet: Optional[bool] = None):
+        if use_parquet is None:
+            try:
+                import pyarrow  # noqa: F401
+
+                use_parquet = True
+            except ImportError:
+                use_parquet = False
+        self._directory = directory
+        self._flush_rows = flush_rows
+        self._use_parquet = use_parquet
+        self._rows: List[Dict[str, Any]] = []
+        self._files = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def add(self, row: Dict[str, Any]) -> None:
+        with self._lock:
+            self._rows.append(row)
+            full = len(self._rows) >= self._flush_rows
+        if full:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            rows, self._rows = self._rows, []
+            if not rows:
+                return
+            if self._use_parquet:
+                self._write_parquet(rows)
+            else:
+                self._write_csv(rows)
+
+    def close(self) -> None:
+        self.flush()
+
+    def _write_parquet(self, rows: List[Dict[str, Any]]) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        types = {"string": pa.string(), "float": pa.float64(), "int": pa.int64()}
+        schema = pa.schema([(name, types[kind]) for name, kind in RUN_LOG_COLUMNS.items()])
+        table = pa.Table.from_pydict({name: [row.get(name) for row in rows] for name in RUN_LOG_COLUMNS}, schema=schema)
+        self._files += 1
+        name = f"runs-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._files}.parquet"
+        pq.write_table(table, os.path.join(self._directory, name))
+
+    def _write_csv(self, rows: List[Dict[str, Any]]) -> None:
+        path = os.path.join(self._directory, "runs.csv")
+        new_file = not os.path.exists(path)
+        with open(path, "a", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(RUN_LOG_COLUMNS), extrasaction="ignore")
+            if new_file:
+                writer.writeheader()
+            writer.writerows(rows)
+
+
+def read_run_log(directory: str = RUN_LOG_DIR) -> List[Dict[str, Any]]:
+    """
+    Read all rows of a run log, from its Parquet files and its CSV file.
+
+    :param directory (str): The directory of the log.
+    :return: The rows, with typed values.
+    :rtype: List[Dict[str, Any]]
+    """
+    rows: List[Dict[str, Any]] = []
+    if not os.path.isdir(directory):
+        return rows
+    names = sorted(os.listdir(directory))
+    if any(name.endswith(".parquet") for name in names):
+        import pyarrow.parquet as pq
+
+        for name in names:
+            if name.endswith(".parquet"):
+                rows.extend(pq.read_table(os.path.join(directory, name)).to_pylist())
+    csv_path = os.path.join(directory, "runs.csv")
+    if os.path.exists(csv_path):
+        converters = {"float": float, "int": int, "string": str}
+        with open(csv_path, encoding="utf-8", newline="") as f:
+            for record in csv.DictReader(f):
+                rows.append({
+                    name: converters[RUN_LOG_COLUMNS[name]](value) if value != "" else None
+                    for name, value in record.items() if name in RUN_LOG_COLUMNS
+                })
+    return rows
+
+
+class RunAnalyzer:
+    """
+    Builds the timeline of finished runs and exports it as metrics and to the run log.
+
+    :param project_client (AIProjectClient): The project client, sync or async.
+    :param log (Optional[RunLog]): Where the rows go, None for no local log.
+    :param summary (Optional[LatencySummary]): Where the phase durations are kept for local percentiles.
+    """
+
+    def __init__(self, project_client, log: Optional[RunLog] = None, summary: Optional[LatencySummary] = None):
+        self._client = project_client
+        self.log = log
+        self.summary = summary or LatencySummary()
+        meter = metrics.get_meter(__name__)
+        self._phase_duration = meter.create_histogram(
+            "agents.run.phase.duration", unit="s", description="Queue, model, tool and total time of runs"
+        )
+        self._tool_duration = meter.create_histogram(
+            "agents.run.tool.duration", unit="s", description="Duration of the run steps calling each tool"
+        )
+        self._tokens = meter.create_histogram("agents.run.tokens", unit="{token}", description="Tokens used per run")
+
+    def analyze(self, run: Any, prompt: Optional[str] = None) -> Optional[RunTimeline]:
+        """
+        List the steps of a finished run and record its timeline.
+
+        :param run (ThreadRun): The run.
+        :param prompt (Optional[str]): The user message that started the run.
+        :return: The timeline, None if the steps could not be listed.
+        :rtype: Optional[RunTimeline]
+        """
+        try:
+            steps = list_all_run_steps(self._client, run.thread_id, run.id)
+        except Exception as e:
+            logging.warning(f"Could not list the steps of run {run.id}: {e}")
+            return None
+        return self.record(RunTimeline(run, steps, prompt))
+
+    async def analyze_async(self, run: Any, prompt: Optional[str] = None) -> Optional[RunTimeline]:
+        """Same as analyze, for the async client from azure.ai.projects.aio."""
+        try:
+            steps = await list_all_run_steps_async(self._client, run.thread_id, run.id)
+        except Exception as e:
+            logging.warning(f"Could not list the steps of run {run.id}: {e}")
+            return None
+        return self.record(RunTimeline(run, steps, prompt))
+
+    def record(self, timeline: RunTimeline) -> RunTimeline:
+        attributes = {"model": timeline.model or "unknown", "status": timeline.status}
+        for phase in ("queue", "model", "tool", "total"):
+            seconds = getattr(timeline, f"{phase}_seconds")
+            self._phase_duration.record(seconds, {**attributes, "phase": phase})
+            self.summary.add(f"run.{phase}", seconds)
+        for name, seconds in timeline.tool_durations:
+            self._tool_duration.record(seconds, {"model": attributes["model"], "tool": name})
+            self.summary.add(f"tool.{name}", seconds)
+        self._tokens.record(timeline.prompt_tokens, {**attributes, "type": "prompt"})
+        self._tokens.record(timeline.completion_tokens, {**attributes, "type": "completion"})
+        if self.log is not None:
+            self.log.add(timeline.row())
+        return timeline
+
+    def close(self) -> None:
+        if self.log is not None:
+            self.log.close()
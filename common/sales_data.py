@@ -0,0 +1,131 @@
+import json
+from typing import Any, Dict, Iterator, Optional
+
+import numpy as np
+
+# Columnar generator for synthetic sales data, used by get_sales_data in quickie2.py and for load tests.
+# Records are generated in chunks of NumPy arrays, so a large dataset can be streamed without holding it in memory.
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+
+def iter_sales_chunks(
+    year: int, n_rows: int, seed: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Generate mock sales records as chunks of columns.
+
+    :param year (int): The year the sale dates fall in.
+    :param n_rows (int): The total number of records.
+    :param seed (Optional[int]): Seed for the random generator, None for a random seed.
+    :param chunk_size (int): The maximum number of records per chunk.
+    :return: An iterator over dicts mapping column names to arrays of equal length.
+    :rtype: Iterator[Dict[str, np.ndarray]]
+    """
+    rng = np.random.default_rng(seed)
+    first_day = np.datetime64(f"{year}-01-01", "D")
+    days_in_year = int((np.datetime64(f"{year + 1}-01-01", "D") - first_day).astype(int))
+
+    for offset in range(0, n_rows, chunk_size):
+        size = min(chunk_size, n_rows - offset)
+        quantity_sold = rng.integers(1, 101, size=size)
+        cost_price = np.round(rng.uniform(5.0, 50.0, size=size), 2)
+        selling_price = np.round(rng.uniform(10.0, 100.0, size=size), 2)
+        yield {
+            "id": np.arange(offset + 1, offset + size + 1),
+            "date": first_day + rng.integers(0, days_in_year, size=size),
+            "quantity_sold": quantity_sold,
+            "cost_price": cost_price,
+            "selling_price": selling_price,
+            "profit": np.round((selling_price - cost_price) * quantity_sold, 2),
+        }
+
+
+def chunk_to_records(chunk: Dict[str, np.ndarray]) -> Iterator[Dict[str, Any]]:
+    """
+    Convert a chunk of columns to records with plain Python values.
+
+    :param chunk (Dict[str, np.ndarray]): A chunk from iter_sales_chunks.
+    :return: An iterator over the records.
+    :rtype: Iterator[Dict[str, Any]]
+    """
+    # tolist() converts a whole column at once, which is much faster than converting element by element
+    columns = {name: values.astype(str).tolist() if name == "date" else values.tolist() for name, values in chunk.items()}
+    for i, record_id in enumerate(columns["id"]):
+        yield {
+            "id": record_id,
+            "product": f"Product {record_id}",
+            "date": columns["date"][i],
+            "quantity_sold": columns["quantity_sold"][i],
+            "cost_price": columns["cost_price"][i],
+            "selling_price": columns["selling_price"][i],
+            "profit": columns["profit"][i],
+        }
+
+
+def iter_sales_ndjson(
+    year: int, n_rows: int, seed: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[str]:
+    """
+    Stream mock sales records as NDJSON, one string per chunk.
+
+    :param year (int): The year the sale dates fall in.
+    :param n_rows (int): The total number of records.
+    :param seed (Optional[int]): Seed for the random generator.
+    :param chunk_size (int): The maximum number of records per chunk.
+    :return: An iterator over newline terminated NDJSON blocks.
+    :rtype: Iterator[str]
+    """
+    # All values are numbers or known safe strings, so formatting is cheaper than json.dumps per record
+    line = (
+        '{{"id": {}, "product": "Product {}", "date": "{}", "quantity_sold": {}, '
+        '"cost_price": {}, "selling_price": {}, "profit": {}}}\n'
+    )
+    # Converting a date to a string is slow, so look the strings up in the (at most 366) days of the year
+    first_day = np.datetime64(f"{year}-01-01", "D")
+    day_names = np.arange(first_day, np.datetime64(f"{year + 1}-01-01", "D")).astype(str)
+    for chunk in iter_sales_chunks(year, n_rows, seed, chunk_size):
+        ids = chunk["id"].tolist()
+        yield "".join(
+            map(
+                line.format,
+                ids,
+                ids,
+                day_names[(chunk["date"] - first_day).astype(int)].tolist(),
+                chunk["quantity_sold"].tolist(),
+                chunk["cost_price"].tolist(),
+                chunk["selling_price"].tolist(),
+                chunk["profit"].tolist(),
+            )
+        )
+
+
+def iter_sales_arrow(year: int, n_rows: int, seed: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Stream mock sales records as Arrow record batches. Requires pyarrow.
+
+    :param year (int): The year the sale dates fall in.
+    :param n_rows (int): The total number of records.
+    :param seed (Optional[int]): Seed for the random generator.
+    :param chunk_size (int): The maximum number of records per batch.
+    :return: An iterator over pyarrow.RecordBatch.
+    :rtype: Iterator[pyarrow.RecordBatch]
+    """
+    import pyarrow as pa
+
+    for chunk in iter_sales_chunks(year, n_rows, seed, chunk_size):
+        yield pa.RecordBatch.from_pydict(chunk)
+
+
+def sales_data_json(year: int, n_rows: int = 10, seed: Optional[int] = None) -> str:
+    """
+    Generate a small dataset as a single JSON array, as returned to the agent.
+
+    :param year (int): The year the sale dates fall in.
+    :param n_rows (int): The number of records.
+    :param seed (Optional[int]): Seed for the random generator.
+    :return: A JSON string containing the sales data.
+    :rtype: str
+    """
+    records = [record for chunk in iter_sales_chunks(year, n_rows, seed) for record in chunk_to_records(chunk)]
+    return json.dumps(records)
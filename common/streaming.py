@@ -0,0 +1,121 @@
+import logging
+import time
+from typing import Any, Callable, Iterator, Optional
+
+from azure.ai.projects.models import (
+    AgentEventHandler,
+    BaseAgentEventHandler,
+    MessageDeltaChunk,
+    RunStep,
+    SubmitToolOutputsAction,
+    ThreadMessage,
+    ThreadRun,
+    ToolSet,
+)
+
+# Event handler for streamed runs: prints the assistant text as it arrives. Function tools run inside the stream:
+# the handler executes them with its toolset and follows the stream of the submitted outputs.
+
+
+class StreamingEventHandler(AgentEventHandler):
+    """
+    Prints message deltas as they arrive and keeps the final run and message.
+
+    :param prefix (str): Printed before the first delta of each message.
+    :param agents (Optional[AgentsOperations]): The operations the tool outputs are submitted through.
+    :param toolset (Optional[ToolSet]): Executes the function calls of the run, None to leave them to the SDK.
+    """
+
+    def __init__(self, prefix: str = "Assistant: ", agents: Optional[Any] = None, toolset: Optional[ToolSet] = None):
+        super().__init__()
+        self._prefix = prefix
+        self._agents = agents
+        self._toolset = toolset
+        self._in_message = False
+        self.started_at = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.last_message: Optional[ThreadMessage] = None
+        self.run: Optional[ThreadRun] = None
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        """Seconds between the creation of the handler and the first text delta, or None if no text arrived."""
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    def initialize(
+        self,
+        response_iterator: Iterator[bytes],
+        submit_tool_outputs: Callable[[ThreadRun, BaseAgentEventHandler], None],
+        event_handler: Optional[BaseAgentEventHandler] = None,
+    ) -> None:
+        # Called by the SDK for the run stream and for each stream of submitted tool outputs
+        if self._toolset is not None:
+            submit_tool_outputs = self._submit_tool_outputs
+        super().initialize(response_iterator, submit_tool_outputs, event_handler)
+
+    def on_message_delta(self, delta: MessageDeltaChunk) -> None:
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            logging.info(f"Time to first token: {self.time_to_first_token:.3f}s")
+        if not self._in_message:
+            print(self._prefix, end="", flush=True)
+            self._in_message = True
+        print(delta.text, end="", flush=True)
+
+    def on_thread_message(self, message: ThreadMessage) -> None:
+        if message.status == "completed":
+            if self._in_message:
+                print()
+                self._in_message = False
+            self.last_message = message
+
+    def on_thread_run(self, run: ThreadRun) -> None:
+        # Function calls (requires_action) are executed and submitted before this is called, so the stream of the
+        # outputs has already delivered the later states of the run: keep those
+        if run.status == "requires_action" and self.run is not None and self.run.id == run.id:
+            return
+        self.run = run
+        if run.status == "failed":
+            logging.error(f"Run failed: {run.last_error}")
+
+    def on_run_step(self, step: RunStep) -> None:
+        logging.debug(f"Run step {step.id}: {step.type} {step.status}")
+
+    def on_error(self, data: str) -> None:
+        logging.error(f"Stream error: {data}")
+
+    def on_unhandled_event(self, event_type: str, event_data: Any) -> None:
+        logging.debug(f"Unhandled stream event {event_type}")
+
+    def _submit_tool_outputs(self, run: ThreadRun, event_handler: BaseAgentEventHandler) -> None:
+        if not isinstance(run.required_action, SubmitToolOutputsAction):
+            return
+        tool_calls = run.required_action.submit_tool_outputs.tool_calls
+        # Other tool types (e.g. Azure functions) are completed by the service
+        if not any(tool_call.type == "function" for tool_call in tool_calls or []):
+            return
+        tool_outputs = self._toolset.execute_tool_calls(tool_calls)
+        if tool_outputs:
+            with self._agents.submit_tool_outputs_to_stream(
+                thread_id=run.thread_id, run_id=run.id, tool_outputs=tool_outputs, event_handler=event_handler
+            ) as stream:
+                stream.until_done()
+
+
+def stream_run(project_client, thread_id: str, agent_id: str, toolset: Optional[ToolSet] = None) -> StreamingEventHandler:
+    """
+    Run the agent on the thread with streaming, printing the answer token by token.
+
+    :param project_client (AIProjectClient): The project client.
+    :param thread_id (str): The thread to run.
+    :param agent_id (str): The agent to run.
+    :param toolset (Optional[ToolSet]): The toolset used to answer function tool calls inside the stream.
+    :return: The handler, with the final run, the last message and the time to first token.
+    :rtype: StreamingEventHandler
+    """
+    handler = StreamingEventHandler(agents=project_client.agents, toolset=toolset)
+    with project_client.agents.create_stream(thread_id=thread_id, assistant_id=agent_id, event_handler=handler) as stream:
+        stream.until_done()
+    return handler
@@ -0,0 +1,230 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+from opentelemetry import trace
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.sampling import ALWAYS_ON, ParentBased, TraceIdRatioBased
+from opentelemetry.trace import StatusCode
+
+# Tracing setup that keeps the export off the request path and bounds its cost.
+#
+# Spans are exported by BatchSpanProcessor: a bounded queue drained by a background thread, spans are dropped (not
+# waited for) when the queue is full. On top of that the volume is capped by sampling:
+# - "head": a trace is kept or dropped when it starts (TraceIdRatioBased), dropped spans are never recorded.
+# - "tail": all spans are recorded, and the decision is made when the local root span ends. Traces with an error or a
+#   root slower than slow_threshold_seconds are always kept, the others with probability sample_rate. A run that ends
+#   failed, cancelled or expired is returned normally, not raised, so a span whose run status attribute (ours or the
+#   SDK instrumentor's) says so counts as an error too. A trace that
+#   buffers more than max_spans_per_trace spans (e.g. one root span around a whole script) is decided early, on its
+#   errors so far and its trace ID: kept traces then forward their spans as they end, the others only error spans
+#   and a slow or failed root.
+# Kept spans go to Application Insights when a connection string is given, and to a local rotating JSONL file.
+
+
+# Run status attributes set by common/instrumentation.py and by the azure-ai-projects instrumentor
+RUN_STATUS_ATTRIBUTES = ("agents.status", "gen_ai.thread.run.status")
+FAILED_RUN_STATUSES = {"failed", "cancelled", "expired"}
+
+
+def is_failed_span(span: ReadableSpan) -> bool:
+    """
+    Whether a span ended in error, or recorded a run that didn't complete.
+
+    :param span (ReadableSpan): The ended span.
+    :return: True for error spans and failed, cancelled or expired runs.
+    :rtype: bool
+    """
+    if span.status.status_code == StatusCode.ERROR:
+        return True
+    attributes = span.attributes or {}
+    # The SDK may record the enum, e.g. "RunStatus.FAILED"
+    return any(
+        str(attributes[name]).rsplit(".", 1)[-1].lower() in FAILED_RUN_STATUSES
+        for name in RUN_STATUS_ATTRIBUTES
+        if name in attributes
+    )
+
+
+class RotatingFileSpanExporter(SpanExporter):
+    """
+    Writes spans as JSON lines to a file, rotating it when it grows too large.
+
+    :param path (str): The file the spans are written to.
+    :param max_bytes (int): The size at which the file is rotated.
+    :param backup_count (int): The number of rotated files kept.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 3):
+        self._path = path
+        self._max_bytes = max_bytes
+        self._backup_count = backup_count
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        lines = "".join(span.to_json(indent=None) + "\n" for span in spans)
+        with self._lock:
+            if os.path.exists(self._path) and os.path.getsize(self._path) + len(lines) > self._max_bytes:
+                self._rotate()
+            with open(self._path, "a", encoding="utf-8") as f:
+                f.write(lines)
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        pass
+
+    def _rotate(self) -> None:
+        for index in range(self._backup_count - 1, 0, -1):
+            source = f"{self._path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self._path}.{index + 1}")
+        if self._backup_count > 0:
+            os.replace(self._path, f"{self._path}.1")
+        else:
+            os.remove(self._path)
+
+
+class TailSamplingSpanProcessor(SpanProcessor):
+    """
+    Buffers the spans of a trace until its local root ends, then forwards the whole trace or drops it.
+
+    :param delegates (Sequence[SpanProcessor]): The processors kept traces are forwarded to, typically BatchSpanProcessors.
+    :param sample_rate (float): The share of normal traces that is kept.
+    :param slow_threshold_seconds (float): Traces whose root takes longer are always kept.
+    :param max_buffered_traces (int): Open traces kept in memory; beyond that the oldest are dropped.
+    :param max_spans_per_trace (int): Spans buffered for one trace; beyond that the trace is decided early.
+    """
+
+    def __init__(
+        self,
+        delegates: Sequence[SpanProcessor],
+        sample_rate: float = 0.01,
+        slow_threshold_seconds: float = 30.0,
+        max_buffered_traces: int = 1000,
+        max_spans_per_trace: int = 256,
+    ):
+        self._delegates = list(delegates)
+        self._sample_rate = sample_rate
+        self._slow_threshold_ns = int(slow_threshold_seconds * 1e9)
+        self._max_buffered_traces = max_buffered_traces
+        self._max_spans_per_trace = max_spans_per_trace
+        self._traces: "OrderedDict[int, List[ReadableSpan]]" = OrderedDict()
+        # Traces decided before their root ended: whether all their spans are kept
+        self._decided: "OrderedDict[int, bool]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, float] = {
+            "kept_traces": 0, "dropped_traces": 0, "evicted_traces": 0, "early_decisions": 0, "seconds": 0.0
+        }
+
+    def on_start(self, span: Span, parent_context: Optional[Context] = None) -> None:
+        pass
+
+    def on_end(self, span: ReadableSpan) -> None:
+        start = time.perf_counter()
+        trace_id = span.context.trace_id
+        is_local_root = span.parent is None or span.parent.is_remote
+        failed = is_failed_span(span)
+        with self._lock:
+            decision = self._decided.get(trace_id)
+            if decision is not None:
+                if is_local_root:
+                    del self._decided[trace_id]
+                keep = decision or failed or (is_local_root and self._is_slow(span))
+                spans = [span] if keep else []
+            else:
+                spans = self._traces.setdefault(trace_id, [])
+                spans.append(span)
+                if not is_local_root and len(spans) < self._max_spans_per_trace:
+                    while len(self._traces) > self._max_buffered_traces:
+                        self._traces.popitem(last=False)
+                        self.stats["evicted_traces"] += 1
+                    self.stats["seconds"] += time.perf_counter() - start
+                    return
+                del self._traces[trace_id]
+                keep = any(is_failed_span(s) for s in spans) or self._is_sampled(trace_id)
+                if is_local_root:
+                    keep = keep or self._is_slow(span)
+                else:
+                    # Too many spans to wait for the root: decide now, and forward the later spans as they end
+                    self._decided[trace_id] = keep
+                    self.stats["early_decisions"] += 1
+                    while len(self._decided) > self._max_buffered_traces:
+                        self._decided.popitem(last=False)
+                if not keep:
+                    spans = []
+
+        for delegate in self._delegates:
+            for s in spans:
+                delegate.on_end(s)
+        with self._lock:
+            if is_local_root:
+                self.stats["kept_traces" if keep else "dropped_traces"] += 1
+            self.stats["seconds"] += time.perf_counter() - start
+
+    def _is_slow(self, root: ReadableSpan) -> bool:
+        return (root.end_time - root.start_time) > self._slow_threshold_ns
+
+    def _is_sampled(self, trace_id: int) -> bool:
+        # Decided by trace ID, so every process and exporter makes the same choice for a trace
+        return (trace_id & 0xFFFFFFFFFFFFFFFF) < self._sample_rate * 2**64
+
+    def shutdown(self) -> None:
+        for delegate in self._delegates:
+            delegate.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return all(delegate.force_flush(timeout_millis) for delegate in self._delegates)
+
+
+def configure_telemetry(
+    connection_string: Optional[str] = None,
+    sampling: str = "tail",
+    sample_rate: float = 0.01,
+    slow_threshold_seconds: float = 30.0,
+    file_path: Optional[str] = "logs/spans.jsonl",
+    max_queue_size: int = 2048,
+    schedule_delay_millis: int = 5000,
+) -> Dict[str, Any]:
+    """
+    Set up a tracer provider with bounded background export and sampling.
+
+    :param connection_string (Optional[str]): The Application Insights connection string, None to skip Azure Monitor.
+    :param sampling (str): "head", "tail" or "off" (keep everything).
+    :param sample_rate (float): The share of normal traces that is kept.
+    :param slow_threshold_seconds (float): With tail sampling, traces slower than this are always kept.
+    :param file_path (Optional[str]): The local rotating span file, None to disable it.
+    :param max_queue_size (int): The maximum number of spans waiting for export, per exporter.
+    :param schedule_delay_millis (int): The delay between two exports.
+    :return: The tracer provider, and the tail sampling processor if any (its stats give the sampling overhead).
+    :rtype: Dict[str, Any]
+    """
+    sampler = ParentBased(TraceIdRatioBased(sample_rate)) if sampling == "head" else ALWAYS_ON
+    provider = TracerProvider(sampler=sampler)
+
+    exporters: List[SpanExporter] = []
+    if connection_string:
+        from azure.monitor.opentelemetry.exporter import AzureMonitorTraceExporter
+
+        exporters.append(AzureMonitorTraceExporter(connection_string=connection_string))
+    if file_path:
+        exporters.append(RotatingFileSpanExporter(file_path))
+
+    batch_processors = [
+        BatchSpanProcessor(exporter, max_queue_size=max_queue_size, schedule_delay_millis=schedule_delay_millis)
+        for exporter in exporters
+    ]
+    tail_processor = None
+    if sampling == "tail":
+        tail_processor = TailSamplingSpanProcessor(batch_processors, sample_rate, slow_threshold_seconds)
+        provider.add_span_processor(tail_processor)
+    else:
+        for processor in batch_processors:
+            provider.add_span_processor(processor)
+
+    trace.set_tracer_provider(provider)
+    return {"provider": provider, "tail_processor": tail_processor}
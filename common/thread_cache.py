@@ -0,0 +1,139 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, List, Optional
+
+from azure.ai.projects.models import ThreadMessage
+
+from common.manifest import CACHE_DIR
+
+# Local copy of thread messages, so a chat loop doesn't download the whole history again on every turn.
+# For each thread the cache remembers the ID of the last message it has seen, and sync() only asks the service for
+# the messages after it (list_messages with order="asc" and the after cursor, page by page). Messages are stored as
+# JSON in a SQLite file, and the newest message of a sender is read back from there.
+
+
+class ThreadMessageCache:
+    """
+    Caches the messages of threads locally and fetches only the new ones.
+
+    :param project_client (AIProjectClient): The client used to list messages.
+    :param path (os.PathLike): The SQLite database file.
+    :param page_size (int): The number of messages asked per list_messages call.
+    """
+
+    def __init__(self, project_client, path: os.PathLike = CACHE_DIR / "threads.db", page_size: int = 100):
+        self._client = project_client
+        self._page_size = page_size
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(str(path), timeout=5, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages "
+            "(thread_id TEXT, seq INTEGER, id TEXT, role TEXT, body TEXT, PRIMARY KEY (thread_id, id))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS messages_role ON messages (thread_id, role, seq)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS cursors (thread_id TEXT PRIMARY KEY, last_id TEXT)")
+
+    def sync(self, thread_id: str) -> int:
+        """
+        Fetch the messages added to the thread since the last sync.
+
+        :param thread_id (str): The thread.
+        :return: The number of messages fetched.
+        :rtype: int
+        """
+        cursor = self._cursor(thread_id)
+        fetched = 0
+        while True:
+            page = self._client.agents.list_messages(
+                thread_id=thread_id, order="asc", after=cursor, limit=self._page_size
+            )
+            complete = True
+            for message in page.data:
+                self._store(thread_id, message)
+                # A message still being written is fetched again next time
+                complete = complete and message.status != "in_progress"
+                if complete:
+                    cursor = message.id
+            fetched += len(page.data)
+            self._set_cursor(thread_id, cursor)
+            if not page.has_more or not complete or not page.data:
+                return fetched
+
+    def add(self, message: ThreadMessage) -> None:
+        """
+        Store a message just created on the thread, so the next sync doesn't fetch it again.
+        It must be the newest message of the thread, e.g. the user message created before a run.
+
+        :param message (ThreadMessage): The message returned by create_message.
+        """
+        self._store(message.thread_id, message)
+        self._set_cursor(message.thread_id, message.id)
+
+    def messages(self, thread_id: str) -> List[ThreadMessage]:
+        """
+        The cached messages of the thread, oldest first.
+
+        :param thread_id (str): The thread.
+        :return: The messages.
+        :rtype: List[ThreadMessage]
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT body FROM messages WHERE thread_id = ? ORDER BY seq", (thread_id,)).fetchall()
+        return [ThreadMessage(json.loads(row[0])) for row in rows]
+
+    def last_message_by_sender(self, thread_id: str, sender: str) -> Optional[ThreadMessage]:
+        """
+        The newest cached message of a sender, without listing the thread.
+
+        :param thread_id (str): The thread.
+        :param sender (str): The role, "assistant" or "user".
+        :return: The message, or None if there is none.
+        :rtype: Optional[ThreadMessage]
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body FROM messages WHERE thread_id = ? AND role = ? ORDER BY seq DESC LIMIT 1",
+                (thread_id, sender),
+            ).fetchone()
+        return ThreadMessage(json.loads(row[0])) if row else None
+
+    def forget(self, thread_id: str) -> None:
+        """
+        Remove a thread from the cache, e.g. after deleting it.
+
+        :param thread_id (str): The thread.
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM messages WHERE thread_id = ?", (thread_id,))
+            self._db.execute("DELETE FROM cursors WHERE thread_id = ?", (thread_id,))
+
+    def _cursor(self, thread_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT last_id FROM cursors WHERE thread_id = ?", (thread_id,)).fetchone()
+        return row[0] if row else None
+
+    def _set_cursor(self, thread_id: str, last_id: Optional[str]) -> None:
+        if last_id is None:
+            return
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO cursors (thread_id, last_id) VALUES (?, ?)", (thread_id, last_id))
+
+    def _store(self, thread_id: str, message: Any) -> None:
+        body = json.dumps(message.as_dict(), separators=(",", ":"))
+        with self._lock:
+            # An updated message keeps its place in the thread
+            row = self._db.execute(
+                "SELECT seq FROM messages WHERE thread_id = ? AND id = ?", (thread_id, message.id)
+            ).fetchone()
+            if row is None:
+                row = self._db.execute(
+                    "SELECT COALESCE(MAX(seq), 0) + 1 FROM messages WHERE thread_id = ?", (thread_id,)
+                ).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO messages (thread_id, seq, id, role, body) VALUES (?, ?, ?, ?, ?)",
+                (thread_id, row[0], message.id, message.role, body),
+            )
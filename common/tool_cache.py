@@ -0,0 +1,160 @@
+import functools
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+# Memoization for deterministic user functions, so repeated tool calls with the same arguments don't hit the backend.
+# Entries expire after a TTL and the cache is bounded by LRU size.
+# By default the cache lives in memory. Set TOOL_CACHE_PATH to a SQLite file to share it between worker processes.
+
+
+class MemoryCacheBackend:
+    """
+    In-process LRU cache with per-entry expiry.
+
+    :param max_size (int): The maximum number of entries.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self._max_size = max_size
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SqliteCacheBackend:
+    """
+    LRU cache with per-entry expiry in a SQLite file, shared by all processes using the same path.
+    Each namespace (a cached function) has its own size limit.
+
+    :param path (str): The SQLite database file.
+    :param max_size (int): The maximum number of entries of the namespace.
+    :param namespace (str): The entries this backend reads, writes, evicts and clears.
+    """
+
+    def __init__(self, path: str, max_size: int = 1024, namespace: str = ""):
+        self._max_size = max_size
+        self._namespace = namespace
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(tool_cache)")]
+        if columns and "namespace" not in columns:
+            # A cache file from before namespaces: its content can simply be dropped
+            self._db.execute("DROP TABLE tool_cache")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS tool_cache "
+            "(key TEXT PRIMARY KEY, namespace TEXT, value TEXT, expires REAL, last_used REAL)"
+        )
+        self._db.execute("DROP INDEX IF EXISTS tool_cache_last_used")
+        self._db.execute("CREATE INDEX IF NOT EXISTS tool_cache_namespace ON tool_cache (namespace, last_used)")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, expires FROM tool_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._db.execute("DELETE FROM tool_cache WHERE key = ?", (key,))
+                return None
+            self._db.execute("UPDATE tool_cache SET last_used = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO tool_cache (key, namespace, value, expires, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, self._namespace, value, now + ttl, now),
+            )
+            self._db.execute(
+                "DELETE FROM tool_cache WHERE key IN "
+                "(SELECT key FROM tool_cache WHERE namespace = ? ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self._namespace, self._max_size),
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM tool_cache WHERE namespace = ?", (self._namespace,))
+
+
+def _default_backend(max_size: int, namespace: str) -> Any:
+    path = os.environ.get("TOOL_CACHE_PATH")
+    if not path:
+        return MemoryCacheBackend(max_size)
+    return SqliteCacheBackend(path, max_size, namespace)
+
+
+def cacheable(ttl: float = 300.0, max_size: int = 1024, backend: Optional[Any] = None) -> Callable:
+    """
+    Mark a user function as cacheable. The name, signature and docstring are kept, so FunctionTool still works.
+
+    :param ttl (float): Seconds a result stays valid.
+    :param max_size (int): The maximum number of cached results of the function.
+    :param backend (Optional[Any]): The cache backend, None to use TOOL_CACHE_PATH or an in-memory LRU.
+    :return: The decorator.
+    :rtype: Callable
+    """
+
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        signature = inspect.signature(func)
+        stats: Dict[str, int] = {"hits": 0, "misses": 0}
+        state: Dict[str, Any] = {"backend": backend}
+
+        def get_backend() -> Any:
+            # Resolved on first use, so TOOL_CACHE_PATH can still be loaded from .env after the import
+            if state["backend"] is None:
+                state["backend"] = _default_backend(max_size, f"{func.__module__}.{func.__qualname__}")
+            return state["backend"]
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = f"{func.__module__}.{func.__qualname__}:" + json.dumps(
+                bound.arguments, sort_keys=True, separators=(",", ":"), default=str
+            )
+            cache = get_backend()
+            cached = cache.get(key)
+            if cached is not None:
+                stats["hits"] += 1
+                return json.loads(cached)
+            stats["misses"] += 1
+            result = func(*args, **kwargs)
+            cache.set(key, json.dumps(result), ttl)
+            return result
+
+        wrapper.cache_stats = lambda: dict(stats)
+        wrapper.cache_clear = lambda: get_backend().clear()
+        return wrapper
+
+    return decorator
@@ -0,0 +1,126 @@
+import json
+import logging
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from azure.ai.projects.models import ToolSet
+
+# Runs the function tool calls of one run step at the same time instead of one after another.
+# I/O bound functions run on a thread pool, functions marked as CPU bound on a process pool.
+# A step then takes as long as its slowest call, and all outputs are still submitted together.
+
+
+class ParallelToolExecutor:
+    """
+    Executes function tool calls concurrently with a per-call timeout.
+
+    :param functions (Iterable[Callable[..., Any]]): The user functions the agent may call.
+    :param cpu_bound (Iterable[Callable[..., Any]]): The functions that should run on the process pool.
+        They must be defined at module level so they can be pickled.
+    :param max_workers (int): The size of the thread pool.
+    :param max_processes (Optional[int]): The size of the process pool, None for the number of CPUs.
+    :param timeout (float): Seconds a single call may take before an error is returned for it.
+    """
+
+    def __init__(
+        self,
+        functions: Iterable[Callable[..., Any]],
+        cpu_bound: Iterable[Callable[..., Any]] = (),
+        max_workers: int = 8,
+        max_processes: Optional[int] = None,
+        timeout: float = 30.0,
+    ):
+        self._functions: Dict[str, Callable[..., Any]] = {f.__name__: f for f in functions}
+        self._cpu_bound = {f.__name__ for f in cpu_bound}
+        self._functions.update({f.__name__: f for f in cpu_bound})
+        self._timeout = timeout
+        self._threads = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool-call")
+        self._max_processes = max_processes
+        self._processes: Optional[ProcessPoolExecutor] = None
+
+    def execute_tool_calls(self, tool_calls: List[Any]) -> List[Dict[str, str]]:
+        """
+        Execute all function tool calls of a run step concurrently.
+
+        :param tool_calls (List[Any]): The tool calls from the run's required action.
+        :return: The tool outputs, in the order of the calls, ready for submit_tool_outputs_to_run.
+        :rtype: List[Dict[str, str]]
+        """
+        start = time.perf_counter()
+        pending = []
+        for tool_call in tool_calls:
+            if tool_call.type != "function":
+                continue
+            pending.append((tool_call, self._submit(tool_call)))
+
+        tool_outputs = []
+        deadline = start + self._timeout
+        for tool_call, future in pending:
+            tool_outputs.append({"tool_call_id": tool_call.id, "output": self._result(tool_call, future, deadline)})
+        logging.info(f"Executed {len(tool_outputs)} tool calls in {time.perf_counter() - start:.3f}s")
+        return tool_outputs
+
+    def shutdown(self) -> None:
+        """Shut down the thread and process pools."""
+        self._threads.shutdown(wait=False)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False)
+
+    def _submit(self, tool_call: Any) -> Future:
+        name = tool_call.function.name
+        function = self._functions.get(name)
+        if function is None:
+            return self._failed(ValueError(f"Function {name} is not known"))
+        # The model may produce arguments that aren't valid JSON: that call gets an error output, the others still run
+        try:
+            arguments = json.loads(tool_call.function.arguments or "{}")
+        except json.JSONDecodeError as e:
+            return self._failed(ValueError(f"Invalid arguments for {name}: {e}"))
+        if not isinstance(arguments, dict):
+            return self._failed(ValueError(f"Invalid arguments for {name}: expected a JSON object"))
+        return self._pool_for(name).submit(function, **arguments)
+
+    @staticmethod
+    def _failed(error: Exception) -> Future:
+        future: Future = Future()
+        future.set_exception(error)
+        return future
+
+    def _pool_for(self, name: str) -> Executor:
+        if name not in self._cpu_bound:
+            return self._threads
+        if self._processes is None:
+            self._processes = ProcessPoolExecutor(max_workers=self._max_processes)
+        return self._processes
+
+    def _result(self, tool_call: Any, future: Future, deadline: float) -> str:
+        name = tool_call.function.name
+        try:
+            output = future.result(timeout=max(0.0, deadline - time.perf_counter()))
+        except FutureTimeoutError:
+            future.cancel()
+            logging.error(f"Tool call {name} timed out after {self._timeout}s")
+            return json.dumps({"error": f"{name} timed out"})
+        except Exception as e:
+            logging.error(f"Tool call {name} failed: {e}")
+            return json.dumps({"error": str(e)})
+        return output if isinstance(output, str) else json.dumps(output)
+
+
+class ParallelToolSet(ToolSet):
+    """
+    ToolSet that executes function tool calls with a ParallelToolExecutor.
+
+    Pass it as toolset to create_agent / create_and_process_run, the SDK then submits the outputs of a step in one call.
+
+    :param executor (ParallelToolExecutor): The executor for the function tool calls.
+    """
+
+    def __init__(self, executor: ParallelToolExecutor):
+        super().__init__()
+        self.executor = executor
+
+    def execute_tool_calls(self, tool_calls: List[Any]) -> Any:
+        return self.executor.execute_tool_calls(tool_calls)
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Set
+
+from azure.ai.projects.models import (
+    FileSearchTool,
+    VectorStoreStaticChunkingStrategyOptions,
+    VectorStoreStaticChunkingStrategyRequest,
+)
+from azure.core.exceptions import ResourceNotFoundError
+
+from common.manifest import CACHE_DIR, client_scope, load_manifest, save_manifest
+
+# Content-addressed cache for uploaded files and vector stores.
+# Files are keyed by the SHA-256 of their bytes, vector stores by the hashes of their files plus the chunking settings.
+# When nothing changed, the existing file and vector store IDs are reused and no upload or indexing happens.
+# IDs are kept per project (common/manifest.py client_scope), and checked once per process before being reused, so a
+# file or vector store deleted in the meantime is uploaded or created again.
+
+DEFAULT_MANIFEST_PATH = CACHE_DIR / "vector_stores.json"
+
+
+def file_sha256(file_path: os.PathLike, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Compute the SHA-256 of a file without reading it into memory at once.
+
+    :param file_path (os.PathLike): The file to hash.
+    :param chunk_size (int): The number of bytes read at a time.
+    :return: The hex encoded digest.
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class VectorStoreCache:
+    """
+    Reuses uploaded files and vector stores as long as the file contents and chunking settings are unchanged.
+
+    :param project_client (AIProjectClient): The client used to upload files and create vector stores.
+    :param path (os.PathLike): The JSON manifest in which the known IDs are stored.
+    :param verify (bool): Check that a cached file or vector store still exists before reusing it.
+    :param scope (Optional[str]): The project key of the manifest entries, None for client_scope(project_client).
+    """
+
+    def __init__(
+        self,
+        project_client,
+        path: os.PathLike = DEFAULT_MANIFEST_PATH,
+        verify: bool = True,
+        scope: Optional[str] = None,
+    ):
+        self._client = project_client
+        self._path = path
+        self._verify = verify
+        self._scope = scope or client_scope(project_client)
+        self._verified_files: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def get_or_upload_file(self, file_path: os.PathLike, content_hash: Optional[str] = None) -> str:
+        """
+        Return the ID of an uploaded file with the same content, uploading it only if needed.
+
+        :param file_path (os.PathLike): The local file.
+        :param content_hash (Optional[str]): The SHA-256 of the file, if already known.
+        :return: The file ID.
+        :rtype: str
+        """
+        content_hash = content_hash or file_sha256(file_path)
+        with self._lock:
+            file_id = self._load().get("files", {}).get(content_hash)
+        if file_id and self._file_exists(file_id):
+            logging.info(f"Reusing file {file_id} for {file_path}")
+            return file_id
+
+        file = self._client.agents.upload_file_and_poll(file_path=str(file_path), purpose="assistants")
+        logging.info(f"Uploaded file {file_path}, file ID: {file.id}")
+        with self._lock:
+            entries = self._load()
+            entries.setdefault("files", {})[content_hash] = file.id
+            self._save(entries)
+            self._verified_files.add(file.id)
+        return file.id
+
+    def get_or_create_vector_store(
+        self,
+        file_paths: List[os.PathLike],
+        name: str,
+        max_chunk_size_tokens: Optional[int] = None,
+        chunk_overlap_tokens: Optional[int] = None,
+    ) -> str:
+        """
+        Return the ID of a vector store indexing exactly these file contents with these chunking settings.
+
+        :param file_paths (List[os.PathLike]): The local files to index.
+        :param name (str): The vector store name, used when a new store has to be created.
+        :param max_chunk_size_tokens (Optional[int]): Static chunking size, None for the service default.
+        :param chunk_overlap_tokens (Optional[int]): Static chunking overlap, None for the service default.
+        :return: The vector store ID.
+        :rtype: str
+        """
+        hashes = [file_sha256(p) for p in file_paths]
+        chunking = {"max_chunk_size_tokens": max_chunk_size_tokens, "chunk_overlap_tokens": chunk_overlap_tokens}
+        key_source = json.dumps({"files": sorted(hashes), "chunking": chunking}, sort_keys=True)
+        key = hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+        with self._lock:
+            vector_store_id = self._load().get("vector_stores", {}).get(key)
+        if vector_store_id and self._is_usable(vector_store_id):
+            logging.info(f"Reusing vector store {vector_store_id}")
+            return vector_store_id
+
+        file_ids = [self.get_or_upload_file(p, h) for p, h in zip(file_paths, hashes)]
+        chunking_strategy = None
+        if max_chunk_size_tokens is not None or chunk_overlap_tokens is not None:
+            chunking_strategy = VectorStoreStaticChunkingStrategyRequest(
+                static=VectorStoreStaticChunkingStrategyOptions(
+                    max_chunk_size_tokens=max_chunk_size_tokens or 800,
+                    chunk_overlap_tokens=chunk_overlap_tokens or 400,
+                )
+            )
+        vector_store = self._client.agents.create_vector_store_and_poll(
+            file_ids=file_ids, name=name, chunking_strategy=chunking_strategy
+        )
+        logging.info(f"Created vector store, vector store ID: {vector_store.id}")
+
+        with self._lock:
+            entries = self._load()
+            entries.setdefault("vector_stores", {})[key] = vector_store.id
+            self._save(entries)
+        return vector_store.id
+
+    def file_search_tool(self, file_paths: List[os.PathLike], name: str, **chunking: Any) -> FileSearchTool:
+        """
+        Build a FileSearchTool backed by a cached vector store.
+
+        :param file_paths (List[os.PathLike]): The local files to index.
+        :param name (str): The vector store name.
+        :return: The file search tool.
+        :rtype: FileSearchTool
+        """
+        return FileSearchTool(vector_store_ids=[self.get_or_create_vector_store(file_paths, name, **chunking)])
+
+    def _is_usable(self, vector_store_id: str) -> bool:
+        if not self._verify:
+            return True
+        try:
+            vector_store = self._client.agents.get_vector_store(vector_store_id)
+        except ResourceNotFoundError:
+            logging.info(f"Cached vector store {vector_store_id} no longer exists")
+            self._forget_vector_store(vector_store_id)
+            return False
+        return vector_store.status != "expired"
+
+    def _file_exists(self, file_id: str) -> bool:
+        if not self._verify or file_id in self._verified_files:
+            return True
+        try:
+            self._client.agents.get_file(file_id)
+        except ResourceNotFoundError:
+            logging.info(f"Cached file {file_id} no longer exists")
+            self._forget("files", file_id)
+            return False
+        self._verified_files.add(file_id)
+        return True
+
+    def _forget_vector_store(self, vector_store_id: str) -> None:
+        self._forget("vector_stores", vector_store_id)
+
+    def _forget(self, kind: str, object_id: str) -> None:
+        with self._lock:
+            entries = self._load()
+            ids: Dict[str, str] = entries.get(kind, {})
+            entries[kind] = {k: v for k, v in ids.items() if v != object_id}
+            self._save(entries)
+
+    def _load(self) -> Dict[str, Dict[str, str]]:
+        return load_manifest(self._path).get(self._scope, {})
+
+    def _save(self, entries: Dict[str, Dict[str, str]]) -> None:
+        # The manifest holds the files and vector stores of every project, each under its scope
+        manifest = load_manifest(self._path)
+        manifest[self._scope] = entries
+        save_manifest(self._path, manifest)
@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, Optional
+
+from azure.ai.projects.models import Agent
+
+from common.agent_registry import AgentRegistry
+from common.manifest import CACHE_DIR, client_scope
+
+# Warm pool of pre-created threads, so a new conversation doesn't wait on create_agent and create_thread.
+# A background worker resolves the agent through the registry and keeps `size` empty threads ready, refilling the
+# pool as threads are taken. The ready threads are kept in a SQLite file, so the next process (or another worker)
+# starts with threads that already exist: taking one is a local query, not a round trip. When the pool is empty a
+# thread is created on the spot. Threads are only reused within the project they were created in; the threads of a
+# routed client (common/router.py) are pooled apart, since the router may create them in any of its projects and
+# finds their project again from its own records.
+
+DEFAULT_MAX_AGE_SECONDS = 7 * 24 * 3600
+
+
+class WarmThreadStore:
+    """
+    The ready threads, shared by all processes using the same file. Taking a thread is atomic.
+
+    :param path (os.PathLike): The SQLite database file.
+    :param max_age_seconds (float): Older threads are not handed out anymore.
+    """
+
+    def __init__(self, path: os.PathLike = CACHE_DIR / "warm_threads.db", max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS):
+        self._max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(str(path), timeout=5, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS warm_threads (thread_id TEXT PRIMARY KEY, scope TEXT, created REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS warm_threads_scope ON warm_threads (scope, created)")
+
+    def put(self, scope: str, thread_id: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO warm_threads (thread_id, scope, created) VALUES (?, ?, ?)",
+                (thread_id, scope, time.time()),
+            )
+
+    def take(self, scope: str) -> Optional[str]:
+        with self._lock:
+            self._db.execute("DELETE FROM warm_threads WHERE created <= ?", (time.time() - self._max_age_seconds,))
+            row = self._db.execute(
+                "DELETE FROM warm_threads WHERE thread_id = "
+                "(SELECT thread_id FROM warm_threads WHERE scope = ? ORDER BY created LIMIT 1) RETURNING thread_id",
+                (scope,),
+            ).fetchone()
+        return row[0] if row else None
+
+    def count(self, scope: str) -> int:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COUNT(*) FROM warm_threads WHERE scope = ? AND created > ?",
+                (scope, time.time() - self._max_age_seconds),
+            ).fetchone()
+        return row[0]
+
+
+class WarmPool:
+    """
+    Keeps the agent and a number of threads ready in the background.
+
+    :param project_client (AIProjectClient): The project client.
+    :param size (int): The number of ready threads to keep.
+    :param agent_kwargs (Optional[Dict[str, Any]]): Arguments of AgentRegistry.get_or_create, None for no agent.
+    :param registry (Optional[AgentRegistry]): The registry the agent comes from, None for the default one.
+    :param store (Optional[WarmThreadStore]): Where the ready threads are kept, None for the default file.
+    :param scope (Optional[str]): The project key of the threads, None for client_scope(project_client).
+    """
+
+    def __init__(
+        self,
+        project_client,
+        size: int = 4,
+        agent_kwargs: Optional[Dict[str, Any]] = None,
+        registry: Optional[AgentRegistry] = None,
+        store: Optional[WarmThreadStore] = None,
+        scope: Optional[str] = None,
+    ):
+        self._client = project_client
+        self._size = size
+        self._agent_kwargs = agent_kwargs
+        self._registry = registry or AgentRegistry(project_client)
+        self._store = store or WarmThreadStore()
+        self._scope = scope or client_scope(project_client)
+        self._agent: Future = Future()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(target=self._run, name="warm-pool", daemon=True)
+        self._worker.start()
+
+    def agent(self, timeout: Optional[float] = None) -> Agent:
+        """
+        The agent, waiting for the background worker to resolve it if needed.
+
+        :param timeout (Optional[float]): Seconds to wait at most.
+        :return: The agent.
+        :rtype: Agent
+        """
+        return self._agent.result(timeout)
+
+    def take_thread(self) -> str:
+        """
+        A ready thread, or a new one if the pool is empty.
+
+        :return: The thread ID.
+        :rtype: str
+        """
+        # With size 0 the pool only prepares the agent, threads are always created on demand
+        thread_id = self._store.take(self._scope) if self._size > 0 else None
+        self._wakeup.set()
+        if thread_id is None:
+            logging.info("Warm pool is empty, creating a thread")
+            thread_id = self._client.agents.create_thread().id
+        return thread_id
+
+    def close(self) -> None:
+        """Stop refilling. The ready threads stay in the store for the next process."""
+        self._stopped.set()
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        if self._agent_kwargs is None:
+            self._agent.set_result(None)
+        else:
+            try:
+                self._agent.set_result(self._registry.get_or_create(**self._agent_kwargs))
+            except Exception as e:
+                self._agent.set_exception(e)
+        while not self._stopped.is_set():
+            try:
+                while not self._stopped.is_set() and self._store.count(self._scope) < self._size:
+                    self._store.put(self._scope, self._client.agents.create_thread().id)
+            except Exception as e:
+                logging.warning(f"Could not refill the warm pool: {e}")
+            self._wakeup.wait(timeout=60)
+            self._wakeup.clear()
+
+
+class AsyncWarmPool:
+    """
+    Same as WarmPool, for the async client from azure.ai.projects.aio. Call start() from the event loop.
+
+    :param project_client (AIProjectClient): The async project client.
+    :param size (int): The number of ready threads to keep.
+    :param store (Optional[WarmThreadStore]): Where the ready threads are kept, None for the default file.
+    :param scope (Optional[str]): The project key of the threads, None for client_scope(project_client).
+    :param max_parallel_creates (int): Threads created at the same time while refilling.
+    """
+
+    def __init__(
+        self,
+        project_client,
+        size: int = 16,
+        store: Optional[WarmThreadStore] = None,
+        scope: Optional[str] = None,
+        max_parallel_creates: int = 8,
+    ):
+        self._client = project_client
+        self._size = size
+        self._store = store or WarmThreadStore()
+        self._scope = scope or client_scope(project_client)
+        self._max_parallel_creates = max_parallel_creates
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def take_thread(self) -> str:
+        """
+        A ready thread, or a new one if the pool is empty.
+
+        :return: The thread ID.
+        :rtype: str
+        """
+        thread_id = self._store.take(self._scope)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        if thread_id is None:
+            thread_id = (await self._client.agents.create_thread()).id
+        return thread_id
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _create(self) -> None:
+        self._store.put(self._scope, (await self._client.agents.create_thread()).id)
+
+    async def _run(self) -> None:
+        while True:
+            # Cleared before counting, so a thread taken meanwhile wakes the loop up again
+            self._wakeup.clear()
+            missing = self._size - self._store.count(self._scope)
+            if missing > 0:
+                results = await asyncio.gather(
+                    *[self._create() for _ in range(min(missing, self._max_parallel_creates))], return_exceptions=True
+                )
+                errors = [r for r in results if isinstance(r, Exception)]
+                if errors:
+                    logging.warning(f"Could not refill the warm pool: {errors[0]}")
+                    await asyncio.sleep(5)
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=60)
+            except asyncio.TimeoutError:
+                pass
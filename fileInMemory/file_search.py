@@ -1,30 +1,35 @@
-import os
-from azure.ai.projects import AIProjectClient
+import os, sys
 from azure.ai.projects.models import (
     FileSearchTool,
 )
-from azure.identity import DefaultAzureCredential
 from dotenv import load_dotenv
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.agent_registry import AgentRegistry
+from common.bootstrap import create_client
+from common.rate_limiter import RunScheduler
+from common.vector_store_cache import VectorStoreCache
+from common.response_cache import response_cache_from_env
+
 load_dotenv()
-project_client = AIProjectClient.from_connection_string(
-    credential=DefaultAzureCredential(), conn_str=os.environ["PROJECT_CONNECTION_STRING"]
-)
+project_client = create_client()
+
+# Runs go through the scheduler, which waits and submits again when the model is rate limited
+scheduler = RunScheduler()
 
 with project_client:
 
-    # Upload file and create vector store
+    # Upload file and create vector store, unless the same content was already uploaded and indexed
     # [START upload_file_create_vector_store_and_agent_with_file_search_tool]
-    file = project_client.agents.upload_file_and_poll(file_path="./fileInMemory/product_info.md", purpose="assistants")
-    print(f"Uploaded file, file ID: {file.id}")
-
-    vector_store = project_client.agents.create_vector_store_and_poll(file_ids=[file.id], name="my_vectorstore")
-    print(f"Created vector store, vector store ID: {vector_store.id}")
+    vector_store_id = VectorStoreCache(project_client).get_or_create_vector_store(
+        ["./fileInMemory/product_info.md"], name="my_vectorstore"
+    )
+    print(f"Using vector store, vector store ID: {vector_store_id}")
 
     # Create file search tool with resources followed by creating agent
-    file_search = FileSearchTool(vector_store_ids=[vector_store.id])
+    file_search = FileSearchTool(vector_store_ids=[vector_store_id])
 
-    agent = project_client.agents.create_agent(
+    agent = AgentRegistry(project_client).get_or_create(
         model="gpt-4o-mini",
         name="my-assistant",
         instructions="Hello, you are helpful assistant and can search information from uploaded files",
@@ -33,51 +38,58 @@ with project_client:
     )
     # [END upload_file_create_vector_store_and_agent_with_file_search_tool]
 
-    print(f"Created agent, ID: {agent.id}")
-
-    # Create thread for communication
-    thread = project_client.agents.create_thread()
-    print(f"Created thread, ID: {thread.id}")
-
-    # Create message to thread
-    message = project_client.agents.create_message(
-        thread_id=thread.id, role="user", content="Hello, what Contoso products do you know?"
-    )
-    print(f"Created message, ID: {message.id}")
-
-    # Create and process assistant run in thread with tools
-    run = project_client.agents.create_and_process_run(thread_id=thread.id, assistant_id=agent.id)
-    print(f"Run finished with status: {run.status}")
-
-    if run.status == "failed":
-        # Check if you got "Rate limit is exceeded.", then you want to get more quota
-        print(f"Run failed: {run.last_error}")
-
-    # Get messages from the thread
-    messages = project_client.agents.list_messages(thread_id=thread.id)
-    print(f"Messages: {messages}")
-
-    # Get the last message from the sender
-    last_msg = messages.get_last_text_message_by_sender("assistant")
-    if last_msg:
-        print(f"Last Message: {last_msg.text.value}")
-
-    # [START teardown]
-    # Delete the file when done
-    project_client.agents.delete_vector_store(vector_store.id)
-    print("Deleted vector store")
-
-    project_client.agents.delete_file(file_id=file.id)
-    print("Deleted file")
-
-    # Delete the agent when done
-    project_client.agents.delete_agent(agent.id)
-    print("Deleted agent")
-    # [END teardown]
-
-    # Fetch and log all messages
-    messages = project_client.agents.list_messages(thread_id=thread.id)
-
-    # Print citations from the messages
-    for citation in messages.file_citation_annotations:
-        print(citation)
\ No newline at end of file
+    print(f"Using agent, ID: {agent.id}")
+
+    prompt = "Hello, what Contoso products do you know?"
+
+    if os.environ.get("RESPONSE_CACHE"):
+        # Answer repeated prompts from the local response cache (.cache/responses.db), citations included.
+        # RESPONSE_CACHE_SIMILARITY also serves prompts close to a cached one, compared with the embeddings of
+        # RESPONSE_CACHE_EMBEDDING_MODEL; tune the threshold on your own prompts.
+        response_cache = response_cache_from_env(project_client, scheduler)
+        response_msg, cached = response_cache.run(agent, prompt)
+        print(f"Answered {'from the response cache' if cached else 'by a new run'}")
+        if response_msg:
+            for text_msg in response_msg.text_messages:
+                print(f"Last Message: {text_msg.text.value}")
+            for citation in response_msg.file_citation_annotations:
+                print(citation)
+    else:
+        # Create thread for communication
+        thread = project_client.agents.create_thread()
+        print(f"Created thread, ID: {thread.id}")
+
+        # Create message to thread
+        message = project_client.agents.create_message(
+            thread_id=thread.id, role="user", content=prompt
+        )
+        print(f"Created message, ID: {message.id}")
+
+        # Create and process assistant run in thread with tools
+        run = scheduler.submit_sync(
+            agent.model,
+            lambda: project_client.agents.create_and_process_run(thread_id=thread.id, assistant_id=agent.id),
+        )
+        print(f"Run finished with status: {run.status}")
+
+        if run.status == "failed":
+            # Check if you got "Rate limit is exceeded.", then you want to get more quota
+            print(f"Run failed: {run.last_error}")
+
+        # Get messages from the thread
+        messages = project_client.agents.list_messages(thread_id=thread.id)
+        print(f"Messages: {messages}")
+
+        # Get the last message from the sender
+        last_msg = messages.get_last_text_message_by_sender("assistant")
+        if last_msg:
+            print(f"Last Message: {last_msg.text.value}")
+
+        # The file and vector store are kept, so the next run can reuse them without indexing again
+
+        # Fetch and log all messages
+        messages = project_client.agents.list_messages(thread_id=thread.id)
+
+        # Print citations from the messages
+        for citation in messages.file_citation_annotations:
+            print(citation)
@@ -0,0 +1,82 @@
+import os, sys, json
+from azure.ai.projects.models import (
+    FunctionTool, ToolSet,
+)
+from dotenv import load_dotenv
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.agent_registry import AgentRegistry
+from common.bootstrap import create_client
+from common.rate_limiter import RunScheduler
+from common.local_index import get_index, inference_embeddings
+
+# Same scenario as file_search.py, but the product information is searched by a local function tool.
+# There is no upload and no remote indexing, and a query doesn't leave the process.
+# Set LOCAL_INDEX_EMBEDDING_MODEL to an embedding deployment of the project (needs azure-ai-inference) to rank with
+# real embeddings instead of the hashed ones; queries are then embedded by the model.
+
+PRODUCT_FILES = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "product_info.md")]
+
+
+def search_product_info(query: str) -> str:
+    """
+    Searches the Contoso product information for the passages that best match the query.
+
+    :param query (str): The search query, e.g. a product name or a question about a product.
+    :return: The matching passages as a JSON string.
+    :rtype: str
+    """
+    results = get_index(PRODUCT_FILES, embed_fn=embed_fn).search(query, top_k=3)
+    return json.dumps({"results": results})
+
+
+load_dotenv()
+project_client = create_client()
+embedding_model = os.environ.get("LOCAL_INDEX_EMBEDDING_MODEL")
+embed_fn = inference_embeddings(project_client, embedding_model) if embedding_model else None
+
+with project_client:
+
+    # Build the local index (or load it, if the files didn't change)
+    get_index(PRODUCT_FILES, embed_fn=embed_fn)
+
+    toolset = ToolSet()
+    toolset.add(FunctionTool({search_product_info}))
+
+    agent = AgentRegistry(project_client).get_or_create(
+        model="gpt-4o-mini",
+        name="my-assistant",
+        instructions="Hello, you are helpful assistant and can search product information with the search_product_info function",
+        toolset=toolset,
+    )
+    print(f"Using agent, ID: {agent.id}")
+
+    # Create thread for communication
+    thread = project_client.agents.create_thread()
+    print(f"Created thread, ID: {thread.id}")
+
+    # Create message to thread
+    message = project_client.agents.create_message(
+        thread_id=thread.id, role="user", content="Hello, what Contoso products do you know?"
+    )
+    print(f"Created message, ID: {message.id}")
+
+    # Create and process assistant run in thread with tools, through the scheduler which waits and submits again when
+    # the model is rate limited
+    run = RunScheduler().submit_sync(
+        agent.model,
+        lambda: project_client.agents.create_and_process_run(
+            thread_id=thread.id, assistant_id=agent.id, toolset=toolset
+        ),
+    )
+    print(f"Run finished with status: {run.status}")
+
+    if run.status == "failed":
+        # Check if you got "Rate limit is exceeded.", then you want to get more quota
+        print(f"Run failed: {run.last_error}")
+
+    # Get the last message from the sender
+    messages = project_client.agents.list_messages(thread_id=thread.id)
+    last_msg = messages.get_last_text_message_by_sender("assistant")
+    if last_msg:
+        print(f"Last Message: {last_msg.text.value}")
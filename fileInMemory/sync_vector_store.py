@@ -0,0 +1,187 @@
+import os, sys, time, logging, argparse
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Set
+from azure.ai.projects import AIProjectClient
+from azure.core.exceptions import ResourceNotFoundError
+from dotenv import load_dotenv
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.bootstrap import create_client
+from common.manifest import CACHE_DIR, client_scope, load_manifest, save_manifest
+from common.vector_store_cache import file_sha256
+
+# Keeps a vector store in sync with a directory of files, uploading only what changed since the last sync.
+# A local manifest remembers mtime, size, hash and file ID of every synced file. Files whose mtime and size didn't
+# change are not even hashed, so a sync of an unchanged catalogue costs a directory scan. The manifest keeps one state
+# per project and vector store name, bound to the directory it syncs. New and changed files are indexed before the
+# files they replace are removed, so the vector store stays complete while it syncs.
+#
+# Example: python fileInMemory/sync_vector_store.py ./catalogue --name product_catalogue
+
+MANIFEST_PATH = CACHE_DIR / "vector_store_sync.json"
+
+
+def scan_directory(directory: Path, pattern: str, previous: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Describe the files of the directory, reusing the previous hash of files whose mtime and size are unchanged.
+
+    :param directory (Path): The directory to scan.
+    :param pattern (str): The glob pattern of the files to sync.
+    :param previous (Dict[str, Dict[str, Any]]): The files of the last sync, by relative path.
+    :return: The current files, by relative path.
+    :rtype: Dict[str, Dict[str, Any]]
+    """
+    current = {}
+    for path in sorted(directory.rglob(pattern)):
+        if not path.is_file():
+            continue
+        relative = path.relative_to(directory).as_posix()
+        stat = path.stat()
+        known = previous.get(relative)
+        if known and known["mtime"] == stat.st_mtime and known["size"] == stat.st_size:
+            current[relative] = dict(known)
+        else:
+            current[relative] = {"mtime": stat.st_mtime, "size": stat.st_size, "sha256": file_sha256(path)}
+            if known and known["sha256"] == current[relative]["sha256"]:
+                current[relative]["file_id"] = known["file_id"]
+    return current
+
+
+def completed_batch_files(project_client: AIProjectClient, vector_store_id: str, batch_id: str) -> Set[str]:
+    """
+    The IDs of the files of a file batch that were indexed.
+
+    :param project_client (AIProjectClient): The project client.
+    :param vector_store_id (str): The vector store.
+    :param batch_id (str): The file batch.
+    :return: The file IDs.
+    :rtype: Set[str]
+    """
+    completed, after = set(), None
+    while True:
+        page = project_client.agents.list_vector_store_file_batch_files(
+            vector_store_id=vector_store_id, batch_id=batch_id, filter="completed", limit=100, after=after
+        )
+        completed.update(f.id for f in page.data)
+        if not page.has_more:
+            return completed
+        after = page.last_id
+
+
+def sync_directory(project_client: AIProjectClient, directory: Path, name: str, pattern: str, batch_size: int, workers: int) -> str:
+    """
+    Upload new and changed files to the vector store and remove deleted ones.
+
+    :param project_client (AIProjectClient): The project client.
+    :param directory (Path): The directory to sync.
+    :param name (str): The vector store name, also the key in the manifest within the project.
+    :param pattern (str): The glob pattern of the files to sync.
+    :param batch_size (int): The number of files added to the vector store per file batch.
+    :param workers (int): The number of parallel uploads.
+    :return: The vector store ID.
+    :rtype: str
+    :raises ValueError: When the name is already synced from another directory in this project.
+    """
+    scope = client_scope(project_client)
+    manifest = load_manifest(MANIFEST_PATH)
+    source = str(directory.resolve())
+    state = manifest.get(scope, {}).get(name, {"directory": source, "vector_store_id": None, "files": {}})
+    if state.get("directory", source) != source:
+        raise ValueError(f"Vector store {name} is synced from {state['directory']}, sync {source} under another name")
+    state["directory"] = source
+
+    def save() -> None:
+        manifest.setdefault(scope, {})[name] = state
+        save_manifest(MANIFEST_PATH, manifest)
+
+    vector_store_id = state["vector_store_id"]
+    if vector_store_id:
+        try:
+            project_client.agents.get_vector_store(vector_store_id)
+        except ResourceNotFoundError:
+            logging.warning(f"Vector store {vector_store_id} no longer exists, syncing all files again")
+            vector_store_id, state["files"], state["to_remove"] = None, {}, []
+    if not vector_store_id:
+        vector_store_id = project_client.agents.create_vector_store_and_poll(name=name).id
+        logging.info(f"Created vector store, vector store ID: {vector_store_id}")
+    state["vector_store_id"] = vector_store_id
+
+    previous: Dict[str, Dict[str, Any]] = state["files"]
+    current = scan_directory(directory, pattern, previous)
+    to_upload = [path for path, info in current.items() if "file_id" not in info]
+    # Replaced and deleted files, plus those a previous sync stopped before removing
+    to_remove = list(state.get("to_remove", [])) + [
+        info["file_id"]
+        for path, info in previous.items()
+        if path not in current or current[path].get("file_id") != info["file_id"]
+    ]
+    logging.info(f"{len(current)} files, {len(to_upload)} to upload, {len(to_remove)} to remove")
+
+    def remove(file_id: str) -> None:
+        # The uploaded file is deleted even if it was not (or no longer) in the vector store
+        try:
+            project_client.agents.delete_vector_store_file(vector_store_id=vector_store_id, file_id=file_id)
+        except ResourceNotFoundError:
+            pass
+        try:
+            project_client.agents.delete_file(file_id=file_id)
+        except ResourceNotFoundError:
+            pass
+
+    def upload(path: str) -> str:
+        return project_client.agents.upload_file(file_path=str(directory / path), purpose="assistants").id
+
+    # Only the files that are synced are kept in the manifest, so an interrupted sync resumes where it stopped
+    state["files"] = {path: info for path, info in current.items() if "file_id" in info}
+    state["to_remove"] = to_remove
+    save()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(to_upload), batch_size):
+            batch = to_upload[start : start + batch_size]
+            file_ids = list(pool.map(upload, batch))
+            file_batch = project_client.agents.create_vector_store_file_batch_and_poll(
+                vector_store_id=vector_store_id, file_ids=file_ids
+            )
+            indexed = set(file_ids)
+            counts = file_batch.file_counts
+            if file_batch.status != "completed" or counts.completed != len(file_ids):
+                indexed = completed_batch_files(project_client, vector_store_id, file_batch.id)
+            # Files that failed indexing are not recorded, so the next sync uploads them again
+            failed = [(path, file_id) for path, file_id in zip(batch, file_ids) if file_id not in indexed]
+            for path, file_id in failed:
+                logging.warning(f"Indexing of {path} failed ({file_batch.status}), it will be retried on the next sync")
+            list(pool.map(remove, [file_id for _, file_id in failed]))
+            for path, file_id in zip(batch, file_ids):
+                if file_id in indexed:
+                    state["files"][path] = dict(current[path], file_id=file_id)
+            save()
+            logging.info(f"Indexed {start + len(batch)}/{len(to_upload)} files, {len(failed)} failed")
+        # The replaced files go once their replacements are searchable
+        list(pool.map(remove, to_remove))
+
+    state["to_remove"] = []
+    save()
+    return vector_store_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync a directory of files into a vector store.")
+    parser.add_argument("directory", type=Path)
+    parser.add_argument("--name", default="my_vectorstore", help="vector store name")
+    parser.add_argument("--pattern", default="*.md", help="glob pattern of the files to sync")
+    parser.add_argument("--batch-size", type=int, default=100, help="files added to the vector store per batch")
+    parser.add_argument("--workers", type=int, default=8, help="parallel uploads")
+    args = parser.parse_args()
+
+    project_client = create_client()
+    with project_client:
+        start = time.perf_counter()
+        vector_store_id = sync_directory(project_client, args.directory, args.name, args.pattern, args.batch_size, args.workers)
+        print(f"Synced {args.directory} into vector store {vector_store_id} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -1,15 +1,17 @@
-import os
-from azure.ai.projects import AIProjectClient
+import os, sys
 from azure.ai.projects.models import (
     BingGroundingTool,
 )
-from azure.identity import DefaultAzureCredential
 from dotenv import load_dotenv
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.agent_registry import AgentRegistry
+from common.bootstrap import create_client
+from common.rate_limiter import RunScheduler
+from common.response_cache import response_cache_from_env
+
 load_dotenv()
-project_client = AIProjectClient.from_connection_string(
-    credential=DefaultAzureCredential(), conn_str=os.environ["PROJECT_CONNECTION_STRING"]
-)
+project_client = create_client()
 
 bing_connection = project_client.connections.get(connection_name=os.environ["BING_CONNECTION_NAME"])
 conn_id = bing_connection.id
@@ -20,8 +22,11 @@ print(conn_id)
 bing = BingGroundingTool(connection_id=conn_id)
 
 # Create agent with the bing tool and process assistant run
+# Runs go through the scheduler, which waits and submits again when the model is rate limited
+scheduler = RunScheduler()
+
 with project_client:
-    agent = project_client.agents.create_agent(
+    agent = AgentRegistry(project_client).get_or_create(
         model=os.environ["GPT4o_CONNECTION_NAME"],
         name="my-assistant",
         instructions="You are a helpful assistant",
@@ -30,37 +35,50 @@ with project_client:
     )
     # [END create_agent_with_bing_grounding_tool]
 
-    print(f"Created agent, ID: {agent.id}")
+    print(f"Using agent, ID: {agent.id}")
 
-    # Create thread for communication
-    thread = project_client.agents.create_thread()
-    print(f"Created thread, ID: {thread.id}")
+    prompt = "How does wikipedia explain Euler's Identity?"
 
-    # Create message to thread
-    message = project_client.agents.create_message(
-        thread_id=thread.id,
-        role="user",
-        content="How does wikipedia explain Euler's Identity?",
-    )
-    print(f"Created message, ID: {message.id}")
+    if os.environ.get("RESPONSE_CACHE"):
+        # Answer repeated prompts from the local response cache (.cache/responses.db). Answers grounded with Bing
+        # expire quickly (see DEFAULT_TOOL_TTLS in common/response_cache.py).
+        response_cache = response_cache_from_env(project_client, scheduler)
+        response_msg, cached = response_cache.run(agent, prompt)
+        print(f"Answered {'from the response cache' if cached else 'by a new run'}")
+        if response_msg:
+            for text_msg in response_msg.text_messages:
+                print(f"Last Message: {text_msg.text.value}")
+                for annotation in text_msg.text.annotations:
+                    print(annotation)
+    else:
+        # Create thread for communication
+        thread = project_client.agents.create_thread()
+        print(f"Created thread, ID: {thread.id}")
+
+        # Create message to thread
+        message = project_client.agents.create_message(
+            thread_id=thread.id,
+            role="user",
+            content=prompt,
+        )
+        print(f"Created message, ID: {message.id}")
 
-    # Create and process agent run in thread with tools
-    run = project_client.agents.create_and_process_run(thread_id=thread.id, assistant_id=agent.id)
-    print(f"Run finished with status: {run.status}")
+        # Create and process agent run in thread with tools
+        run = scheduler.submit_sync(
+            agent.model,
+            lambda: project_client.agents.create_and_process_run(thread_id=thread.id, assistant_id=agent.id),
+        )
+        print(f"Run finished with status: {run.status}")
 
-    if run.status == "failed":
-        print(f"Run failed: {run.last_error}")
-        
-    messages = project_client.agents.list_messages(thread_id=thread.id)
+        if run.status == "failed":
+            print(f"Run failed: {run.last_error}")
 
-    last_msg = messages.get_last_text_message_by_sender("assistant")
-    if last_msg:
-        print(f"Last Message: {last_msg.text.value}")
+        messages = project_client.agents.list_messages(thread_id=thread.id)
 
-    # Delete the assistant when done
-    project_client.agents.delete_agent(agent.id)
-    print("Deleted agent")
+        last_msg = messages.get_last_text_message_by_sender("assistant")
+        if last_msg:
+            print(f"Last Message: {last_msg.text.value}")
 
-    # Fetch and log all messages
-    messages = project_client.agents.list_messages(thread_id=thread.id)
-    print(f"Messages: {messages}")
\ No newline at end of file
+        # Fetch and log all messages
+        messages = project_client.agents.list_messages(thread_id=thread.id)
+        print(f"Messages: {messages}")
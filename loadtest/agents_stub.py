@@ -0,0 +1,359 @@
+import json, time, uuid, random, asyncio, argparse
+from typing import Any, Dict, List, Optional
+from aiohttp import web
+
+# Local stub of the Agents REST API, for load tests without network or quota.
+# It implements the calls of the chat lifecycle (agents, threads, messages, runs, tool outputs, run steps) in memory.
+# Every request waits for a sampled latency, runs go through queued -> in_progress -> (requires_action ->
+# in_progress) -> completed with sampled durations, and failures can be injected:
+# - HTTP 429 with Retry-After on a share of the requests, or when the requests per minute quota is exceeded,
+# - runs failing with "rate_limit_exceeded", or with a server error.
+#
+# Example: python loadtest/agents_stub.py --port 8765 --tool-call-ratio 0.5 --throttle-ratio 0.02
+# Point the async client at it with endpoint "http://127.0.0.1:8765" (see loadtest/load_generator.py).
+
+PREFIX = "/agents/v1.0/subscriptions/{sub}/resourceGroups/{rg}/providers/Microsoft.MachineLearningServices/workspaces/{project}"
+
+# Tool calls the stub asks for in requires_action, matching the functions of toolset/utility_func.py
+TOOL_CALLS = [
+    ("fetch_weather", {"location": "Seattle"}),
+    ("calculate_sum", {"a": 45, "b": 55}),
+    ("convert_temperature", {"celsius": 25}),
+    ("fetch_current_datetime", {}),
+]
+
+
+class LatencyDistribution:
+    """
+    Log-normal latency, the usual shape of service latencies (a long tail above the median).
+
+    :param median_ms (float): The median latency in milliseconds.
+    :param sigma (float): The spread, 0 for a constant latency.
+    """
+
+    def __init__(self, median_ms: float, sigma: float = 0.5):
+        self._median = median_ms / 1000
+        self._sigma = sigma
+
+    def sample(self) -> float:
+        return self._median * random.lognormvariate(0, self._sigma) if self._sigma else self._median
+
+
+class StubState:
+    """
+    In-memory objects of the stub, and the behaviour of its runs.
+
+    :param request_latency (LatencyDistribution): Latency of every request.
+    :param queue_latency (LatencyDistribution): Time a run stays queued.
+    :param model_latency (LatencyDistribution): Time a run (or the part after tool outputs) stays in progress.
+    :param tool_call_ratio (float): Share of runs asking for tool calls.
+    :param tool_calls_per_run (int): Tool calls asked at once.
+    :param throttle_ratio (float): Share of requests answered with 429.
+    :param requests_per_minute (Optional[float]): Quota above which requests are answered with 429.
+    :param run_rate_limit_ratio (float): Share of runs failing with rate_limit_exceeded.
+    :param run_error_ratio (float): Share of runs failing with a server error.
+    """
+
+    def __init__(
+        self,
+        request_latency: LatencyDistribution,
+        queue_latency: LatencyDistribution,
+        model_latency: LatencyDistribution,
+        tool_call_ratio: float = 0.0,
+        tool_calls_per_run: int = 1,
+        throttle_ratio: float = 0.0,
+        requests_per_minute: Optional[float] = None,
+        run_rate_limit_ratio: float = 0.0,
+        run_error_ratio: float = 0.0,
+    ):
+        self.request_latency = request_latency
+        self.queue_latency = queue_latency
+        self.model_latency = model_latency
+        self.tool_call_ratio = tool_call_ratio
+        self.tool_calls_per_run = tool_calls_per_run
+        self.throttle_ratio = throttle_ratio
+        self.requests_per_minute = requests_per_minute
+        self.run_rate_limit_ratio = run_rate_limit_ratio
+        self.run_error_ratio = run_error_ratio
+        self.agents: Dict[str, Dict[str, Any]] = {}
+        self.threads: Dict[str, Dict[str, Any]] = {}
+        self.messages: Dict[str, List[Dict[str, Any]]] = {}
+        self.runs: Dict[str, Dict[str, Any]] = {}
+        self.plans: Dict[str, Dict[str, Any]] = {}
+        self.request_times: List[float] = []
+        self.stats = {"requests": 0, "throttled": 0, "runs": 0}
+
+    def throttle(self) -> bool:
+        now = time.monotonic()
+        if self.requests_per_minute:
+            self.request_times = [t for t in self.request_times if now - t < 60]
+            if len(self.request_times) >= self.requests_per_minute:
+                return True
+            self.request_times.append(now)
+        return random.random() < self.throttle_ratio
+
+    def new_run(self, thread_id: str, agent_id: str) -> Dict[str, Any]:
+        now = time.time()
+        run = {
+            "id": f"run_{uuid.uuid4().hex[:24]}",
+            "object": "thread.run",
+            "created_at": int(now),
+            "thread_id": thread_id,
+            "assistant_id": agent_id,
+            "status": "queued",
+            "model": self.agents.get(agent_id, {}).get("model", "gpt-4o-mini"),
+            "instructions": "",
+            "tools": [],
+            "metadata": {},
+            "last_error": None,
+            "required_action": None,
+            "usage": None,
+        }
+        outcome = random.random()
+        plan = {
+            "started_at": now + self.queue_latency.sample(),
+            "tool_calls": random.random() < self.tool_call_ratio,
+            "failure": "rate_limit" if outcome < self.run_rate_limit_ratio
+            else "server_error" if outcome < self.run_rate_limit_ratio + self.run_error_ratio
+            else None,
+        }
+        plan["done_at"] = plan["started_at"] + self.model_latency.sample()
+        self.runs[run["id"]] = run
+        self.plans[run["id"]] = plan
+        self.stats["runs"] += 1
+        return run
+
+    def advance(self, run: Dict[str, Any]) -> Dict[str, Any]:
+        # The status of a run is derived from the time of the request
+        plan = self.plans[run["id"]]
+        now = time.time()
+        if run["status"] in ("completed", "failed", "requires_action") or now < plan["started_at"]:
+            return run
+        run["started_at"] = int(plan["started_at"])
+        if now < plan["done_at"]:
+            run["status"] = "in_progress"
+            return run
+        if plan["failure"] == "rate_limit":
+            run.update(status="failed", failed_at=int(now), last_error={
+                "code": "rate_limit_exceeded", "message": "Rate limit is exceeded. Try again in 2 seconds."
+            })
+        elif plan["failure"] == "server_error":
+            run.update(status="failed", failed_at=int(now), last_error={"code": "server_error", "message": "Stub error."})
+        elif plan["tool_calls"]:
+            plan["tool_calls"] = False
+            calls = random.sample(TOOL_CALLS, min(self.tool_calls_per_run, len(TOOL_CALLS)))
+            run.update(status="requires_action", required_action={
+                "type": "submit_tool_outputs",
+                "submit_tool_outputs": {"tool_calls": [
+                    {"id": f"call_{uuid.uuid4().hex[:24]}", "type": "function",
+                     "function": {"name": name, "arguments": json.dumps(arguments)}}
+                    for name, arguments in calls
+                ]},
+            })
+        else:
+            self.add_message(run["thread_id"], "assistant", f"Stub answer to run {run['id']}.", run["id"])
+            run.update(status="completed", completed_at=int(now), usage={
+                "prompt_tokens": 200, "completion_tokens": 50, "total_tokens": 250
+            })
+        return run
+
+    def add_message(self, thread_id: str, role: str, text: str, run_id: Optional[str] = None) -> Dict[str, Any]:
+        message = {
+            "id": f"msg_{uuid.uuid4().hex[:24]}",
+            "object": "thread.message",
+            "created_at": int(time.time()),
+            "thread_id": thread_id,
+            "status": "completed",
+            "role": role,
+            "content": [{"type": "text", "text": {"value": text, "annotations": []}}],
+            "assistant_id": None,
+            "run_id": run_id,
+            "attachments": [],
+            "metadata": {},
+        }
+        self.messages[thread_id].append(message)
+        return message
+
+
+def error_response(status: int, code: str, message: str, headers: Optional[Dict[str, str]] = None) -> web.Response:
+    return web.json_response({"error": {"code": code, "message": message}}, status=status, headers=headers)
+
+
+def create_stub_app(state: StubState) -> web.Application:
+    """
+    Create the routes of the stub.
+
+    :param state (StubState): The objects and behaviour of the stub.
+    :return: The aiohttp application.
+    :rtype: web.Application
+    """
+
+    @web.middleware
+    async def inject(request: web.Request, handler):
+        # The control endpoints are neither delayed, throttled nor counted
+        if request.path.startswith("/_stub/"):
+            return await handler(request)
+        state.stats["requests"] += 1
+        await asyncio.sleep(state.request_latency.sample())
+        if state.throttle():
+            state.stats["throttled"] += 1
+            return error_response(429, "rate_limit_exceeded", "Rate limit is exceeded.", {"Retry-After": "1"})
+        return await handler(request)
+
+    async def create_agent(request: web.Request) -> web.Response:
+        body = await request.json()
+        agent = {
+            "id": f"asst_{uuid.uuid4().hex[:24]}", "object": "assistant", "created_at": int(time.time()),
+            "name": body.get("name"), "description": None, "model": body.get("model"),
+            "instructions": body.get("instructions"), "tools": body.get("tools", []),
+            "tool_resources": body.get("tool_resources"), "metadata": body.get("metadata", {}),
+        }
+        state.agents[agent["id"]] = agent
+        return web.json_response(agent)
+
+    async def get_agent(request: web.Request) -> web.Response:
+        agent = state.agents.get(request.match_info["agent_id"])
+        return web.json_response(agent) if agent else error_response(404, "not_found", "No such agent.")
+
+    async def create_thread(request: web.Request) -> web.Response:
+        body = await request.json() if request.can_read_body else {}
+        thread = {"id": f"thread_{uuid.uuid4().hex[:24]}", "object": "thread", "created_at": int(time.time()),
+                  "tool_resources": None, "metadata": body.get("metadata") or {}}
+        state.threads[thread["id"]] = thread
+        state.messages[thread["id"]] = []
+        for message in body.get("messages") or []:
+            state.add_message(thread["id"], message["role"], str(message["content"]))
+        return web.json_response(thread)
+
+    async def delete_thread(request: web.Request) -> web.Response:
+        thread_id = request.match_info["thread_id"]
+        state.threads.pop(thread_id, None)
+        state.messages.pop(thread_id, None)
+        return web.json_response({"id": thread_id, "object": "thread.deleted", "deleted": True})
+
+    async def create_message(request: web.Request) -> web.Response:
+        thread_id = request.match_info["thread_id"]
+        if thread_id not in state.messages:
+            return error_response(404, "not_found", "No such thread.")
+        body = await request.json()
+        return web.json_response(state.add_message(thread_id, body["role"], str(body["content"])))
+
+    async def list_messages(request: web.Request) -> web.Response:
+        messages = state.messages.get(request.match_info["thread_id"])
+        if messages is None:
+            return error_response(404, "not_found", "No such thread.")
+        ordered = list(messages) if request.query.get("order") == "asc" else list(reversed(messages))
+        after = request.query.get("after")
+        if after:
+            ids = [m["id"] for m in ordered]
+            ordered = ordered[ids.index(after) + 1:] if after in ids else []
+        limit = int(request.query.get("limit", 20))
+        page = ordered[:limit]
+        return web.json_response({
+            "object": "list", "data": page, "first_id": page[0]["id"] if page else None,
+            "last_id": page[-1]["id"] if page else None, "has_more": len(ordered) > limit,
+        })
+
+    async def create_run(request: web.Request) -> web.Response:
+        thread_id = request.match_info["thread_id"]
+        if thread_id not in state.messages:
+            return error_response(404, "not_found", "No such thread.")
+        body = await request.json()
+        return web.json_response(state.new_run(thread_id, body["assistant_id"]))
+
+    async def get_run(request: web.Request) -> web.Response:
+        run = state.runs.get(request.match_info["run_id"])
+        return web.json_response(state.advance(run)) if run else error_response(404, "not_found", "No such run.")
+
+    async def submit_tool_outputs(request: web.Request) -> web.Response:
+        run = state.runs.get(request.match_info["run_id"])
+        if run is None or run["status"] != "requires_action":
+            return error_response(400, "invalid_request", "Run is not waiting for tool outputs.")
+        plan = state.plans[run["id"]]
+        plan["started_at"] = time.time()
+        plan["done_at"] = plan["started_at"] + state.model_latency.sample()
+        run.update(status="in_progress", required_action=None)
+        return web.json_response(run)
+
+    async def list_run_steps(request: web.Request) -> web.Response:
+        run = state.runs.get(request.match_info["run_id"])
+        if run is None:
+            return error_response(404, "not_found", "No such run.")
+        return web.json_response({"object": "list", "data": [], "first_id": None, "last_id": None, "has_more": False})
+
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response(state.stats)
+
+    app = web.Application(middlewares=[inject])
+    app.add_routes([
+        web.post(PREFIX + "/assistants", create_agent),
+        web.get(PREFIX + "/assistants/{agent_id}", get_agent),
+        web.post(PREFIX + "/threads", create_thread),
+        web.delete(PREFIX + "/threads/{thread_id}", delete_thread),
+        web.post(PREFIX + "/threads/{thread_id}/messages", create_message),
+        web.get(PREFIX + "/threads/{thread_id}/messages", list_messages),
+        web.post(PREFIX + "/threads/{thread_id}/runs", create_run),
+        web.get(PREFIX + "/threads/{thread_id}/runs/{run_id}", get_run),
+        web.post(PREFIX + "/threads/{thread_id}/runs/{run_id}/submit_tool_outputs", submit_tool_outputs),
+        web.get(PREFIX + "/threads/{thread_id}/runs/{run_id}/steps", list_run_steps),
+    ])
+    # Outside of the API prefix, so the stub's own counters are never mistaken for a service call
+    app.router.add_get("/_stub/stats", stats)
+    return app
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the options of the stub behaviour to a command line parser."""
+    parser.add_argument("--request-latency-ms", type=float, default=30, help="median latency of a request")
+    parser.add_argument("--queue-latency-ms", type=float, default=200, help="median time a run stays queued")
+    parser.add_argument("--model-latency-ms", type=float, default=1500, help="median time a run stays in progress")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="spread of the log-normal latencies")
+    parser.add_argument("--tool-call-ratio", type=float, default=0.5, help="share of runs asking for tool calls")
+    parser.add_argument("--tool-calls-per-run", type=int, default=2)
+    parser.add_argument("--throttle-ratio", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--stub-rpm", type=float, default=None, help="requests per minute before answering with 429")
+    parser.add_argument("--run-rate-limit-ratio", type=float, default=0.0, help="share of runs failing with rate_limit_exceeded")
+    parser.add_argument("--run-error-ratio", type=float, default=0.0, help="share of runs failing with a server error")
+
+
+def stub_state_from_args(args: argparse.Namespace) -> StubState:
+    return StubState(
+        request_latency=LatencyDistribution(args.request_latency_ms, args.latency_sigma),
+        queue_latency=LatencyDistribution(args.queue_latency_ms, args.latency_sigma),
+        model_latency=LatencyDistribution(args.model_latency_ms, args.latency_sigma),
+        tool_call_ratio=args.tool_call_ratio,
+        tool_calls_per_run=args.tool_calls_per_run,
+        throttle_ratio=args.throttle_ratio,
+        requests_per_minute=args.stub_rpm,
+        run_rate_limit_ratio=args.run_rate_limit_ratio,
+        run_error_ratio=args.run_error_ratio,
+    )
+
+
+async def start_stub(state: StubState, host: str = "127.0.0.1", port: int = 0) -> web.AppRunner:
+    """
+    Start the stub on the running event loop.
+
+    :param state (StubState): The objects and behaviour of the stub.
+    :param host (str): The interface to listen on.
+    :param port (int): The port, 0 for a free one.
+    :return: The runner (call cleanup() to stop); runner.addresses gives the bound port.
+    :rtype: web.AppRunner
+    """
+    runner = web.AppRunner(create_stub_app(state), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port, backlog=1024).start()
+    return runner
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stub of the Agents REST API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    web.run_app(create_stub_app(stub_state_from_args(args)), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
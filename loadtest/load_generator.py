@@ -0,0 +1,299 @@
+import os, sys, json, time, random, asyncio, logging, argparse
+from collections import Counter
+from typing import Any, Awaitable, Dict
+import aiohttp
+from azure.ai.projects.aio import AIProjectClient
+from azure.ai.projects.models import FunctionTool
+from azure.core.exceptions import HttpResponseError
+from azure.core.pipeline.policies import HeadersPolicy, SansIOHTTPPolicy
+from azure.core.pipeline.transport import AioHttpTransport
+from dotenv import load_dotenv
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "toolset"))
+from common.agent_registry import AgentRegistry
+from common.cassette_transport import AsyncStaticTokenCredential
+from common.instrumentation import LatencySummary
+from common.tool_executor import ParallelToolExecutor
+from utility_func import user_functions
+from agents_stub import add_stub_arguments, start_stub, stub_state_from_args
+
+# Load test of the chat lifecycle used by quickie2.py and toolset/multipleTools.py:
+# create thread -> (create message -> create run -> poll, answering tool calls -> list messages) per turn.
+# Conversations run either at a fixed concurrency (closed loop) or arrive at a fixed rate (open loop). At the end the
+# throughput, the p50/p95/p99 latency of every stage and the errors per stage are reported.
+# The SDK retry policy (--sdk-retries) absorbs most 429 and 5xx answers before a stage sees an error, so the HTTP
+# attempts, throttled answers and retries are counted below the retry policy and reported too, with the counters of
+# the stub when it is used.
+#
+# By default the bundled stub of the Agents REST API (loadtest/agents_stub.py) runs in the same process, so a load
+# test needs no network or quota. For high concurrency start the stub separately and pass --endpoint, so the stub and
+# the load generator don't share an event loop. --connection-string runs against a real project instead.
+#
+# Examples:
+#   python loadtest/load_generator.py --concurrency 50 --conversations 500 --turns 3
+#   python loadtest/load_generator.py --rate 20 --duration 60 --throttle-ratio 0.05
+#   python loadtest/load_generator.py --endpoint http://127.0.0.1:8765 --concurrency 500 --conversations 5000
+
+
+class HttpCounter(SansIOHTTPPolicy):
+    """
+    Counts HTTP requests (before the retry policy) or attempts and their outcome (after it).
+
+    :param counts (Counter): The counters, shared by the two policies.
+    :param per_attempt (bool): Whether the policy is installed after the retry policy.
+    """
+
+    def __init__(self, counts: Counter, per_attempt: bool):
+        self._counts = counts
+        self._per_attempt = per_attempt
+
+    def on_request(self, request) -> None:
+        self._counts["attempts" if self._per_attempt else "requests"] += 1
+
+    def on_response(self, request, response) -> None:
+        if not self._per_attempt:
+            return
+        status = response.http_response.status_code
+        if status == 429:
+            self._counts["throttled"] += 1
+        elif status >= 500:
+            self._counts["server_errors"] += 1
+
+    def on_exception(self, request) -> None:
+        if self._per_attempt:
+            self._counts["network_errors"] += 1
+
+
+def http_policies(counts: Counter) -> Dict[str, Any]:
+    # Keyword arguments of the project client installing the counters around the retry policy
+    return {"per_call_policies": [HttpCounter(counts, False)], "per_retry_policies": [HttpCounter(counts, True)]}
+
+
+def http_report(counts: Counter) -> Dict[str, int]:
+    return dict(counts, retried=counts["attempts"] - counts["requests"])
+
+
+async def stub_stats(session: aiohttp.ClientSession, endpoint: str) -> Dict[str, Any]:
+    async with session.get(endpoint + "/_stub/stats") as response:
+        response.raise_for_status()
+        return await response.json()
+
+
+class LoadTest:
+    """
+    Drives conversations against the Agents API and records the latency and errors of every stage.
+
+    :param project_client (AIProjectClient): The async project client.
+    :param agent_id (str): The agent to run.
+    :param turns (int): User messages per conversation.
+    :param poll_interval (float): Seconds between two run status polls.
+    """
+
+    def __init__(self, project_client: AIProjectClient, agent_id: str, turns: int = 1, poll_interval: float = 0.5):
+        self._client = project_client
+        self._agent_id = agent_id
+        self._turns = turns
+        self._poll_interval = poll_interval
+        self._tools = ParallelToolExecutor(user_functions, timeout=30)
+        self.latency = LatencySummary(max_samples=100000)
+        self.errors: Counter = Counter()
+        self.counts: Counter = Counter()
+
+    async def timed(self, stage: str, call: Awaitable[Any]) -> Any:
+        start = time.perf_counter()
+        try:
+            result = await call
+        except HttpResponseError as e:
+            self.errors[f"{stage}:{e.status_code}"] += 1
+            raise
+        except Exception as e:
+            self.errors[f"{stage}:{type(e).__name__}"] += 1
+            raise
+        self.latency.add(stage, time.perf_counter() - start)
+        return result
+
+    async def conversation(self) -> None:
+        start = time.perf_counter()
+        try:
+            agents = self._client.agents
+            thread = await self.timed("create_thread", agents.create_thread())
+            for turn in range(self._turns):
+                if not await self._turn(thread.id, turn):
+                    self.counts["failed_conversations"] += 1
+                    return
+            self.latency.add("conversation", time.perf_counter() - start)
+            self.counts["conversations"] += 1
+        except Exception:
+            self.counts["failed_conversations"] += 1
+
+    async def _turn(self, thread_id: str, turn: int) -> bool:
+        agents = self._client.agents
+        turn_start = time.perf_counter()
+        await self.timed("create_message", agents.create_message(
+            thread_id=thread_id, role="user", content=f"What is the weather in Seattle? (turn {turn})"
+        ))
+        run = await self.timed("create_run", agents.create_run(thread_id=thread_id, assistant_id=self._agent_id))
+        run_start = time.perf_counter()
+        while run.status in ("queued", "in_progress", "requires_action"):
+            if run.status == "requires_action":
+                tool_calls = run.required_action.submit_tool_outputs.tool_calls
+                tool_outputs = await self.timed("tool_calls", asyncio.to_thread(self._tools.execute_tool_calls, tool_calls))
+                self.counts["tool_calls"] += len(tool_calls)
+                run = await self.timed("submit_tool_outputs", agents.submit_tool_outputs_to_run(
+                    thread_id=thread_id, run_id=run.id, tool_outputs=tool_outputs
+                ))
+            else:
+                await asyncio.sleep(self._poll_interval)
+                run = await self.timed("get_run", agents.get_run(thread_id=thread_id, run_id=run.id))
+        self.latency.add("run", time.perf_counter() - run_start)
+        if run.status != "completed":
+            code = run.last_error.code if run.last_error else run.status
+            self.errors[f"run:{code}"] += 1
+            return False
+        await self.timed("list_messages", agents.list_messages(thread_id=thread_id, limit=1))
+        self.latency.add("turn", time.perf_counter() - turn_start)
+        self.counts["turns"] += 1
+        return True
+
+    async def closed_loop(self, concurrency: int, conversations: int) -> None:
+        remaining = iter(range(conversations))
+
+        async def worker():
+            for _ in remaining:
+                await self.conversation()
+
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+    async def open_loop(self, rate: float, duration: float, max_in_flight: int) -> None:
+        # Poisson arrivals; arrivals beyond max_in_flight are dropped and counted, not queued
+        tasks = set()
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(random.expovariate(rate))
+            if len(tasks) >= max_in_flight:
+                self.counts["dropped_arrivals"] += 1
+                continue
+            task = asyncio.create_task(self.conversation())
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        started = self.counts["conversations"] + self.counts["failed_conversations"]
+        return {
+            "elapsed_seconds": round(elapsed, 2),
+            "error_rate": round(self.counts["failed_conversations"] / started, 4) if started else 0.0,
+            "conversations_per_second": round(self.counts["conversations"] / elapsed, 2),
+            "turns_per_second": round(self.counts["turns"] / elapsed, 2),
+            "counts": dict(self.counts),
+            "errors": dict(self.errors),
+            "latency": self.latency.percentiles(),
+        }
+
+
+async def create_agent(project_client: AIProjectClient, args: argparse.Namespace) -> str:
+    definitions = FunctionTool(user_functions).definitions
+    if args.connection_string:
+        # On a real project the agent is reused across load tests
+        agent = await AgentRegistry(project_client).get_or_create_async(
+            model=args.model, name="loadtest-agent", instructions="You are a helpful agent", tools=definitions
+        )
+    else:
+        # Stub agents don't survive the stub, so they are never put in the registry
+        agent = await project_client.agents.create_agent(
+            model=args.model, name="loadtest-agent", instructions="You are a helpful agent", tools=definitions
+        )
+    return agent.id
+
+
+async def run_load_test(args: argparse.Namespace) -> Dict[str, Any]:
+    stub_runner = None
+    endpoint = None
+    http_counts: Counter = Counter()
+    credential: Any = AsyncStaticTokenCredential()
+    connector = aiohttp.TCPConnector(limit=args.max_connections)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        transport = AioHttpTransport(session=session, session_owner=False)
+        if args.connection_string:
+            from azure.identity.aio import DefaultAzureCredential
+
+            credential = DefaultAzureCredential()
+            project_client = AIProjectClient.from_connection_string(
+                conn_str=args.connection_string, credential=credential, transport=transport, retry_total=args.sdk_retries,
+                **http_policies(http_counts),
+            )
+        else:
+            endpoint = args.endpoint
+            if endpoint is None:
+                stub_runner = await start_stub(stub_state_from_args(args))
+                endpoint = "http://127.0.0.1:%d" % stub_runner.addresses[0][1]
+            # The stub speaks plain HTTP, which the bearer token policy refuses, so a fixed header is sent instead
+            project_client = AIProjectClient(
+                endpoint, "stub-subscription", "stub-group", "stub-project", credential,
+                transport=transport, retry_total=args.sdk_retries,
+                authentication_policy=HeadersPolicy({"Authorization": "Bearer stub-token"}),
+                **http_policies(http_counts),
+            )
+
+        try:
+            async with project_client:
+                agent_id = await create_agent(project_client, args)
+                load_test = LoadTest(project_client, agent_id, turns=args.turns, poll_interval=args.poll_interval)
+                start = time.perf_counter()
+                if args.rate:
+                    await load_test.open_loop(args.rate, args.duration, args.max_in_flight)
+                else:
+                    await load_test.closed_loop(args.concurrency, args.conversations)
+                report = load_test.report(time.perf_counter() - start)
+            report["http"] = http_report(http_counts)
+            if endpoint is not None:
+                report["stub"] = await stub_stats(session, endpoint)
+            return report
+        finally:
+            await credential.close()
+            if stub_runner is not None:
+                await stub_runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the agent chat lifecycle.")
+    parser.add_argument("--concurrency", type=int, default=50, help="conversations in flight (closed loop)")
+    parser.add_argument("--conversations", type=int, default=200, help="conversations to run (closed loop)")
+    parser.add_argument("--rate", type=float, default=None, help="conversations started per second (open loop)")
+    parser.add_argument("--duration", type=float, default=60, help="seconds of arrivals (open loop)")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="conversations in flight before arrivals are dropped (open loop)")
+    parser.add_argument("--turns", type=int, default=1, help="user messages per conversation")
+    parser.add_argument("--poll-interval", type=float, default=0.25, help="seconds between two run status polls")
+    parser.add_argument("--max-connections", type=int, default=200, help="HTTP connections in the pool")
+    parser.add_argument("--sdk-retries", type=int, default=3, help="retries of the SDK retry policy (429, 5xx, network)")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--endpoint", help="URL of a stub started separately (loadtest/agents_stub.py)")
+    parser.add_argument("--connection-string", help="run against a real project instead of the stub")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load_test(args))
+    print(
+        f"{report['elapsed_seconds']}s, {report['conversations_per_second']} conversations/s, "
+        f"{report['turns_per_second']} turns/s, error rate {report['error_rate']:.2%}"
+    )
+    print(f"Counts: {report['counts']}")
+    print(f"Errors: {report['errors']}")
+    print(f"HTTP: {report['http']}")
+    if "stub" in report:
+        print(f"Stub: {report['stub']}")
+    for stage, stats in sorted(report["latency"].items()):
+        print(f"{stage:22} n={stats['count']:<6} p50={stats['p50']:.3f}s p95={stats['p95']:.3f}s p99={stats['p99']:.3f}s")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -1,10 +1,11 @@
 import os
-from azure.ai.projects import AIProjectClient
 from azure.ai.projects.models import CodeInterpreterTool
-from azure.identity import DefaultAzureCredential
 from typing import Any
-from pathlib import Path
 from dotenv import load_dotenv
+from common.bootstrap import create_client
+from common.artifacts import ArtifactFetcher, open_file
+from common.warm_pool import WarmPool
+from common.rate_limiter import RunScheduler
 
 # Create an Azure AI Client from a connection string, copied from your Azure AI Foundry project.
 # At the moment, it should be in the format "<HostName>;<AzureSubscriptionId>;<ResourceGroup>;<ProjectName>"
@@ -14,9 +15,8 @@ from dotenv import load_dotenv
 # Customer needs to login to Azure subscription via Azure CLI and set the environment variables
 load_dotenv()
 conn_str=os.environ["PROJECT_CONNECTION_STRING"]
-project_client = AIProjectClient.from_connection_string(
-    credential=DefaultAzureCredential(), conn_str=conn_str
-)
+# The credential is resolved once and its tokens cached on disk, see common/bootstrap.py
+project_client = create_client(conn_str)
 
 print(conn_str)
 
@@ -25,29 +25,39 @@ with project_client:
     code_interpreter = CodeInterpreterTool()
 
     # The CodeInterpreterTool needs to be included in creation of the agent
-    agent = project_client.agents.create_agent(
-        model="gpt-4o-mini",
-        name="my-agent",
-        instructions="You are helpful agent",
-        tools=code_interpreter.definitions,
-        tool_resources=code_interpreter.resources,
+    # The registry reuses an existing agent with the same definition instead of creating a new one on every run,
+    # and the warm pool hands out a thread created in the background (or by an earlier run).
+    # Pooled threads would not match the recorded requests of a cassette, so the pool is only used without one.
+    pool = WarmPool(
+        project_client,
+        size=0 if os.environ.get("AGENTS_CASSETTE") else 1,
+        agent_kwargs=dict(
+            model="gpt-4o-mini",
+            name="my-agent",
+            instructions="You are helpful agent",
+            tools=code_interpreter.definitions,
+            tool_resources=code_interpreter.resources,
+        ),
     )
-    print(f"Created agent, agent ID: {agent.id}")
+    agent = pool.agent()
+    print(f"Using agent, agent ID: {agent.id}")
 
-    # Create a thread
-    thread = project_client.agents.create_thread()
-    print(f"Created thread, thread ID: {thread.id}")
+    # Take a thread
+    thread_id = pool.take_thread()
+    print(f"Using thread, thread ID: {thread_id}")
 
     # Create a message
     message = project_client.agents.create_message(
-        thread_id=thread.id,
+        thread_id=thread_id,
         role="user",
         content="Could you please create a bar chart for the operating profit using the following data and provide the file to me? Company A: $1.2 million, Company B: $2.5 million, Company C: $3.0 million, Company D: $1.8 million",
     )
     print(f"Created message, message ID: {message.id}")
 
-    # Run the agent
-    run = project_client.agents.create_and_process_run(thread_id=thread.id, assistant_id=agent.id)
+    # Run the agent, through the scheduler which waits and submits again when the model is rate limited
+    run = RunScheduler().submit_sync(
+        agent.model, lambda: project_client.agents.create_and_process_run(thread_id=thread_id, assistant_id=agent.id)
+    )
     print(f"Run finished with status: {run.status}")
 
     if run.status == "failed":
@@ -55,7 +65,7 @@ with project_client:
         print(f"Run failed: {run.last_error}")
 
     # Get messages from the thread
-    messages = project_client.agents.list_messages(thread_id=thread.id)
+    messages = project_client.agents.list_messages(thread_id=thread_id)
     print(f"Messages: {messages}")
 
     # Get the last message from the sender
@@ -67,14 +77,17 @@ with project_client:
     FILES_DIR = "files"
     os.makedirs(FILES_DIR, exist_ok=True)
 
-    # Generate an image file for the bar chart
+    # Download the generated images and the annotated files concurrently.
+    # Set OPEN_ARTIFACTS=1 to open them with the default application.
+    fetcher = ArtifactFetcher(
+        project_client, target_dir=FILES_DIR, on_saved=open_file if os.environ.get("OPEN_ARTIFACTS") else None
+    )
+    saved_files = fetcher.fetch(messages)
+    fetcher.shutdown()
+
     for image_content in messages.image_contents:
         print(f"Image File ID: {image_content.image_file.file_id}")
-        file_name = f"{image_content.image_file.file_id}_image_file.png"
-        file_path = os.path.join(FILES_DIR, file_name)
-        project_client.agents.save_file(file_id=image_content.image_file.file_id, file_name=file_name, target_dir=FILES_DIR)
-        print(f"Saved image file to: {Path.cwd() / file_name}")
-        os.startfile(file_path)
+        print(f"Saved image file to: {saved_files[image_content.image_file.file_id].resolve()}")
 
     # Print the file path(s) from the messages
     for file_path_annotation in messages.file_path_annotations:
@@ -84,8 +97,7 @@ with project_client:
         print(f"File ID: {file_path_annotation.file_path.file_id}")
         print(f"Start Index: {file_path_annotation.start_index}")
         print(f"End Index: {file_path_annotation.end_index}")
-        project_client.agents.save_file(file_id=file_path_annotation.file_path.file_id, file_name=Path(file_path_annotation.text).name, target_dir=FILES_DIR)
+        print(f"Saved file to: {saved_files[file_path_annotation.file_path.file_id].resolve()}")
 
-    # Delete the agent once done
-    project_client.agents.delete_agent(agent.id)
-    print("Deleted agent")
\ No newline at end of file
+    # Stop refilling the pool before the client is closed; the ready threads are kept for the next run
+    pool.close()
@@ -1,11 +1,18 @@
 import os
-from azure.ai.projects import AIProjectClient
-from azure.identity import DefaultAzureCredential
 from azure.ai.projects.models import FunctionTool, ToolSet, CodeInterpreterTool
 import logging
-import random
-import json
+import argparse
 from dotenv import load_dotenv
+from common.agent_registry import AgentRegistry
+from common.streaming import stream_run
+from common.thread_cache import ThreadMessageCache
+from common.compaction import CompactingThread
+from common.artifacts import ArtifactFetcher, open_file
+from common.rate_limiter import RunScheduler
+from common.warm_pool import WarmPool
+from common.run_timeline import RunAnalyzer, RunLog
+from common.bootstrap import create_client
+from common.sales_data import sales_data_json
 
 
 # Custom functions that the assistant can call
@@ -20,25 +27,13 @@ def get_sales_data(year: int):
     :rtype: str
     """
     logging.info(f"Getting sales data for year: {year}")
-    mock_data = []
-    for i in range(10):  # Generate 10 mock sales records
-        record = {
-            'id': i + 1,
-            'product': f'Product {i + 1}',
-            'quantity_sold': random.randint(1, 100),
-            'cost_price': round(random.uniform(5.0, 50.0), 2),
-            'selling_price': round(random.uniform(10.0, 100.0), 2),
-            'profit': lambda cp, sp, qty: round((sp - cp) * qty, 2)
-        }
-        record['profit'] = record['profit'](record['cost_price'], record['selling_price'], record['quantity_sold'])
-        mock_data.append(record)
-    return json.dumps(mock_data)
+    return sales_data_json(year, n_rows=10)  # Generate 10 mock sales records
 
 
 # End of custom functions
 
 
-def main():
+def main(stream: bool = False, token_budget: int = 8000):
 
     # Define a directory to save files
     FILES_DIR = "files"
@@ -46,11 +41,9 @@ def main():
 
     # Create an Azure AI Client from a connection string, copied from your Azure AI Foundry project.
     # It should be in the format "<HostName>;<AzureSubscriptionId>;<ResourceGroup>;<HubName>"
+    # With AGENT_ENDPOINTS set, threads and runs are spread over several projects and deployments instead.
 
-    project_client = AIProjectClient.from_connection_string(
-        credential=DefaultAzureCredential(),
-        conn_str=os.environ["PROJECT_CONNECTION_STRING"],
-    )
+    project_client = create_client(routed=True)
 
     # Initialize agent toolset with user functions and code interpreter
     functions = FunctionTool([
@@ -61,16 +54,35 @@ def main():
     toolset.add(functions)
     toolset.add(CodeInterpreterTool())
 
-    # Create agent with toolset and process a run
-
-    agent = project_client.agents.create_agent(
-        model="gpt-4o-mini", name="my-agent", instructions="You are a helpful agent", toolset=toolset
+    # Get (or create) the agent with toolset from the registry, and take a pre-created thread from the warm pool.
+    # Both are prepared in the background while the client starts up.
+    registry = AgentRegistry(project_client)
+    registry.start_background_gc()
+    pool = WarmPool(
+        project_client,
+        size=1,
+        agent_kwargs=dict(model="gpt-4o-mini", name="my-agent", instructions="You are a helpful agent", toolset=toolset),
+        registry=registry,
+    )
+    agent = pool.agent()
+    logging.info(f"Using agent, ID: {agent.id}")
+
+    # Thread for communication, its messages are cached locally so each turn only fetches the new ones.
+    # When the conversation goes over the token budget, the thread is replaced by a summarised one.
+    message_cache = ThreadMessageCache(project_client)
+    thread = CompactingThread(
+        project_client, message_cache, token_budget=token_budget, registry=registry, thread_id=pool.take_thread()
     )
-    logging.info(f"Created agent, ID: {agent.id}")
+    logging.info(f"Using thread, ID: {thread.id}")
 
-    # Create thread for communication
-    thread = project_client.agents.create_thread()
-    logging.info(f"Created thread, ID: {thread.id}")
+    # Runs go through the scheduler, which waits and submits again when the model is rate limited
+    scheduler = RunScheduler()
+    fetcher = ArtifactFetcher(
+        project_client, target_dir=FILES_DIR, on_saved=open_file if os.environ.get("OPEN_ARTIFACTS") else None
+    )
+    # Queue, model and tool time and the tokens of every run, buffered and written to the run log in logs/runs when
+    # the chat ends (one Parquet file for the session)
+    analyzer = RunAnalyzer(project_client, RunLog())
 
     # Chat loop
     print("Chat with the agent. Type 'exit' to quit.")
@@ -90,38 +102,78 @@ def main():
                 content=user_input,
             )
             logging.info(f"Created message, ID: {message.id}")
-
-            # Create and process agent run in thread with tools
-            run = project_client.agents.create_and_process_run(thread_id=thread.id, assistant_id=agent.id)
-            logging.info(f"Run finished with status: {run.status}")
-
-            if run.status == "failed":
-                logging.error(f"Run failed: {run.last_error}")
-                break
-
-            # Fetch and log last message
-            messages = project_client.agents.list_messages(thread_id=thread.id)
-            response_msg = messages.get_last_message_by_sender("assistant")
-            for text_msg in response_msg.text_messages:
-                print(f"Assistant: {text_msg.text.value}")
-
-            # Save and open image if available
-            for image_content in response_msg.image_contents:
-                logging.info(f"Image File ID: {image_content.image_file.file_id}")
-                file_name = f"{image_content.image_file.file_id}_image_file.png"
-                file_path = os.path.join(FILES_DIR, file_name)
-                project_client.agents.save_file(file_id=image_content.image_file.file_id, file_name=file_name, target_dir=FILES_DIR)
-                logging.info(f"Saved image file to: {file_path}")
-                os.startfile(file_path)  # Open the saved image file
-
+            message_cache.add(message)
+
+            if stream:
+                # Stream the run, the answer is printed token by token and tool calls are handled in the stream
+                handlers = []
+
+                def streamed_run():
+                    handlers.append(stream_run(project_client, thread_id=thread.id, agent_id=agent.id, toolset=toolset))
+                    return handlers[-1].run
+
+                run = scheduler.submit_sync(agent.model, streamed_run)
+                handler = handlers[-1]
+                if run is None:
+                    logging.error("The stream ended without a run")
+                    break
+                logging.info(f"Run finished with status: {run.status}, time to first token: {handler.time_to_first_token}")
+
+                if run.status == "failed":
+                    logging.error(f"Run failed: {run.last_error}")
+                    break
+
+                response_msg = handler.last_message
+                message_cache.sync(thread.id)
+                if response_msg is None:
+                    continue
+            else:
+                # Create and process agent run in thread with tools
+                run = scheduler.submit_sync(
+                    agent.model,
+                    lambda: project_client.agents.create_and_process_run(
+                        thread_id=thread.id, assistant_id=agent.id, toolset=toolset
+                    ),
+                )
+                logging.info(f"Run finished with status: {run.status}")
+
+                if run.status == "failed":
+                    logging.error(f"Run failed: {run.last_error}")
+                    break
+
+                # Fetch the messages added by the run and log the last one
+                message_cache.sync(thread.id)
+                response_msg = message_cache.last_message_by_sender(thread.id, "assistant")
+                for text_msg in response_msg.text_messages:
+                    print(f"Assistant: {text_msg.text.value}")
+
+            timeline = analyzer.analyze(run, prompt=user_input)
+            if timeline is not None:
+                logging.info(timeline.summary())
+
+            # Save the images and files of the answer, downloaded concurrently (OPEN_ARTIFACTS=1 opens them)
+            for file_id, file_path in fetcher.fetch(response_msg).items():
+                logging.info(f"Saved file {file_id} to: {file_path}")
+
+            # Summarise the older turns into a new thread if the conversation went over the token budget
+            if thread.compact_if_needed(run, timeline.context_tokens if timeline is not None else None):
+                logging.info(f"Continuing on compacted thread, ID: {thread.id}")
+
+        except KeyboardInterrupt:
+            # Ctrl+C ends the chat like "exit", so the buffered run log rows are still written
+            break
         except Exception as e:
             logging.error(f"An error occurred: {e}")
 
-    # Delete the agent when done
-    project_client.agents.delete_agent(agent.id)
-    logging.info("Deleted agent")
+    fetcher.shutdown()
+    analyzer.close()
+    pool.close()
 
 
 if __name__ == "__main__":
     load_dotenv() # Load environment variables from .env file
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Chat with the agent.")
+    parser.add_argument("--stream", action="store_true", help="print the answer token by token while it is generated")
+    parser.add_argument("--token-budget", type=int, default=8000, help="compact the thread when its context goes over this number of tokens")
+    args = parser.parse_args()
+    main(stream=args.stream, token_budget=args.token_budget)
\ No newline at end of file
@@ -0,0 +1,341 @@
+import os, sys, time, uuid, asyncio, logging, argparse
+from typing import Any, Dict, Optional
+from aiohttp import WSMsgType, web
+from azure.ai.projects.aio import AIProjectClient
+from azure.core.exceptions import AzureError
+from dotenv import load_dotenv
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.agent_registry import AgentRegistry
+from common.bootstrap import close_async_transport, create_async_client
+from common.rate_limiter import RunScheduler
+from common.warm_pool import AsyncWarmPool
+
+# Chat server: many concurrent chat sessions in one process, instead of the single-user input() loop of quickie2.py.
+# All sessions share one agent from the registry, and each session has its own thread. Messages of a session are
+# answered one after the other in the order they arrived, runs of different sessions run concurrently up to a global
+# limit. When too many messages are waiting, new ones are rejected with 503 and Retry-After (backpressure). A request
+# without a "content" string gets 400, a message the service couldn't answer 502; on the WebSocket these are error
+# frames and the connection stays open. Closing a session waits for its current run before deleting the thread.
+#
+# HTTP:
+#   POST   /sessions                     -> {"session_id": ...}
+#   POST   /sessions/{id}/messages       {"content": "..."} -> {"reply": ..., "status": ..., "latency_seconds": ...}
+#   DELETE /sessions/{id}
+#   GET    /sessions/{id}/ws             WebSocket, each text frame is a user message, each reply a JSON frame
+#
+# Example: python server/chat_server.py --port 8080 --max-concurrent-runs 64
+
+
+class SessionBusy(Exception):
+    """Raised when a message can't be queued because the server or the session is at capacity."""
+
+
+class SessionClosed(Exception):
+    """Raised for the messages still waiting in a session when it is closed."""
+
+
+class ChatSession:
+    """
+    A chat session: one thread, and a lock keeping its messages in arrival order.
+
+    :param session_id (str): The session ID.
+    :param thread_id (str): The thread of the session.
+    """
+
+    def __init__(self, session_id: str, thread_id: str):
+        self.id = session_id
+        self.thread_id = thread_id
+        self.lock = asyncio.Lock()  # asyncio locks are FIFO, so waiting messages keep their order
+        self.waiting = 0
+        self.closed = False
+        self.last_used = time.monotonic()
+
+
+class ChatSessionManager:
+    """
+    Creates sessions and answers their messages, with ordering per session and a global concurrency limit.
+
+    :param project_client (AIProjectClient): The async project client.
+    :param agent (Agent): The agent shared by all sessions.
+    :param scheduler (RunScheduler): The scheduler runs go through, retrying the rate limited ones.
+    :param pool (Optional[AsyncWarmPool]): Pre-created threads for new sessions, None to create them on demand.
+    :param max_concurrent_runs (int): The maximum number of runs in flight across all sessions.
+    :param max_waiting (int): The maximum number of messages waiting for a run slot, beyond that messages are rejected.
+    :param max_waiting_per_session (int): The maximum number of messages queued in one session.
+    :param poll_interval (float): Seconds between two run status polls.
+    """
+
+    def __init__(
+        self,
+        project_client: AIProjectClient,
+        agent: Any,
+        scheduler: RunScheduler,
+        pool: Optional[AsyncWarmPool] = None,
+        max_concurrent_runs: int = 32,
+        max_waiting: int = 1000,
+        max_waiting_per_session: int = 8,
+        poll_interval: float = 0.5,
+    ):
+        self._client = project_client
+        self._agent = agent
+        self._scheduler = scheduler
+        self._pool = pool
+        self._run_slots = asyncio.Semaphore(max_concurrent_runs)
+        self._max_waiting = max_waiting
+        self._max_waiting_per_session = max_waiting_per_session
+        self._poll_interval = poll_interval
+        self._sessions: Dict[str, ChatSession] = {}
+        self.waiting = 0
+        self.stats = {"completed": 0, "failed": 0, "rejected": 0, "errors": 0}
+
+    async def create_session(self) -> ChatSession:
+        if self._pool is not None:
+            thread_id = await self._pool.take_thread()
+        else:
+            thread_id = (await self._client.agents.create_thread()).id
+        session = ChatSession(uuid.uuid4().hex, thread_id)
+        self._sessions[session.id] = session
+        logging.info(f"Created session {session.id}, thread ID: {thread_id}")
+        return session
+
+    @property
+    def session_count(self) -> int:
+        return len(self._sessions)
+
+    def get_session(self, session_id: str) -> Optional[ChatSession]:
+        return self._sessions.get(session_id)
+
+    async def close_session(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return
+        session.closed = True
+        # The thread can't be deleted under a run; waiting messages see the session closed and don't start one
+        async with session.lock:
+            await self._client.agents.delete_thread(session.thread_id)
+
+    async def close_idle_sessions(self, max_idle_seconds: float) -> int:
+        """
+        Close the sessions without messages for a while.
+
+        :param max_idle_seconds (float): Sessions idle for longer are closed.
+        :return: The number of closed sessions.
+        :rtype: int
+        """
+        now = time.monotonic()
+        idle = [
+            s.id for s in self._sessions.values() if s.waiting == 0 and not s.lock.locked() and now - s.last_used > max_idle_seconds
+        ]
+        for session_id in idle:
+            try:
+                await self.close_session(session_id)
+            except Exception as e:
+                logging.warning(f"Could not close session {session_id}: {e}")
+        return len(idle)
+
+    async def send(self, session: ChatSession, content: str) -> Dict[str, Any]:
+        """
+        Add a user message to the session and run the agent, after the earlier messages of the session.
+
+        :param session (ChatSession): The session.
+        :param content (str): The user message.
+        :return: The reply, the run status and the latency.
+        :rtype: Dict[str, Any]
+        :raises SessionBusy: When the server or the session has too many waiting messages.
+        :raises SessionClosed: When the session was closed before the message was answered.
+        :raises AzureError: When the service failed to answer, e.g. the run could not be created.
+        """
+        if self.waiting >= self._max_waiting or session.waiting >= self._max_waiting_per_session:
+            self.stats["rejected"] += 1
+            raise SessionBusy(f"Too many waiting messages ({self.waiting} in total, {session.waiting} in session)")
+
+        start = time.perf_counter()
+        self.waiting += 1
+        session.waiting += 1
+        waiting = True
+        try:
+            async with session.lock:
+                if session.closed:
+                    raise SessionClosed(f"Session {session.id} was closed")
+                async with self._run_slots:
+                    self.waiting -= 1
+                    session.waiting -= 1
+                    waiting = False
+                    try:
+                        return await self._answer(session, content, start)
+                    except (AzureError, RuntimeError):
+                        # RuntimeError: still rate limited after the scheduler's last attempt
+                        self.stats["errors"] += 1
+                        raise
+        finally:
+            if waiting:
+                self.waiting -= 1
+                session.waiting -= 1
+            session.last_used = time.monotonic()
+
+    async def _answer(self, session: ChatSession, content: str, start: float) -> Dict[str, Any]:
+        await self._client.agents.create_message(thread_id=session.thread_id, role="user", content=content)
+        run = await self._scheduler.submit(
+            self._agent.model,
+            lambda: self._client.agents.create_and_process_run(
+                thread_id=session.thread_id, assistant_id=self._agent.id, sleep_interval=self._poll_interval
+            ),
+        )
+        result: Dict[str, Any] = {"status": run.status}
+        if run.status == "failed":
+            self.stats["failed"] += 1
+            result["error"] = str(run.last_error)
+        else:
+            self.stats["completed"] += 1
+            messages = await self._client.agents.list_messages(thread_id=session.thread_id, limit=1)
+            last_msg = messages.get_last_text_message_by_sender("assistant")
+            result["reply"] = last_msg.text.value if last_msg else None
+        result["latency_seconds"] = round(time.perf_counter() - start, 3)
+        return result
+
+
+def create_app(manager: ChatSessionManager) -> web.Application:
+    """
+    Create the HTTP and WebSocket routes of the chat server.
+
+    :param manager (ChatSessionManager): The session manager.
+    :return: The aiohttp application.
+    :rtype: web.Application
+    """
+
+    def busy_response(error: SessionBusy) -> web.Response:
+        return web.json_response({"error": str(error)}, status=503, headers={"Retry-After": "1"})
+
+    async def reply(session: ChatSession, content: str) -> Dict[str, Any]:
+        # The answer, or an error result with the HTTP status it maps to
+        try:
+            return await manager.send(session, content)
+        except SessionBusy as e:
+            return {"status": "rejected", "error": str(e), "http_status": 503}
+        except SessionClosed as e:
+            return {"status": "closed", "error": str(e), "http_status": 404}
+        except (AzureError, RuntimeError) as e:
+            logging.warning(f"Message of session {session.id} failed: {e}")
+            return {"status": "error", "error": str(e), "http_status": 502}
+
+    def find_session(request: web.Request) -> ChatSession:
+        session = manager.get_session(request.match_info["session_id"])
+        if session is None:
+            raise web.HTTPNotFound(text="Unknown session")
+        return session
+
+    async def create_session(request: web.Request) -> web.Response:
+        session = await manager.create_session()
+        return web.json_response({"session_id": session.id}, status=201)
+
+    async def post_message(request: web.Request) -> web.Response:
+        session = find_session(request)
+        try:
+            body = await request.json()
+        except ValueError:
+            return web.json_response({"error": "The body must be JSON"}, status=400)
+        if not isinstance(body, dict) or not isinstance(body.get("content"), str):
+            return web.json_response({"error": 'The body must have a "content" string'}, status=400)
+        result = await reply(session, body["content"])
+        status = result.pop("http_status", 200)
+        if status == 503:
+            return busy_response(SessionBusy(result["error"]))
+        return web.json_response(result, status=status)
+
+    async def delete_session(request: web.Request) -> web.Response:
+        await manager.close_session(request.match_info["session_id"])
+        return web.Response(status=204)
+
+    async def websocket(request: web.Request) -> web.WebSocketResponse:
+        session = find_session(request)
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            # Answered one at a time, so a client sending faster than the agent answers is slowed down
+            result = await reply(session, msg.data)
+            result.pop("http_status", None)
+            await ws.send_json(result)
+            if result["status"] == "closed":
+                break
+        return ws
+
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response({**manager.stats, "waiting": manager.waiting, "sessions": manager.session_count})
+
+    app = web.Application()
+    app.add_routes(
+        [
+            web.post("/sessions", create_session),
+            web.post("/sessions/{session_id}/messages", post_message),
+            web.delete("/sessions/{session_id}", delete_session),
+            web.get("/sessions/{session_id}/ws", websocket),
+            web.get("/stats", stats),
+        ]
+    )
+    return app
+
+
+async def serve(args: argparse.Namespace) -> None:
+    try:
+        # A single project, or the pool of projects and deployments in AGENT_ENDPOINTS
+        project_client = create_async_client(routed=True)
+        async with project_client:
+            agent = await AgentRegistry(project_client).get_or_create_async(
+                model=args.model, name="chat-server-agent", instructions=args.instructions
+            )
+            logging.info(f"Using agent, ID: {agent.id}")
+
+            # New sessions take a thread created in the background, so their first message only waits for the run
+            pool = AsyncWarmPool(project_client, size=args.warm_threads)
+            pool.start()
+            manager = ChatSessionManager(
+                project_client,
+                agent,
+                RunScheduler(default_requests_per_minute=args.rpm, default_tokens_per_minute=args.tpm),
+                pool,
+                max_concurrent_runs=args.max_concurrent_runs,
+                max_waiting=args.max_waiting,
+                poll_interval=args.poll_interval,
+            )
+            runner = web.AppRunner(create_app(manager))
+            await runner.setup()
+            await web.TCPSite(runner, args.host, args.port).start()
+            print(f"Chat server listening on http://{args.host}:{args.port}")
+
+            try:
+                while True:
+                    await asyncio.sleep(60)
+                    closed = await manager.close_idle_sessions(args.session_idle_seconds)
+                    if closed:
+                        logging.info(f"Closed {closed} idle sessions")
+            finally:
+                await pool.close()
+                await runner.cleanup()
+    finally:
+        await close_async_transport()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve many chat sessions with one agent.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--instructions", default="You are a helpful agent")
+    parser.add_argument("--max-concurrent-runs", type=int, default=32, help="number of runs in flight at the same time")
+    parser.add_argument("--max-waiting", type=int, default=1000, help="messages waiting for a run before new ones are rejected")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="seconds between two run status polls")
+    parser.add_argument("--rpm", type=float, help="requests per minute quota (default: RATE_LIMIT_RPM, or no limit)")
+    parser.add_argument("--tpm", type=float, help="tokens per minute quota (default: RATE_LIMIT_TPM, or no limit)")
+    parser.add_argument("--warm-threads", type=int, default=16, help="threads kept ready for new sessions")
+    parser.add_argument("--session-idle-seconds", type=float, default=3600, help="close sessions idle for longer")
+    args = parser.parse_args()
+    asyncio.run(serve(args))
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    main()
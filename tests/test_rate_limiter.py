@@ -0,0 +1,49 @@
+import os, sys, asyncio
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.rate_limiter import RunScheduler
+
+# A run that fails with anything but a rate limit must give its concurrency slot back, otherwise the deployment
+# stops accepting runs once the limit is used up. It must not raise the concurrency limit either.
+
+
+def failing_run():
+    raise ValueError("tool failed")
+
+
+def test_submit_sync_releases_slot_on_error():
+    scheduler = RunScheduler(max_concurrency=1)
+    limiter = scheduler.limiter("gpt-4o")
+    with pytest.raises(ValueError):
+        scheduler.submit_sync("gpt-4o", failing_run)
+    assert limiter.in_flight == 0
+    assert limiter.try_start(1000) == 0.0
+
+
+def test_failed_runs_do_not_raise_concurrency():
+    scheduler = RunScheduler(max_concurrency=8)
+    limiter = scheduler.limiter("gpt-4o")
+    concurrency = limiter.concurrency
+    for _ in range(10):
+        with pytest.raises(ValueError):
+            scheduler.submit_sync("gpt-4o", failing_run)
+    assert limiter.concurrency == concurrency
+    assert limiter.stats["failed"] == 10
+    assert limiter.stats["completed"] == 0
+
+
+def test_submit_releases_slot_on_cancel():
+    scheduler = RunScheduler(max_concurrency=1)
+    limiter = scheduler.limiter("gpt-4o")
+
+    async def main():
+        task = asyncio.create_task(scheduler.submit("gpt-4o", lambda: asyncio.sleep(60)))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert limiter.in_flight == 0
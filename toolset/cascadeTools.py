@@ -0,0 +1,71 @@
+import os, sys, time, logging, argparse
+from azure.ai.projects.models import FunctionTool, CodeInterpreterTool
+from dotenv import load_dotenv
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from utility_func import user_functions
+from common.agent_registry import AgentRegistry
+from common.bootstrap import create_client
+from common.cascade import ModelCascade, tool_keywords
+from common.rate_limiter import RunScheduler
+from common.tool_executor import ParallelToolExecutor, ParallelToolSet
+
+# Cascade mode of multipleTools.py: each message goes to the small model first when the classifier thinks it is
+# simple, and is escalated to the large model when the small one fails, skips a needed tool or isn't confident.
+# Runs the example inputs of utility_func.py (or the messages given on the command line) and prints the routing stats.
+#
+# Example: python toolset/cascadeTools.py --small-model gpt-4o-mini --large-model gpt-4o
+
+EXAMPLE_MESSAGES = [
+    "What is the current date and time?",
+    "Can you provide the weather information for New York?",
+    "What is the sum of 45 and 55?",
+    "Convert 25 degrees Celsius to Fahrenheit.",
+    "Retrieve user information for user ID 1.",
+    "Hello, send Charlie an email with the datetime and weather information in New York, make sure to use Fahrenheit for temperature information?",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer messages with a small/large model cascade.")
+    parser.add_argument("messages", nargs="*", help="user messages, the examples of utility_func.py by default")
+    parser.add_argument("--small-model", default="gpt-4o-mini", help="deployment tried first for simple messages")
+    parser.add_argument("--large-model", default="gpt-4o", help="deployment of the agent, for complex and escalated messages")
+    args = parser.parse_args()
+
+    project_client = create_client(routed=True)
+    with project_client:
+        toolset = ParallelToolSet(ParallelToolExecutor(user_functions, timeout=30))
+        toolset.add(FunctionTool(user_functions))
+        toolset.add(CodeInterpreterTool())
+
+        # The agent is defined with the large model, small runs override the model per run
+        agent = AgentRegistry(project_client).get_or_create(
+            model=args.large_model, name="my-assistant", instructions="You are a helpful assistant", toolset=toolset
+        )
+        print(f"Using agent, ID: {agent.id}")
+
+        cascade = ModelCascade(
+            project_client, args.small_model, keywords=tool_keywords(user_functions), scheduler=RunScheduler()
+        )
+        for content in args.messages or EXAMPLE_MESSAGES:
+            thread = project_client.agents.create_thread()
+            project_client.agents.create_message(thread_id=thread.id, role="user", content=content)
+            start = time.perf_counter()
+            run, tier = cascade.run(thread.id, agent, content, toolset=toolset)
+            print(f"[{tier}, {time.perf_counter() - start:.1f}s] User: {content}")
+            if run.status == "failed":
+                print(f"Run failed: {run.last_error}")
+                continue
+            messages = project_client.agents.list_messages(thread_id=thread.id, run_id=run.id)
+            last_msg = messages.get_last_text_message_by_sender("assistant")
+            if last_msg:
+                print(f"Assistant: {last_msg.text.value}")
+
+        cascade.print_stats()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    logging.basicConfig(level=logging.WARNING)
+    main()
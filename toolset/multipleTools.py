@@ -1,16 +1,18 @@
 import os, sys, logging
-from azure.ai.projects import AIProjectClient
 from azure.ai.projects.models import (
-    FunctionTool, ToolSet, CodeInterpreterTool
+    FunctionTool, CodeInterpreterTool
 )
-from azure.identity import DefaultAzureCredential
 from dotenv import load_dotenv
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
 from utility_func import user_functions
+from common.agent_registry import AgentRegistry
+from common.bootstrap import create_client
+from common.rate_limiter import RunScheduler
+from common.tool_executor import ParallelToolExecutor, ParallelToolSet
 
 load_dotenv()
-project_client = AIProjectClient.from_connection_string(
-    credential=DefaultAzureCredential(), conn_str=os.environ["PROJECT_CONNECTION_STRING"]
-)
+project_client = create_client(routed=True)
 
 with project_client:
     # Initialize agent toolset with user functions and code interpreter
@@ -18,18 +20,19 @@ with project_client:
     functions = FunctionTool(user_functions)
     code_interpreter = CodeInterpreterTool()
 
-    toolset = ToolSet()
+    # Tool calls of the same run step (e.g. datetime and weather) are executed at the same time
+    toolset = ParallelToolSet(ParallelToolExecutor(user_functions, timeout=30))
     toolset.add(functions)
     toolset.add(code_interpreter)
 
-    agent = project_client.agents.create_agent(
+    agent = AgentRegistry(project_client).get_or_create(
         model="gpt-4o-mini",
         name="my-assistant",
         instructions="You are a helpful assistant",
         toolset=toolset,
     )
     # [END create_agent_toolset]
-    print(f"Created agent, ID: {agent.id}")
+    print(f"Using agent, ID: {agent.id}")
 
     # Create thread for communication
     thread = project_client.agents.create_thread()
@@ -43,9 +46,15 @@ with project_client:
     )
     print(f"Created message, ID: {message.id}")
 
-    # Create and process agent run in thread with tools
+    # Create and process agent run in thread with tools, through the scheduler which waits and submits again when the
+    # model is rate limited
     # [START create_and_process_run]
-    run = project_client.agents.create_and_process_run(thread_id=thread.id, assistant_id=agent.id)
+    run = RunScheduler().submit_sync(
+        agent.model,
+        lambda: project_client.agents.create_and_process_run(
+            thread_id=thread.id, assistant_id=agent.id, toolset=toolset
+        ),
+    )
     # [END create_and_process_run]
     print(f"Run finished with status: {run.status}")
 
@@ -57,10 +66,6 @@ with project_client:
     if last_msg:
         print(f"Last Message: {last_msg.text.value}")
 
-    # Delete the assistant when done
-    project_client.agents.delete_agent(agent.id)
-    print("Deleted agent")
-
     # Fetch and log all messages
     messages = project_client.agents.list_messages(thread_id=thread.id)
     print(f"Messages: {messages}")
\ No newline at end of file
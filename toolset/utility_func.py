@@ -3,11 +3,17 @@
 # Licensed under the MIT License.
 # ------------------------------------
 
+import os
+import sys
 import json
 import datetime
 from typing import Any, Callable, Set, Dict, List, Optional
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.tool_cache import cacheable
+
 # These are the user-defined functions that can be called by the agent.
+# Deterministic functions are marked @cacheable, repeated calls with the same arguments are served from the cache.
 
 
 def fetch_current_datetime(format: Optional[str] = None) -> str:
@@ -31,6 +37,7 @@ def fetch_current_datetime(format: Optional[str] = None) -> str:
     return time_json
 
 
+@cacheable(ttl=600)
 def fetch_weather(location: str) -> str:
     """
     Fetches the weather information for the specified location.
@@ -69,6 +76,7 @@ def send_email(recipient: str, subject: str, body: str) -> str:
     return message_json
 
 
+@cacheable(ttl=3600)
 def calculate_sum(a: int, b: int) -> str:
     """Calculates the sum of two integers.
 
@@ -84,6 +92,7 @@ def calculate_sum(a: int, b: int) -> str:
     return json.dumps({"result": result})
 
 
+@cacheable(ttl=3600)
 def convert_temperature(celsius: float) -> str:
     """Converts temperature from Celsius to Fahrenheit.
 
@@ -98,6 +107,7 @@ def convert_temperature(celsius: float) -> str:
     return json.dumps({"fahrenheit": fahrenheit})
 
 
+@cacheable(ttl=300)
 def get_user_info(user_id: int) -> str:
     """Retrieves user information based on user ID.
 
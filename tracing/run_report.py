@@ -0,0 +1,68 @@
+import os, sys, argparse
+from collections import defaultdict
+from typing import Any, Dict, List
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.run_timeline import RUN_LOG_DIR, read_run_log
+
+# Aggregates the run log written by common/run_timeline.py (quickie2.py, batch/batch_runner.py --run-log).
+# For each group of runs (by model by default) it prints where the time went (queue, model, tools) and the tokens,
+# then the prompts using the most tokens.
+#
+# Example: python tracing/run_report.py --by agent_id --top 20
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(v for v in values if v is not None)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def report(rows: List[Dict[str, Any]], group_by: str, top: int) -> None:
+    groups: Dict[Any, List[Dict[str, Any]]] = defaultdict(list)
+    for row in rows:
+        groups[row.get(group_by)].append(row)
+
+    print(f"{group_by:24} {'runs':>6} {'failed':>6} {'queue p50/p95':>14} {'model p50/p95':>14} {'tools p50/p95':>14} "
+          f"{'total p50/p95':>14} {'prompt tok':>10} {'compl tok':>10}")
+    for key, group in sorted(groups.items(), key=lambda item: -len(item[1])):
+        failed = sum(1 for row in group if row["status"] != "completed")
+        columns = []
+        for phase in ("queue", "model", "tool", "total"):
+            values = [row[f"{phase}_seconds"] for row in group]
+            columns.append(f"{percentile(values, 0.5):6.1f}/{percentile(values, 0.95):<7.1f}")
+        prompt_tokens = sum(row["prompt_tokens"] or 0 for row in group)
+        completion_tokens = sum(row["completion_tokens"] or 0 for row in group)
+        print(f"{str(key)[:24]:24} {len(group):6} {failed:6} {' '.join(f'{c:>14}' for c in columns)} "
+              f"{prompt_tokens:10} {completion_tokens:10}")
+
+    # Prompts using the most tokens, repeated prompts counted together
+    prompts: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        if not row.get("prompt_hash"):
+            continue
+        entry = prompts.setdefault(row["prompt_hash"], {"prompt": row["prompt"], "runs": 0, "tokens": 0})
+        entry["runs"] += 1
+        entry["tokens"] += row["total_tokens"] or 0
+    if prompts:
+        print(f"\nTop {top} prompts by tokens:")
+        for entry in sorted(prompts.values(), key=lambda e: -e["tokens"])[:top]:
+            prompt = " ".join(entry["prompt"].split())[:80]
+            print(f"{entry['tokens']:10} tokens {entry['runs']:5} runs  {prompt}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate the run log: time and tokens per group of runs.")
+    parser.add_argument("--log-dir", default=RUN_LOG_DIR, help="directory of the run log")
+    parser.add_argument("--by", default="model", help="column to group by, e.g. model, agent_id, status, tools")
+    parser.add_argument("--top", type=int, default=10, help="number of prompts to list")
+    args = parser.parse_args()
+
+    rows = read_run_log(args.log_dir)
+    if not rows:
+        print(f"No runs in {args.log_dir}")
+        return
+    report(rows, args.by, args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,59 @@
 import os, sys
-from azure.ai.projects import AIProjectClient
 from azure.ai.projects.models import (
     FileSearchTool,
 )
-from azure.identity import DefaultAzureCredential
 from dotenv import load_dotenv
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.bootstrap import configure_monitoring, create_client
+from common.rate_limiter import RunScheduler
+from common.vector_store_cache import VectorStoreCache
+from common.instrumentation import instrument_agents, setup_local_metrics
+from common.telemetry import configure_telemetry
+from common.run_timeline import RunAnalyzer
+
 load_dotenv()
-project_client = AIProjectClient.from_connection_string(
-    credential=DefaultAzureCredential(), conn_str=os.environ["PROJECT_CONNECTION_STRING"]
-)
+project_client = create_client()
 
 from opentelemetry import trace
-from azure.monitor.opentelemetry import configure_azure_monitor
 
 
-application_insights_connection_string = project_client.telemetry.get_connection_string()
+# Logs go through Azure Monitor, traces through the sampled batch pipeline below
+application_insights_connection_string = configure_monitoring(project_client, disable_metrics=True)
 if not application_insights_connection_string:
-    print("Application Insights was not enabled for this project.")
+    print("Application Insights was not enabled for this project, exporting metrics to the console only.")
     print("Enable it via the 'Tracing' tab in your AI Foundry project page.")
-    exit()
-configure_azure_monitor(connection_string=application_insights_connection_string)
+# Metrics are exported to the console, and to Application Insights when it is enabled
+setup_local_metrics(azure_monitor_connection_string=application_insights_connection_string)
+
+# Spans are exported in the background and sampled: failed and slow runs are always kept, 1% of the others
+telemetry = configure_telemetry(
+    connection_string=application_insights_connection_string,
+    sampling=os.environ.get("TRACE_SAMPLING", "tail"),
+    sample_rate=float(os.environ.get("TRACE_SAMPLE_RATE", "0.01")),
+)
 
 scenario = os.path.basename(__file__)
 tracer = trace.get_tracer(__name__)
 
-project_client.telemetry.enable(destination=sys.stdout)
+project_client.telemetry.enable()
+
+# Child span and latency histogram for every lifecycle call (upload, vector store, agent, thread, run, messages)
+latency = instrument_agents(project_client)
 
 with tracer.start_as_current_span(scenario):
     with project_client:
         try :
             
-            # Upload file and create vector store
+            # Upload file and create vector store, unless the same content was already uploaded and indexed
             # [START upload_file_create_vector_store_and_agent_with_file_search_tool]
-            file = project_client.agents.upload_file_and_poll(file_path="product_info.md", purpose="assistants")
-            print(f"Uploaded file, file ID: {file.id}")
-
-            vector_store = project_client.agents.create_vector_store_and_poll(file_ids=[file.id], name="my_vectorstore")
-            print(f"Created vector store, vector store ID: {vector_store.id}")
+            vector_store_id = VectorStoreCache(project_client).get_or_create_vector_store(
+                ["product_info.md"], name="my_vectorstore"
+            )
+            print(f"Using vector store, vector store ID: {vector_store_id}")
 
             # Create file search tool with resources followed by creating agent
-            file_search = FileSearchTool(vector_store_ids=[vector_store.id])
+            file_search = FileSearchTool(vector_store_ids=[vector_store_id])
 
             agent = project_client.agents.create_agent(
                 model="gpt-4o-mini",
@@ -63,14 +76,23 @@ with tracer.start_as_current_span(scenario):
             )
             print(f"Created message, ID: {message.id}")
 
-            # Create and process assistant run in thread with tools
-            run = project_client.agents.create_and_process_run(thread_id=thread.id, assistant_id=agent.id)
+            # Create and process assistant run in thread with tools, through the scheduler which waits and submits
+            # again when the model is rate limited
+            run = RunScheduler().submit_sync(
+                agent.model,
+                lambda: project_client.agents.create_and_process_run(thread_id=thread.id, assistant_id=agent.id),
+            )
             print(f"Run finished with status: {run.status}")
 
             if run.status == "failed":
                 # Check if you got "Rate limit is exceeded.", then you want to get more quota
                 print(f"Run failed: {run.last_error}")
 
+            # Where the time of the run went (queue, model, file search) and its tokens, also exported as metrics
+            timeline = RunAnalyzer(project_client).analyze(run, prompt="Hello, what Contoso products do you know?")
+            if timeline is not None:
+                timeline.print()
+
             # Get messages from the thread
             messages = project_client.agents.list_messages(thread_id=thread.id)
             print(f"Messages: {messages}")
@@ -82,12 +104,7 @@ with tracer.start_as_current_span(scenario):
             #last_message = messages[-1]
             #print(f"Last message: {last_message.content}")
             # [START teardown]
-            # Delete the file when done
-            project_client.agents.delete_vector_store(vector_store.id)
-            print("Deleted vector store")
-
-            project_client.agents.delete_file(file_id=file.id)
-            print("Deleted file")
+            # The file and vector store are kept, so the next run can reuse them without indexing again
 
             # Delete the agent when done
             project_client.agents.delete_agent(agent.id)
@@ -105,4 +122,7 @@ with tracer.start_as_current_span(scenario):
             raise
         finally :
             #span.end();
+            latency.print()
+            if telemetry["tail_processor"]:
+                print(f"Trace sampling: {telemetry['tail_processor'].stats}")
             print("Program completed")
@@ -1,34 +1,44 @@
 import os, sys, logging
-from azure.ai.projects import AIProjectClient
 from azure.ai.projects.models import (
     FileSearchTool,
 )
-from azure.identity import DefaultAzureCredential
 from dotenv import load_dotenv
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.bootstrap import configure_monitoring, create_client
+from common.rate_limiter import RunScheduler
+from common.telemetry import configure_telemetry
+from common.async_logging import setup_queue_logging
+
 load_dotenv()
-project_client = AIProjectClient.from_connection_string(
-    credential=DefaultAzureCredential(), conn_str=os.environ["PROJECT_CONNECTION_STRING"]
-)
+project_client = create_client()
 
 from opentelemetry import trace
-from azure.monitor.opentelemetry import configure_azure_monitor
+
+# Metrics and logs go through Azure Monitor, traces through a sampled batch pipeline
+application_insights_connection_string = configure_monitoring(project_client)
 
 # Create a logger
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
+# Records go through a queue on the root logger: they are formatted as JSON with trace and span IDs and written on a
+# background thread, and the Azure Monitor handler installed above runs on that thread too
+setup_queue_logging(max_message_chars=int(os.environ.get("LOG_MAX_MESSAGE_CHARS", "4096")))
 
-application_insights_connection_string = project_client.telemetry.get_connection_string()
 if not application_insights_connection_string:
     logger.info("Application Insights was not enabled for this project.")
     logger.info("Enable it via the 'Tracing' tab in your AI Foundry project page.")
     exit()
-configure_azure_monitor(connection_string=application_insights_connection_string)
+configure_telemetry(
+    connection_string=application_insights_connection_string,
+    sampling=os.environ.get("TRACE_SAMPLING", "tail"),
+    sample_rate=float(os.environ.get("TRACE_SAMPLE_RATE", "0.01")),
+)
 
 scenario = os.path.basename(__file__)
 tracer = trace.get_tracer(__name__)
 
-project_client.telemetry.enable(destination=sys.stdout)
+project_client.telemetry.enable()
 
 with tracer.start_as_current_span(scenario):
     with project_client:
@@ -37,10 +47,10 @@ with tracer.start_as_current_span(scenario):
             # Upload file and create vector store
             # [START upload_file_create_vector_store_and_agent_with_file_search_tool]
             file = project_client.agents.upload_file_and_poll(file_path="product_info.md", purpose="assistants")
-            logger.info(f"Uploaded file, file ID: {file.id}")
+            logger.info("Uploaded file, file ID: %s", file.id)
 
             vector_store = project_client.agents.create_vector_store_and_poll(file_ids=[file.id], name="my_vectorstore")
-            logger.info(f"Created vector store, vector store ID: {vector_store.id}")
+            logger.info("Created vector store, vector store ID: %s", vector_store.id)
 
             # Create file search tool with resources followed by creating agent
             file_search = FileSearchTool(vector_store_ids=[vector_store.id])
@@ -54,34 +64,40 @@ with tracer.start_as_current_span(scenario):
             )
             # [END upload_file_create_vector_store_and_agent_with_file_search_tool]
 
-            logger.info(f"Created agent, ID: {agent.id}")
+            logger.info("Created agent, ID: %s", agent.id)
 
             # Create thread for communication
             thread = project_client.agents.create_thread()
-            logger.info(f"Created thread, ID: {thread.id}")
+            logger.info("Created thread, ID: %s", thread.id)
 
             # Create message to thread
             message = project_client.agents.create_message(
                 thread_id=thread.id, role="user", content="Hello, what Contoso products do you know?"
             )
-            logger.info(f"Created message, ID: {message.id}")
+            logger.info("Created message, ID: %s", message.id)
 
-            # Create and process assistant run in thread with tools
-            run = project_client.agents.create_and_process_run(thread_id=thread.id, assistant_id=agent.id)
-            logger.info(f"Run finished with status: {run.status}")
+            # Create and process assistant run in thread with tools, through the scheduler which waits and submits
+            # again when the model is rate limited
+            run = RunScheduler().submit_sync(
+                agent.model,
+                lambda: project_client.agents.create_and_process_run(thread_id=thread.id, assistant_id=agent.id),
+            )
+            logger.info("Run finished with status: %s", run.status)
 
             if run.status == "failed":
                 # Check if you got "Rate limit is exceeded.", then you want to get more quota
-                logger.info(f"Run failed: {run.last_error}")
+                logger.info("Run failed: %s", run.last_error)
 
             # Get messages from the thread
             messages = project_client.agents.list_messages(thread_id=thread.id)
-            logger.info(f"Messages: {messages}")
+            # The full thread history is only rendered at debug level, and then on the logging thread
+            logger.info("Fetched %d messages", len(messages.data))
+            logger.debug("Messages: %s", messages)
 
             # Get the last message from the sender
             last_msg = messages.get_last_text_message_by_sender("assistant")
             if last_msg:
-                logger.info(f"Last Message: {last_msg.text.value}")
+                logger.info("Last Message: %s", last_msg.text.value)
             #last_message = messages[-1]
             #print(f"Last message: {last_message.content}")
             # [START teardown]
@@ -104,7 +120,7 @@ with tracer.start_as_current_span(scenario):
             for citation in messages.file_citation_annotations:
                 logger.info(citation)
         except Exception as e :
-            logger.info(f"An error occurred: {e}")
+            logger.exception("An error occurred: %s", e)
             raise
         finally :
             #span.end();